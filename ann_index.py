@@ -0,0 +1,275 @@
+"""CSC111 Winter 2024 Project 2
+    File containing the AnnIndex class, an approximate nearest neighbour index of the songs of a SongStore.
+"""
+from __future__ import annotations
+from typing import Optional, Sequence
+import doctest
+import time
+import numpy as np
+import python_ta
+from song_store import SongStore
+import song_scoring
+
+
+class AnnIndex:
+    """
+    An inverted file index of the songs in a SongStore. The songs' feature vectors are clustered into num_lists
+    lists by k-means; a query only scores the songs of the probes lists whose centres are nearest to the query
+    song, exactly as recommend_rows (or recommend_rows_weighted, if weighted) would score them.
+
+    More probes find more of the exact result at the cost of scoring more songs: with probes == num_lists the
+    result is exact. recall_report measures the trade-off.
+
+    Songs missing a feature value are not indexed; queries for them are answered by a full scan.
+
+    As with BinIndex, songs changed after the index was built are kept up to date by update: changed rows are
+    masked out of their old list and added to the list with the nearest centre, which is not moved.
+
+    Instance Attributes:
+        - store:
+            The store this index was built from. The index is out of date once the store changes, unless
+            update is called for each changed row.
+        - weighted:
+            Whether songs are ranked by song_scoring.weighted_distances instead of average similarity.
+        - probes:
+            The number of lists searched per query, unless recommend_rows is given another.
+        - centroids:
+            The (num_lists, features) array of list centres, in weighted bin units.
+        - rows:
+            The indexed rows of store, grouped by list.
+        - starts:
+            An array such that the rows in list i are rows[starts[i]:starts[i + 1]].
+
+    Representation Invariants:
+        - 1 <= self.probes
+        - len(self.starts) == len(self.centroids) + 1
+    """
+    store: SongStore
+    weighted: bool
+    probes: int
+    centroids: np.ndarray
+    rows: np.ndarray
+    starts: np.ndarray
+    _bins: np.ndarray
+    _scale: np.ndarray
+    _ranks: np.ndarray
+    _built_rows: int
+    _stale: Optional[np.ndarray]
+    _extra: dict[int, list[int]]
+    _extra_lists: dict[int, int]
+
+    def __init__(self, store: SongStore, num_lists: Optional[int] = None, probes: int = 8, weighted: bool = False,
+                 iterations: int = 10, sample_size: int = 65536, seed: int = 111) -> None:
+        """
+        Build the index of the given store, training the list centres on a random sample of sample_size songs
+        for the given number of k-means iterations. By default there are about 2 * sqrt(len(store)) lists.
+
+        Preconditions:
+            - num_lists is None or num_lists > 0
+            - probes > 0
+        """
+        self.store = store
+        self.weighted = weighted
+        self.probes = probes
+        self._scale = _column_scale(store, weighted)
+
+        bins = store.bins
+        valid = np.flatnonzero(~(bins == store.missing).any(axis=1))
+        if num_lists is None:
+            num_lists = max(1, int(2 * np.sqrt(len(valid))))
+        num_lists = max(1, min(num_lists, len(valid)))
+
+        rng = np.random.default_rng(seed)
+        sample = valid if len(valid) <= sample_size else rng.choice(valid, sample_size, replace=False)
+        vectors = bins[sample] * self._scale
+        if len(vectors) == 0:
+            vectors = np.zeros((1, bins.shape[1]), dtype=np.float32)
+        centroids = vectors[rng.choice(len(vectors), num_lists, replace=False)]
+        for _ in range(iterations):
+            labels = _nearest(vectors, centroids)
+            sums = np.zeros_like(centroids, dtype=np.float64)
+            np.add.at(sums, labels, vectors)
+            counts = np.bincount(labels, minlength=len(centroids))
+            # Lists left empty keep their old centre.
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, np.newaxis]
+
+        labels = np.concatenate([_nearest(bins[valid[i:i + 8192]] * self._scale, centroids)
+                                 for i in range(0, len(valid), 8192)] or [np.zeros(0, dtype=np.intp)])
+        self._set_lists(centroids, valid[np.argsort(labels, kind='stable')],
+                        np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=len(centroids))))))
+
+    @classmethod
+    def from_arrays(cls, store: SongStore, centroids: np.ndarray, rows: np.ndarray, starts: np.ndarray,
+                    probes: int, weighted: bool) -> AnnIndex:
+        """
+        Return the index of store with the given lists, as saved from an index of the same store.
+        """
+        index = cls.__new__(cls)
+        index.store = store
+        index.weighted = weighted
+        index.probes = probes
+        index._scale = _column_scale(store, weighted)
+        index._set_lists(centroids, rows, starts)
+        return index
+
+    def update(self, row: int, old_bins: Optional[np.ndarray]) -> None:
+        """
+        Bring this index up to date after the song in the given row was added (old_bins is None), changed or
+        removed from the store, where old_bins are the bins it had before.
+        """
+        found = self._extra_lists.pop(row, None)
+        if found is not None:
+            self._extra[found].remove(row)
+        elif row < self._built_rows and old_bins is not None and not (old_bins == self.store.missing).any():
+            if self._stale is None:
+                self._stale = np.zeros(self._built_rows, dtype=bool)
+            self._stale[row] = True
+
+        bins = self.store.bins[row]
+        if not (bins == self.store.missing).any():
+            found = int(_nearest(bins[np.newaxis] * self._scale, self.centroids)[0])
+            self._extra.setdefault(found, []).append(row)
+            self._extra_lists[row] = found
+
+    def merge_changes(self) -> None:
+        """
+        Fold every change passed to update into the lists, keeping the list centres.
+        """
+        if self._stale is None and not self._extra_lists:
+            return
+        labels = np.repeat(np.arange(len(self.centroids)), np.diff(self.starts))
+        keep = ~self._stale[self.rows] if self._stale is not None else np.ones(len(self.rows), dtype=bool)
+        rows = np.concatenate((self.rows[keep], np.fromiter(self._extra_lists, dtype=self.rows.dtype)))
+        labels = np.concatenate((labels[keep], np.fromiter(self._extra_lists.values(), dtype=labels.dtype)))
+        order = np.argsort(labels, kind='stable')
+        self._set_lists(self.centroids, rows[order],
+                        np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=len(self.centroids))))))
+
+    def recommend_rows(self, row: int, limit: int, probes: Optional[int] = None,
+                       allowed: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Return approximately the rows song_scoring.recommend_rows (or recommend_rows_weighted) returns, in the
+        same order and with the same allowed rows, by scoring only the songs in the probes lists nearest to the
+        song in the given row.
+
+        >>> store = SongStore()
+        >>> for i, values in enumerate([[0.1, 0.2, 0.3], [0.9, 0.9, 0.9], [0.1, 0.2, 0.31], [0.85, 0.9, 0.9]]):
+        ...     _ = store.add_row(str(i), f'Song {i}', values)
+        >>> index = AnnIndex(store, num_lists=2, probes=1)
+        >>> index.recommend_rows(0, 1).tolist(), index.recommend_rows(1, 1).tolist()
+        ([0, 2], [1, 3])
+        """
+        query = self.store.bins[row]
+        if (query == self.store.missing).any():
+            return self.exact_rows(row, limit, allowed)
+
+        probes = min(probes or self.probes, len(self.centroids))
+        lists = np.argpartition(np.abs(self.centroids - query * self._scale).sum(axis=1), probes - 1)[:probes]
+        positions = np.concatenate([np.arange(self.starts[i], self.starts[i + 1]) for i in lists])
+        rows, bins = self.rows[positions], self._bins[positions]
+        if self._stale is not None or self._extra_lists:
+            rows, bins = self._with_changes(rows, bins, lists)
+        if allowed is not None:
+            rows, bins = rows[allowed[rows]], bins[allowed[rows]]
+        differences = np.abs(bins.astype(np.int32) - query.astype(np.int32))
+        if self.weighted:
+            keys = differences @ np.asarray(self.store.weights, dtype=np.float64)
+        else:
+            keys = self._ranks[differences.sum(axis=1)]
+        return rows[np.lexsort((rows, keys))][:limit + 1]
+
+    def exact_rows(self, row: int, limit: int, allowed: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Return the exact result recommend_rows approximates.
+        """
+        if self.weighted:
+            return song_scoring.recommend_rows_weighted(self.store, row, limit, allowed)
+        return song_scoring.recommend_rows(self.store, row, limit, allowed)
+
+    def _with_changes(self, rows: np.ndarray, bins: np.ndarray,
+                      lists: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the given rows of the given lists and their bins, without the rows changed since this index was
+        built, and with their new rows in those lists.
+        """
+        if self._stale is not None:
+            keep = ~self._stale[rows]
+            rows, bins = rows[keep], bins[keep]
+        extra = [row for i in lists.tolist() for row in self._extra.get(i, ())]
+        if extra:
+            extra = np.array(extra, dtype=rows.dtype)
+            rows, bins = np.concatenate((rows, extra)), np.concatenate((bins, self.store.bins[extra]))
+        return rows, bins
+
+    def _set_lists(self, centroids: np.ndarray, rows: np.ndarray, starts: np.ndarray) -> None:
+        """
+        Use the given lists, keeping a copy of the bins of their rows in list order so each list is read from
+        one contiguous block.
+        """
+        self.centroids = centroids
+        self.rows = rows
+        self.starts = starts
+        self._bins = self.store.bins[rows]
+        self._ranks = song_scoring.score_ranks(len(self.store.feature_types), self.store.resolution)
+        self._built_rows = len(self.store)
+        self._stale = None
+        self._extra = {}
+        self._extra_lists = {}
+
+
+def recall_report(index: AnnIndex, rows: Sequence[int], limit: int,
+                  probes: Sequence[int] = (1, 2, 4, 8, 16, 32)) -> list[dict[str, float]]:
+    """
+    Return, for each number of probes, the recall@k of index (the fraction of the exact limit + 1 results it
+    also returns, averaged over the query rows) and its mean query time in milliseconds. The first entry is
+    the exact scan itself, with probes 0.
+
+    >>> store = SongStore()
+    >>> for i in range(200):
+    ...     _ = store.add_row(str(i), f'Song {i}', [(i * 37 % 101) / 100, (i * 53 % 101) / 100, (i % 101) / 100])
+    >>> report = recall_report(AnnIndex(store, num_lists=8), range(0, 200, 20), 5, probes=[8])
+    >>> report[1]['probes'], report[1]['recall']
+    (8, 1.0)
+    """
+    start = time.perf_counter()
+    exact = [set(index.exact_rows(row, limit).tolist()) for row in rows]
+    report = [{'probes': 0, 'recall': 1.0, 'ms_per_query': (time.perf_counter() - start) / len(rows) * 1000}]
+    for count in probes:
+        start = time.perf_counter()
+        found = [index.recommend_rows(row, limit, count) for row in rows]
+        elapsed = time.perf_counter() - start
+        recall = np.mean([len(expected.intersection(result.tolist())) / max(len(expected), 1)
+                          for expected, result in zip(exact, found)])
+        report.append({'probes': count, 'recall': float(recall), 'ms_per_query': elapsed / len(rows) * 1000})
+    return report
+
+
+def _column_scale(store: SongStore, weighted: bool) -> np.ndarray:
+    """
+    Return the factor each feature bin is multiplied by before clustering.
+    """
+    weights = store.weights if weighted else (1.0,) * len(store.feature_types)
+    return np.asarray(weights, dtype=np.float32)
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    Return the index of the centroid nearest (by Euclidean distance) to each vector.
+
+    >>> _nearest(np.array([[0.0, 0.0], [9.0, 9.0]]), np.array([[10.0, 10.0], [1.0, 1.0]])).tolist()
+    [1, 0]
+    """
+    distances = (centroids * centroids).sum(axis=1) - 2 * vectors @ centroids.T
+    return np.argmin(distances, axis=1)
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'time', 'numpy', 'song_store', 'song_scoring'],
+        # the names (strs) of imported modules
+        'allowed-io': [],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 120
+    })
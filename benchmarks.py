@@ -0,0 +1,293 @@
+"""CSC111 Winter 2024 Project 2
+    File containing functions to measure the performance of loading and querying the graph.
+
+    The benchmark suite builds synthetic catalogues of SUITE_SIZES songs, measures each one in a new Python
+    process (so peak memory is that of the catalogue alone) and writes the results to a JSON file:
+
+        python benchmarks.py run --output results.json
+        python benchmarks.py compare baseline.json results.json
+
+    compare exits with status 1 if any measurement got worse by more than the threshold.
+"""
+from __future__ import annotations
+from typing import Any, Callable, Optional, Sequence
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import python_ta
+import graph_classes
+import graph_loaders
+
+# The catalogue sizes the suite measures by default.
+SUITE_SIZES = (10_000, 100_000, 1_200_000)
+
+# The recommendation limits the suite measures, as offered by the GUI.
+SUITE_LIMITS = (5, 10, 20)
+
+# The smallest increase of each kind of measurement compare_results counts as a regression, whatever the
+# threshold, since smaller ones are mostly noise.
+NOISE_FLOORS = {'ms': 0.05, 'blocks': 1000, 'peak_rss_kb': 4096}
+
+FEATURE_HEADER = ['id', 'name', 'danceability', 'energy', 'valence']
+
+
+def write_synthetic_csv(path: str, num_songs: int, seed: int = 111) -> None:
+    """
+    Write a CSV file of num_songs random songs in the format load_graph expects.
+
+    About one in twenty songs reuses the name of an earlier song, like re-releases in the real dataset.
+    """
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(FEATURE_HEADER)
+        for i in range(num_songs):
+            name = f'Song {rng.randrange(i)}' if i > 0 and rng.random() < 0.05 else f'Song {i}'
+            writer.writerow([f'{i:022d}', name] + [repr(round(rng.random(), 4)) for _ in range(3)])
+
+
+def measure_peak_rss(information_file: str, compact: bool) -> int:
+    """
+    Return the peak resident set size, in kilobytes, of a new Python process that loads information_file
+    with graph_loaders.load_graph.
+    """
+    code = ('import resource, graph_loaders\n'
+            f'graph = graph_loaders.load_graph({information_file!r}, compact={compact!r})\n'
+            'print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n')
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return int(result.stdout.split()[-1])
+
+
+def compare_load_memory(information_file: str) -> dict[str, int]:
+    """
+    Return the peak RSS in kilobytes of loading information_file as an object graph and as a compact graph.
+    """
+    return {'object': measure_peak_rss(information_file, False),
+            'compact': measure_peak_rss(information_file, True)}
+
+
+def measure_batch_throughput(graph: graph_classes.Graph, song_names: list[str], limit: int,
+                             block_size: int = 8, workers: int = 1) -> float:
+    """
+    Return the number of seed songs per second graph.recommend_songs_batch handles for song_names.
+    """
+    start = time.perf_counter()
+    graph.recommend_songs_batch(song_names, limit, block_size, workers)
+    return len(song_names) / (time.perf_counter() - start)
+
+
+def measure_get_value_of_type(number: int = 1000000) -> float:
+    """
+    Return the average time in nanoseconds of a SongVertex.get_value_of_type call on a song with three values.
+    """
+    song = graph_classes.SongVertex('1010001')
+    song.neighbours = {graph_classes.ValueVertex('danceability', 0.78), graph_classes.ValueVertex('energy', 0.58),
+                       graph_classes.ValueVertex('valence', 0.66)}
+    return timeit.timeit(lambda: song.get_value_of_type('energy'), number=number) / number * 1e9
+
+
+def measure_value_vertex_by_distance(graph: graph_classes.Graph, distances: range = range(0, 101, 10),
+                                     walk_limit: int = 12, number: int = 100) -> dict[str, dict[int, float]]:
+    """
+    Return the average time in microseconds of graph.value_vertex_by_distance from the energy 0.50 vertex
+    for each distance, as 'table', and of walking the value edges instead (the old implementation) for the
+    distances up to walk_limit, as 'walk'. Walking takes time exponential in the distance.
+    """
+    vertex = graph.get_value_vertex('energy', 0.5)
+    results = {'table': {}, 'walk': {}}
+    for distance in distances:
+        results['table'][distance] = timeit.timeit(lambda: graph.value_vertex_by_distance(vertex, distance),
+                                                   number=number) / number * 1e6
+
+    # A graph whose table is irregular walks its value edges.
+    irregular, graph.value_bins.irregular = graph.value_bins.irregular, True
+    for distance in distances:
+        if distance <= walk_limit:
+            results['walk'][distance] = timeit.timeit(lambda: graph.value_vertex_by_distance(vertex, distance),
+                                                      number=1) * 1e6
+    graph.value_bins.irregular = irregular
+    return results
+
+
+def benchmark_catalogue(information_file: str, compact: bool = False, queries: int = 5,
+                        seed: int = 111) -> dict[str, Any]:
+    """
+    Return the measurements of the suite for the catalogue information_file, loaded as a compact or object graph:
+    the time of load_graph and of each query, with the change in allocated memory blocks (sys.getallocatedblocks)
+    each left behind, and the peak resident set size of this process.
+
+    Queries use the same queries seed songs, picked with seed, for every run and method; the recommendation
+    cache is left off. Times are medians over the seed songs, in milliseconds.
+    """
+    results = {'songs': 0, 'compact': compact}
+    graph, results['load_graph'] = _measure(lambda: graph_loaders.load_graph(information_file, compact=compact))
+    results['songs'] = len(graph.song_ids)
+    rng = random.Random(seed)
+    names = rng.sample(sorted(graph.song_names), min(queries, len(graph.song_names)))
+    ids = [graph.get_song_by_name(name) for name in names]
+
+    for limit in SUITE_LIMITS:
+        for method in ('scan', 'index'):
+            results[f'recommend_songs_{method}_{limit}'] = _measure_each(
+                lambda name, m=method, k=limit: graph.recommend_songs(name, k, m), names)
+    results['average_similarity'] = _measure_each(lambda pair: graph.average_similarity(*pair),
+                                                  list(zip(ids, ids[1:] + ids[:1])))
+    vertex = graph.get_value_vertex('energy', 0.5)
+    for distance in (1, 10, 50):
+        results[f'value_vertex_by_distance_{distance}'] = _measure_each(
+            lambda d: graph.value_vertex_by_distance(vertex, d), [distance] * queries)
+    recommended = {name: graph.recommend_songs(name, max(SUITE_LIMITS), 'index') for name in names}
+    results['load_visualization_graph_20'] = _measure_each(
+        lambda name: graph_loaders.load_visualization_graph(graph, recommended[name], name), names)
+    _, results['get_edges'] = _measure(graph.get_edges)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results['peak_rss_kb'] = peak // 1024 if sys.platform == 'darwin' else peak
+    return results
+
+
+def run_suite(sizes: Sequence[int] = SUITE_SIZES, modes: Sequence[str] = ('object', 'compact'),
+              directory: str = '.', queries: int = 5) -> dict[str, Any]:
+    """
+    Return the results of benchmark_catalogue for a synthetic catalogue of each of sizes, loaded in each of modes
+    ('object' or 'compact'), each measured in a new Python process. Catalogues are written to directory as
+    synthetic_<size>.csv, unless they are already there.
+    """
+    results = {'python': platform.python_version(), 'platform': platform.platform(), 'runs': {}}
+    for size in sizes:
+        path = os.path.join(directory, f'synthetic_{size}.csv')
+        if not os.path.exists(path):
+            write_synthetic_csv(path, size)
+        for mode in modes:
+            code = ('import json, benchmarks\n'
+                    f'results = benchmarks.benchmark_catalogue({path!r}, {mode == "compact"!r}, {queries!r})\n'
+                    'print(json.dumps(results))\n')
+            output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+            results['runs'][f'{mode}_{size}'] = json.loads(output.stdout.splitlines()[-1])
+    return results
+
+
+def compare_results(baseline: dict[str, Any], current: dict[str, Any],
+                    threshold: float = 0.2) -> list[dict[str, Any]]:
+    """
+    Return each measurement that is in both suite results and is more than threshold (as a fraction), and more
+    than its NOISE_FLOORS entry, worse in current than in baseline. Every measurement is better lower.
+
+    >>> old = {'runs': {'compact_10': {'load_graph': {'ms': 100.0, 'blocks': 10}, 'peak_rss_kb': 1000}}}
+    >>> new = {'runs': {'compact_10': {'load_graph': {'ms': 130.0, 'blocks': 10}, 'peak_rss_kb': 1100}}}
+    >>> compare_results(old, new)
+    [{'measurement': 'compact_10.load_graph.ms', 'baseline': 100.0, 'current': 130.0, 'change': 0.3}]
+    """
+    old, new = _flatten(baseline.get('runs', {})), _flatten(current.get('runs', {}))
+    regressions = []
+    for key, value in new.items():
+        floor = NOISE_FLOORS.get(key.rsplit('.', 1)[-1], 0)
+        if key in old and old[key] > 0 and value > old[key] * (1 + threshold) and value - old[key] > floor:
+            regressions.append({'measurement': key, 'baseline': old[key], 'current': value,
+                                'change': round(value / old[key] - 1, 4)})
+    return regressions
+
+
+def _measure(function: Callable[[], Any]) -> tuple[Any, dict[str, float]]:
+    """
+    Call function once and return its result, with how long it took in milliseconds and how many more memory
+    blocks were allocated after it than before.
+    """
+    blocks = sys.getallocatedblocks()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    return result, {'ms': elapsed * 1000, 'blocks': sys.getallocatedblocks() - blocks}
+
+
+def _measure_each(function: Callable[[Any], Any], arguments: list) -> dict[str, float]:
+    """
+    Call function with each of arguments and return the median time of a call in milliseconds, and how many more
+    memory blocks were allocated after all the calls than before.
+    """
+    blocks = sys.getallocatedblocks()
+    times = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        times.append(time.perf_counter() - start)
+    return {'ms': statistics.median(times) * 1000, 'blocks': sys.getallocatedblocks() - blocks}
+
+
+def _flatten(results: dict[str, Any], prefix: str = '') -> dict[str, float]:
+    """
+    Return the numbers nested in results, keyed by their path of keys joined by dots. Booleans are left out.
+
+    >>> _flatten({'a': {'b': 1, 'c': True}, 'd': 2.5})
+    {'a.b': 1, 'd': 2.5}
+    """
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def main(arguments: Optional[list[str]] = None) -> int:
+    """
+    Run the command line interface described at the top of this file and return its exit status.
+    """
+    parser = argparse.ArgumentParser(description='Measure the performance of the song graph.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='run the benchmark suite and write its results')
+    run.add_argument('--sizes', type=int, nargs='+', default=list(SUITE_SIZES))
+    run.add_argument('--modes', nargs='+', choices=['object', 'compact'], default=['object', 'compact'])
+    run.add_argument('--queries', type=int, default=5)
+    run.add_argument('--directory', default='.', help='where the synthetic catalogues are kept')
+    run.add_argument('--output', default='benchmark_results.json')
+    compare = commands.add_parser('compare', help='list the regressions between two results files')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=0.2)
+    memory = commands.add_parser('memory', help='compare the peak memory of loading a CSV file in each mode')
+    memory.add_argument('information_file')
+    options = parser.parse_args(arguments)
+
+    if options.command == 'run':
+        results = run_suite(options.sizes, options.modes, options.directory, options.queries)
+        with open(options.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        print(f'Wrote {options.output}')
+        return 0
+    if options.command == 'compare':
+        with open(options.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        with open(options.current, encoding='utf-8') as file:
+            current = json.load(file)
+        regressions = compare_results(baseline, current, options.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['measurement']}: {regression['baseline']:.4g} -> "
+                  f"{regression['current']:.4g} (+{regression['change']:.0%})")
+        print(f'{len(regressions)} regression(s) over {options.threshold:.0%}')
+        return 1 if regressions else 0
+    print(compare_load_memory(options.information_file))
+    return 0
+
+
+if __name__ == '__main__':
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'argparse', 'csv', 'json', 'os', 'platform', 'random', 'resource',
+                          'statistics', 'subprocess', 'sys', 'time', 'timeit', 'graph_classes', 'graph_loaders'],
+        'allowed-io': ['write_synthetic_csv', 'main'],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 120
+    })
+
+    sys.exit(main())
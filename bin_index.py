@@ -0,0 +1,285 @@
+"""CSC111 Winter 2024 Project 2
+    File containing the BinIndex class, an index of the songs of a SongStore by the value vertices they connect to.
+"""
+from __future__ import annotations
+from typing import Optional
+import doctest
+import numpy as np
+import python_ta
+from song_store import SongStore
+import song_scoring
+
+# The smallest fraction of songs a filter may allow for recommend_rows to search the index rather than scan: the
+# fewer songs are allowed, the farther the search must go to find enough of them.
+MIN_ALLOWED_FRACTION = 0.5
+
+# The most cells (distinct tuples of bins) an index is built for. Stores with more features or finer bins, e.g.
+# those of feature_schema.FULL_DATASET_SCHEMA, are scanned instead.
+MAX_CELLS = 1 << 24
+
+
+class BinIndex:
+    """
+    An index of the songs in a SongStore by their cell: the tuple of the bins (value vertices) of all of their
+    features. The rows of each cell are kept together, in the order they were added, so all songs at a given
+    L1 bin distance from a query song can be found without looking at any other song.
+
+    Songs missing a feature value are not indexed.
+
+    Songs changed after the index was built are kept up to date by update, without rebuilding: changed rows
+    are masked out of rows and the new ones kept in a small table of extra rows per cell.
+
+    Instance Attributes:
+        - store:
+            The store this index was built from. The index is out of date once the store changes, unless
+            update is called for each changed row.
+        - rows:
+            The indexed rows of store, grouped by cell in increasing cell id order.
+        - starts:
+            An array such that the rows in cell c are rows[starts[c]:starts[c + 1]].
+    """
+    store: SongStore
+    rows: np.ndarray
+    starts: np.ndarray
+    _strides: np.ndarray
+    _shells: dict[int, np.ndarray]
+    _built_rows: int
+    _stale: Optional[np.ndarray]
+    _extra: dict[int, list[int]]
+    _extra_cells: dict[int, int]
+    _has_extra: Optional[np.ndarray]
+
+    def __init__(self, store: SongStore) -> None:
+        """
+        Build the index of the given store. Raise ValueError if it has too many cells to index.
+        """
+        if not BinIndex.supports(store):
+            raise ValueError(f'a store of {len(store.feature_types)} features in {store.resolution} steps '
+                             f'has more than {MAX_CELLS} cells')
+        self.store = store
+        num_columns = len(store.feature_types)
+        self._strides = (store.resolution + 1) ** np.arange(num_columns - 1, -1, -1, dtype=np.int64)
+        self._shells = {}
+        self.merge_changes()
+
+    @classmethod
+    def from_arrays(cls, store: SongStore, rows: np.ndarray, starts: np.ndarray) -> BinIndex:
+        """
+        Return the index of store with the given rows and starts, as saved from an index of the same store.
+        """
+        index = cls.__new__(cls)
+        index.store = store
+        index.rows = rows
+        index.starts = starts
+        index._strides = (store.resolution + 1) ** np.arange(len(store.feature_types) - 1, -1, -1, dtype=np.int64)
+        index._shells = {}
+        index._reset_changes()
+        return index
+
+    @staticmethod
+    def supports(store: SongStore) -> bool:
+        """
+        Return whether store has few enough cells to be indexed.
+
+        >>> BinIndex.supports(SongStore())
+        True
+        >>> BinIndex.supports(SongStore(('danceability', 'energy', 'valence', 'tempo'), 1000))
+        False
+        """
+        return (store.resolution + 1) ** len(store.feature_types) <= MAX_CELLS
+
+    def update(self, row: int, old_bins: Optional[np.ndarray]) -> None:
+        """
+        Bring this index up to date after the song in the given row was added (old_bins is None), changed or
+        removed from the store, where old_bins are the bins it had before.
+
+        >>> store = SongStore()
+        >>> _ = store.add_row('a', 'A', [0.10, 0.20, 0.30])
+        >>> _ = store.add_row('b', 'B', [0.50, 0.50, 0.50])
+        >>> index = BinIndex(store)
+        >>> old_bins = store.bins[1].copy()
+        >>> _ = store.set_row('b', 'B', [11, 20, 30])
+        >>> index.update(1, old_bins)
+        >>> index.rows_at_distance(0, 1).tolist(), index.rows_at_distance(0, 120).tolist()
+        ([1], [])
+        """
+        cell = self._extra_cells.pop(row, None)
+        if cell is not None:
+            self._extra[cell].remove(row)
+            if not self._extra[cell]:
+                del self._extra[cell]
+                self._has_extra[cell] = False
+        elif row < self._built_rows and old_bins is not None and not (old_bins == self.store.missing).any():
+            if self._stale is None:
+                self._stale = np.zeros(self._built_rows, dtype=bool)
+            self._stale[row] = True
+
+        bins = self.store.bins[row]
+        if not (bins == self.store.missing).any():
+            cell = int(bins.astype(np.int64) @ self._strides)
+            self._extra.setdefault(cell, []).append(row)
+            self._extra_cells[row] = cell
+            if self._has_extra is None:
+                self._has_extra = np.zeros(len(self.starts) - 1, dtype=bool)
+            self._has_extra[cell] = True
+
+    def merge_changes(self) -> None:
+        """
+        Rebuild rows and starts from the store as it is now, folding in every change passed to update.
+        """
+        bins = self.store.bins
+        valid = np.flatnonzero(~(bins == self.store.missing).any(axis=1))
+        cells = bins[valid].astype(np.int64) @ self._strides
+        self.rows = valid[np.argsort(cells, kind='stable')]
+        counts = np.bincount(cells, minlength=(self.store.resolution + 1) ** len(self.store.feature_types))
+        self.starts = np.concatenate(([0], np.cumsum(counts)))
+        self._reset_changes()
+
+    def rows_at_distance(self, row: int, distance: int) -> np.ndarray:
+        """
+        Return the indexed rows whose bins are exactly distance away (summed over all features) from the bins
+        of the given row.
+
+        >>> store = SongStore()
+        >>> _ = store.add_row('a', 'A', [0.10, 0.20, 0.30])
+        >>> _ = store.add_row('b', 'B', [0.11, 0.20, 0.30])
+        >>> _ = store.add_row('c', 'C', [0.10, 0.21, 0.31])
+        >>> BinIndex(store).rows_at_distance(0, 2).tolist()
+        [2]
+        """
+        coordinates = self.store.bins[row].astype(np.int64) + self._shell(distance)
+        in_range = ((coordinates >= 0) & (coordinates <= self.store.resolution)).all(axis=1)
+        cells = coordinates[in_range] @ self._strides
+        starts, lengths = self.starts[cells], self.starts[cells + 1] - self.starts[cells]
+        total = int(lengths.sum())
+        if total == 0:
+            rows = np.zeros(0, dtype=self.rows.dtype)
+        else:
+            # Position p of the result is in cell j; it maps to starts[j] + (p - rows before cell j).
+            rows = self.rows[np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)]
+        if self._stale is not None or self._extra:
+            rows = self._with_changes(rows, cells)
+        return rows
+
+    def recommend_rows(self, row: int, limit: int, allowed: Optional[np.ndarray] = None,
+                       order: str = 'legacy') -> np.ndarray:
+        """
+        Return the same rows as song_scoring.recommend_rows_ordered (with the same allowed rows and order), by
+        searching outwards from the cell of the given row in increasing distance and stopping once no farther
+        song can make it into the result. If less than MIN_ALLOWED_FRACTION of the songs are allowed, or the
+        search has looked at more cells than there are songs without finding enough of them, the store is
+        scanned instead.
+
+        >>> store = SongStore()
+        >>> _ = store.add_row('a', 'A', [0.10, 0.20, 0.30])
+        >>> _ = store.add_row('b', 'B', [0.50, 0.50, 0.50])
+        >>> _ = store.add_row('c', 'C', [0.11, 0.20, 0.30])
+        >>> BinIndex(store).recommend_rows(0, 1).tolist()
+        [0, 2]
+        >>> BinIndex(store).recommend_rows(0, 1, np.array([False, True, True])).tolist()
+        [2, 1]
+        """
+        if (self.store.bins[row] == self.store.missing).any() or (
+                allowed is not None and np.count_nonzero(allowed) < MIN_ALLOWED_FRACTION * len(allowed)):
+            return song_scoring.recommend_rows_ordered(self.store, row, limit, allowed, order)
+
+        num_columns = len(self.store.feature_types)
+        columns = list(range(num_columns))
+        # ranks[d] is the key of the songs d bins away: the rank of their score in the legacy order, or d.
+        if order == 'legacy':
+            ranks = song_scoring.score_ranks(num_columns, self.store.resolution)
+        else:
+            ranks = np.arange(num_columns * self.store.resolution + 1)
+        found_rows, found_keys = [], []
+        count = 0
+        cells = 0
+        last_distance = len(ranks) - 1
+        for distance in range(len(ranks)):
+            if distance > last_distance:
+                break
+            if count <= limit and cells > len(self.store):
+                return song_scoring.recommend_rows_ordered(self.store, row, limit, allowed, order)
+            cells += len(self._shell(distance))
+            rows = self.rows_at_distance(row, distance)
+            if allowed is not None:
+                rows = rows[allowed[rows]]
+            found_rows.append(rows)
+            found_keys.append(np.full(len(rows), ranks[distance]))
+            count += len(rows)
+            if count <= limit:
+                continue
+            if order == 'exact':
+                # Each value is within half a bin of its bin, so a song's bin distance is within one bin per
+                # column of its unrounded distance: no song farther than this is closer than the limit + 1st
+                # closest found so far.
+                raw = song_scoring.raw_distances(self.store, row, columns, np.concatenate(found_rows))
+                bound = np.partition(raw, limit)[limit] * self.store.resolution + num_columns + 1e-3
+                last_distance = min(last_distance, int(bound))
+            elif last_distance == len(ranks) - 1:
+                # Keys never decrease with distance, so once limit + 1 songs are found, only songs tied with the
+                # last of them can still get in (ahead of it, if they were added earlier).
+                last_distance = int(np.searchsorted(ranks, ranks[distance], side='right')) - 1
+
+        rows, keys = np.concatenate(found_rows), np.concatenate(found_keys)
+        if order == 'legacy':
+            return rows[np.lexsort((rows, keys))][:limit + 1]
+        if order == 'exact':
+            keys = np.zeros(len(rows), dtype=keys.dtype)
+        return song_scoring.order_rows(self.store, row, rows, keys, columns)[:limit + 1]
+
+    def _with_changes(self, rows: np.ndarray, cells: np.ndarray) -> np.ndarray:
+        """
+        Return the given rows of the given cells without the rows changed since this index was built, and with
+        their new rows in those cells.
+        """
+        if self._stale is not None:
+            rows = rows[~self._stale[rows]]
+        if self._extra:
+            found = [self._extra[cell] for cell in cells[self._has_extra[cells]].tolist()]
+            if found:
+                rows = np.concatenate([rows] + [np.array(extra, dtype=rows.dtype) for extra in found])
+        return rows
+
+    def _reset_changes(self) -> None:
+        """
+        Record that this index matches its store as it is now.
+        """
+        self._built_rows = len(self.store)
+        self._stale = None
+        self._extra = {}
+        self._extra_cells = {}
+        self._has_extra = None
+
+    def _shell(self, distance: int) -> np.ndarray:
+        """
+        Return an array of every integer offset vector (one entry per feature) with L1 norm distance.
+        """
+        if distance not in self._shells:
+            self._shells[distance] = _offsets(len(self.store.feature_types), distance)
+        return self._shells[distance]
+
+
+def _offsets(num_columns: int, distance: int) -> np.ndarray:
+    """
+    Return an array of every integer vector of length num_columns with L1 norm distance.
+
+    >>> _offsets(2, 1).tolist()
+    [[-1, 0], [0, -1], [0, 1], [1, 0]]
+    """
+    if num_columns == 1:
+        return np.array([[-distance], [distance]] if distance > 0 else [[0]], dtype=np.int64)
+    parts = []
+    for first in range(-distance, distance + 1):
+        rest = _offsets(num_columns - 1, distance - abs(first))
+        parts.append(np.hstack((np.full((len(rest), 1), first, dtype=np.int64), rest)))
+    return np.concatenate(parts)
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'numpy', 'song_store', 'song_scoring'],  # the names (strs) of imported modules
+        'allowed-io': [],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 120
+    })
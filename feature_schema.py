@@ -0,0 +1,163 @@
+"""CSC111 Winter 2024 Project 2
+    File containing the Feature and FeatureSchema classes, which declare the song features a graph is built from.
+"""
+from __future__ import annotations
+from typing import Sequence
+import doctest
+import numpy as np
+import python_ta
+from song_store import SongStore
+
+
+class Feature:
+    """
+    A feature of songs, e.g. energy, that the graph stores and compares.
+
+    Instance Attributes:
+        - name:
+            The name of the feature, also the type of its value vertices.
+        - column:
+            The CSV column holding the feature, as an index or a header name.
+        - low:
+            The raw value mapped to 0.
+        - high:
+            The raw value mapped to 1.
+        - weight:
+            How much a difference in this feature counts in weighted similarity.
+        - clip:
+            Whether raw values outside [low, high] are clipped to it, rather than rejected.
+
+    Representation Invariants:
+        - self.low < self.high
+        - self.weight >= 0
+    """
+    name: str
+    column: int | str
+    low: float
+    high: float
+    weight: float
+    clip: bool
+
+    def __init__(self, name: str, column: int | str, low: float = 0.0, high: float = 1.0, weight: float = 1.0,
+                 clip: bool = False) -> None:
+        """
+        Initialize a new feature.
+        """
+        self.name = name
+        self.column = column
+        self.low = low
+        self.high = high
+        self.weight = weight
+        self.clip = clip
+
+    def normalise(self, values: np.ndarray) -> np.ndarray:
+        """
+        Return the raw values mapped linearly from [low, high] to [0, 1]. Features with the default range of
+        [0, 1] are returned as is, so they are binned exactly as load_graph always has.
+
+        >>> Feature('loudness', 'loudness', -60.0, 0.0, clip=True).normalise(np.array([-70.0, -15.0])).tolist()
+        [0.0, 0.75]
+        """
+        if self.low != 0.0 or self.high != 1.0:
+            values = (values - self.low) / (self.high - self.low)
+        return np.clip(values, 0.0, 1.0) if self.clip else values
+
+
+class FeatureSchema:
+    """
+    The features a graph is built from, and how finely their values are binned. A schema drives the loaders
+    (which columns to read and how to normalise them), the SongStore (which features it holds, in what
+    resolution) and the weighted scorer (song_scoring.recommend_rows_weighted).
+
+    Instance Attributes:
+        - features:
+            The features, in the column order of the store.
+        - resolution:
+            The number of bins per unit of normalised value, e.g. 1000 for steps of 0.001.
+
+    Representation Invariants:
+        - len({feature.name for feature in self.features}) == len(self.features)
+        - 0 < self.resolution < 65535
+    """
+    features: tuple[Feature, ...]
+    resolution: int
+
+    def __init__(self, features: Sequence[Feature], resolution: int = 100) -> None:
+        """
+        Initialize a new schema of the given features.
+        """
+        self.features = tuple(features)
+        self.resolution = resolution
+
+    def names(self) -> tuple[str, ...]:
+        """
+        Return the names of the features of this schema.
+
+        >>> LEGACY_SCHEMA.names()
+        ('danceability', 'energy', 'valence')
+        """
+        return tuple(feature.name for feature in self.features)
+
+    def columns(self) -> list[int | str]:
+        """
+        Return the CSV columns of the features of this schema.
+        """
+        return [feature.column for feature in self.features]
+
+    def weights(self) -> tuple[float, ...]:
+        """
+        Return the weights of the features of this schema.
+        """
+        return tuple(feature.weight for feature in self.features)
+
+    def new_store(self, capacity: int = 1024) -> SongStore:
+        """
+        Return an empty SongStore for the features of this schema.
+
+        >>> store = FULL_DATASET_SCHEMA.new_store()
+        >>> len(store.feature_types), store.resolution, store.bins.dtype
+        (9, 1000, dtype('uint16'))
+        """
+        return SongStore(self.names(), self.resolution, capacity, self.weights())
+
+    def matches(self, store: SongStore) -> bool:
+        """
+        Return whether store holds the features of this schema, with the same resolution and weights.
+        """
+        return (store.feature_types == self.names() and store.resolution == self.resolution
+                and store.weights == self.weights())
+
+    def normalise(self, values: np.ndarray) -> np.ndarray:
+        """
+        Return the (rows, features) array of raw values with each column normalised by its feature.
+        """
+        if all(feature.low == 0.0 and feature.high == 1.0 and not feature.clip for feature in self.features):
+            return values
+        return np.column_stack([feature.normalise(values[:, i]) for i, feature in enumerate(self.features)])
+
+
+# The three features of the stripped dataset, the way load_graph has always read them.
+LEGACY_SCHEMA = FeatureSchema([Feature('danceability', 2), Feature('energy', 3), Feature('valence', 4)])
+
+# More features of the full dataset, read by header name, in steps of 0.001.
+FULL_DATASET_SCHEMA = FeatureSchema([
+    Feature('danceability', 'danceability'),
+    Feature('energy', 'energy'),
+    Feature('valence', 'valence'),
+    Feature('acousticness', 'acousticness', weight=0.5),
+    Feature('instrumentalness', 'instrumentalness', weight=0.5),
+    Feature('speechiness', 'speechiness', weight=0.5),
+    Feature('liveness', 'liveness', weight=0.25),
+    Feature('loudness', 'loudness', -60.0, 0.0, weight=0.5, clip=True),
+    Feature('tempo', 'tempo', 0.0, 250.0, weight=0.5, clip=True)
+], resolution=1000)
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'numpy', 'song_store'],  # the names (strs) of imported modules
+        'allowed-io': [],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 120
+    })
@@ -2,9 +2,20 @@
     File containing Vertex class and subclasses, as well as Graph Class
 """
 from __future__ import annotations
-from typing import Any
+from typing import Any, Iterator, Mapping, Optional
 import doctest
+import gc
+import numpy as np
 import python_ta
+from song_store import SongStore
+import instrumentation
+import song_scoring
+from bin_index import BinIndex
+from ann_index import AnnIndex
+from recommendation_cache import RecommendationCache
+from recommendation_filter import RecommendationFilter
+from song_search import SongSearchIndex
+from value_bins import ValueBinTable, walk_value_chain
 
 
 class Vertex:
@@ -17,6 +28,7 @@ class Vertex:
     - neighbours:
         A set of other vertices
     """
+    __slots__: tuple[str, ...] = ('item', 'neighbours')
     item: Any
     neighbours: set[Vertex]
 
@@ -28,6 +40,10 @@ class Vertex:
         self.neighbours = set()
 
 
+# The slot holding Vertex.neighbours, which SongVertex wraps in a property.
+_NEIGHBOURS_SLOT = Vertex.neighbours
+
+
 class ValueVertex(Vertex):
     """
     Vertices for values
@@ -41,6 +57,7 @@ class ValueVertex(Vertex):
         A set of other vertices this one is connected to, being either songs or other values of the same type.
     """
 
+    __slots__: tuple[str, ...] = ('value',)
     item: str
     value: float
     neighbours: set[SongVertex | ValueVertex]
@@ -92,10 +109,21 @@ class ValueVertex(Vertex):
 class SongVertex(Vertex):
     """
     Vertices for songs
+
+    Instance Attributes:
+    - item:
+        The id of the song
+    - neighbours:
+        A set of the value vertices this song is connected to.
+    - value_vertices:
+        A dictionary mapping each type of value to the neighbour of that type. It is rebuilt whenever neighbours
+        is assigned, and Graph.add_edge keeps it up to date when an edge is added.
     """
 
+    __slots__: tuple[str, ...] = ('value_vertices',)
     item: str
     neighbours: set[ValueVertex]
+    value_vertices: dict[str, ValueVertex]
 
     def __init__(self, item: str) -> None:
         """
@@ -103,6 +131,31 @@ class SongVertex(Vertex):
         """
         super().__init__(item)
 
+    @property
+    def neighbours(self) -> set[ValueVertex]:
+        """
+        Return the set of neighbours of this song.
+        """
+        return _NEIGHBOURS_SLOT.__get__(self, SongVertex)
+
+    @neighbours.setter
+    def neighbours(self, neighbours: set[ValueVertex]) -> None:
+        """
+        Set the neighbours of this song, and which of them holds the value of each type.
+        """
+        _NEIGHBOURS_SLOT.__set__(self, neighbours)
+        self.value_vertices = {}
+        for neighbour in neighbours:
+            self.add_value_vertex(neighbour)
+
+    def add_value_vertex(self, vertex: Vertex) -> None:
+        """
+        Record vertex as this song's value of its type, if it is a value vertex and the song has no value of
+        that type yet. This doesn't add vertex to neighbours; Graph.add_edge does both.
+        """
+        if isinstance(vertex, ValueVertex) and vertex.item not in self.value_vertices:
+            self.value_vertices[vertex.item] = vertex
+
     def get_value_of_type(self, vtype: str) -> float:
         """
         Return the value of a certain type a song is connected to.
@@ -113,12 +166,10 @@ class SongVertex(Vertex):
         0.66
         """
 
-        if vtype not in {neighbour.item for neighbour in self.neighbours}:
+        vertex = self.value_vertices.get(vtype)
+        if vertex is None:
             raise IndexError
-        for vertex in self.neighbours:
-            if vertex.item == vtype:
-                return vertex.get_value()
-        return -1.0
+        return vertex.value
 
 
 class Graph:
@@ -132,18 +183,50 @@ class Graph:
             A dictionary mapping song names to song ids.
         - song_ids:
             A dictionary mapping song ids to song names.
+        - store:
+            The SongStore holding the songs of this graph in compact mode, or None. In compact mode songs are
+            rows of the store rather than SongVertex objects in _vertices, song_names and song_ids are views over
+            the store, and value vertices don't keep song neighbours. SongVertex objects for songs are only created
+            on demand (e.g. by get_song_vertex_by_name).
+        - cache:
+            The RecommendationCache in front of recommend_songs, or None if caching is off (the default).
+        - value_bins:
+            The ValueBinTable of the value vertices of this graph, used by value_vertex_by_distance and
+            connect_value_edges.
+        - _bin_index:
+            The BinIndex of store used by recommend_songs, or None if it hasn't been built since the last change.
+        - _ann_index:
+            The AnnIndex of store used by recommend_songs, or None if it hasn't been built since the last change.
+        - _search_index:
+            The SongSearchIndex of the song names, or None if it hasn't been built since the last change.
     """
     _vertices: dict[Any, ValueVertex | SongVertex | Vertex]
-    song_names: dict[str, str]
-    song_ids: dict[str, str]
+    song_names: dict[str, str] | Mapping[str, str]
+    song_ids: dict[str, str] | Mapping[str, str]
+    store: Optional[SongStore]
+    cache: Optional[RecommendationCache]
+    value_bins: ValueBinTable
+    _bin_index: Optional[BinIndex]
+    _ann_index: Optional[AnnIndex]
+    _search_index: Optional[SongSearchIndex]
 
-    def __init__(self) -> None:
+    def __init__(self, store: Optional[SongStore] = None) -> None:
         """
-        Initialize an empty graph (no vertices or edges).
+        Initialize an empty graph (no vertices or edges). If a store is given, the graph is in compact mode.
         """
         self._vertices = {}
-        self.song_names = {}
-        self.song_ids = {}
+        self.store = store
+        self.cache = None
+        self.value_bins = ValueBinTable(store.resolution if store is not None else 100)
+        self._bin_index = None
+        self._ann_index = None
+        self._search_index = None
+        if store is None:
+            self.song_names = {}
+            self.song_ids = {}
+        else:
+            self.song_names = store.name_to_id()
+            self.song_ids = store.id_to_name()
 
     def add_vertex(self, item: Any, subclass: str = None, value: float = None) -> None:
         """
@@ -152,23 +235,41 @@ class Graph:
         Preconditions:
             - if subclass == 'value': value != None
         """
-        if item not in self._vertices:
+        if self.store is not None and subclass == 'song':
+            if item not in self.store:
+                self.store.add_song(item)
+                self._changed()
+        elif item not in self._vertices:
             if subclass == 'value':
                 self._vertices[item] = ValueVertex(item[0], value)
+                self.value_bins.add_vertex(self._vertices[item])
             elif subclass == 'song':
                 self._vertices[item] = SongVertex(item)
             else:
                 self._vertices[item] = Vertex(item)
+            self._changed()
 
     def add_song(self, song_id: str, song_name: str) -> None:
         """
         Add to the song_names dictionary a mapping between the song_id and the song_name in both
         song_names (key = song_id) and song_ids (key = song_name)
         """
+        if self.store is not None:
+            # Callers pass (name, id), so song_names maps names to ids; the store takes (id, name). The store
+            # only changes if the id is new, has no name yet, or the name is new.
+            row = self.store.row_of(song_name)
+            changes = row < 0 or self.store.names[row] is None or song_id not in self.store.name_rows
+            self.store.add_song(song_name, song_id)
+            if changes:
+                self._changed()
+            return
+        if song_id in self.song_names and song_name in self.song_ids:
+            return
         if song_id not in self.song_names:
             self.song_names[song_id] = song_name
         if song_name not in self.song_ids:
             self.song_ids[song_name] = song_id
+        self._changed()
 
     def does_song_name_exist(self, song_name: str) -> bool:
         """
@@ -177,82 +278,250 @@ class Graph:
 
         return song_name in self.song_names
 
+    def song_ids_named(self, song_name: str) -> list[str]:
+        """
+        Return the ids of every song named song_name, in the order they were added. song_names only maps a name
+        to the first of them.
+
+        >>> g = Graph()
+        >>> for song_id in ['1', '2']:
+        ...     g.add_vertex(song_id, 'song')
+        ...     g.add_song('Same Name', song_id)
+        >>> g.song_names['Same Name'], g.song_ids_named('Same Name')
+        ('1', ['1', '2'])
+        """
+        return self.get_search_index().song_ids(song_name)
+
+    def search_song_names(self, query: str, limit: int = 10) -> list[str]:
+        """
+        Return up to limit song names for autocompleting query: the names starting with it (ignoring case and
+        extra whitespace), then the names most similar to it, to allow for typos.
+
+        >>> g = Graph()
+        >>> for song_id, song_name in enumerate(['Call Me Maybe', 'Call On Me', 'Maybe']):
+        ...     g.add_vertex(str(song_id), 'song')
+        ...     g.add_song(song_name, str(song_id))
+        >>> g.search_song_names('call'), g.search_song_names('cal me mabye')
+        (['Call Me Maybe', 'Call On Me'], ['Call Me Maybe'])
+        """
+        return self.get_search_index().search(query, limit)
+
+    def get_search_index(self) -> SongSearchIndex:
+        """
+        Return the SongSearchIndex of the song names of this graph, building it if it is out of date.
+        """
+        if self._search_index is None:
+            # As when loading, the index only creates objects that stay alive.
+            gc_was_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                if self.store is not None:
+                    self._search_index = SongSearchIndex(self.store.ids, self.store.names)
+                else:
+                    self._search_index = SongSearchIndex(list(self.song_ids), list(self.song_ids.values()))
+            finally:
+                if gc_was_enabled:
+                    gc.enable()
+        return self._search_index
+
     def add_edge(self, item1: Any, item2: Any) -> None:
         """
         Add an edge between the two vertices with the given items in the graph.
 
         Raise ValueError if item1 or item2 do not appear as vertices in this graph
 
+        Adding an edge the graph already has changes nothing, so it keeps the cached recommendations:
+
+        >>> g = Graph()
+        >>> g.add_vertex(('energy', 0.5), 'value', 0.5)
+        >>> g.add_vertex('1', 'song')
+        >>> g.add_song('A', '1')
+        >>> g.add_edge('1', ('energy', 0.5))
+        >>> cache = g.enable_cache()
+        >>> g.recommend_songs('A', 1)
+        ['1']
+        >>> g.add_edge('1', ('energy', 0.5))
+        >>> g.add_vertex('1', 'song')
+        >>> len(cache)
+        1
+
         Preconditions:
             - item1 != item2
         """
-        if item1 in self._vertices and item2 in self._vertices:
+        if self.store is not None and (item1 in self.store or item2 in self.store):
+            song, value_item = (item1, item2) if item1 in self.store else (item2, item1)
+            if not isinstance(self._vertices.get(value_item), ValueVertex):
+                raise ValueError
+            # set_value keeps a value the song already has.
+            had_value = value_item[0] in self.store.get_values(song)
+            self.store.set_value(song, value_item[0], self._vertices[value_item].value)
+            if not had_value:
+                self._changed()
+        elif item1 in self._vertices and item2 in self._vertices:
             v1 = self._vertices[item1]
             v2 = self._vertices[item2]
+            if v2 in v1.neighbours:
+                return
 
+            self._changed()
             v1.neighbours.add(v2)
             v2.neighbours.add(v1)
+            if isinstance(v1, SongVertex):
+                v1.add_value_vertex(v2)
+            if isinstance(v2, SongVertex):
+                v2.add_value_vertex(v1)
+            if isinstance(v1, ValueVertex) and isinstance(v2, ValueVertex):
+                self.value_bins.add_edge(v1, v2)
         else:
             raise ValueError
 
+    def detach_song(self, song_id: str, remove: bool = False) -> bool:
+        """
+        Remove every edge of the SongVertex with the given id, and the vertex itself if remove is True. Return
+        whether there was one. Object mode only; song_names and song_ids are left as they are.
+        """
+        song = self._vertices.get(song_id)
+        if not isinstance(song, SongVertex):
+            return False
+        self._changed()
+        for neighbour in song.neighbours:
+            neighbour.neighbours.discard(song)
+        song.neighbours = set()
+        if remove:
+            del self._vertices[song_id]
+        return True
+
+    def built_indexes(self) -> tuple[Optional[BinIndex], Optional[AnnIndex], Optional[SongSearchIndex]]:
+        """
+        Return the BinIndex, AnnIndex and SongSearchIndex of this graph, each None if it isn't built (see
+        get_bin_index), so changes to the store can be applied to them instead of dropping them.
+        """
+        return self._bin_index, self._ann_index, self._search_index
+
     def connect_value_edges(self, item1: tuple, item2: tuple) -> None:
         """
         Add edges between item1 and item2, incrementing by 0.01 per edge value.
 
+        Only the value vertices and edges missing from the chain between them are added, found with the
+        graph's ValueBinTable.
+
         Raise ValueError if item1 or item2 are not vertices in this graph.
 
         Preconditions:
             - isinstance(self._vertices[item1], _ValueVertex)
             - isinstance(self._vertices[item2], _ValueVertex)
             - item1 != item2
+
+        >>> g = Graph()
+        >>> g.add_vertex(('energy', 0.60), 'value', 0.60)
+        >>> g.add_vertex(('energy', 0.63), 'value', 0.63)
+        >>> g.connect_value_edges(('energy', 0.63), ('energy', 0.60))
+        >>> [v.value for v in g.value_vertex_by_distance(g.get_value_vertex('energy', 0.60), 3)]
+        [0.63]
         """
         if item1 in self._vertices and item2 in self._vertices:
             v1 = self._vertices[item1]
             v2 = self._vertices[item2]
-            if round(v1.value - v2.value, 2) != 0:
-                diff = round(abs(v1.value - v2.value) - 0.01, 2)
-            else:
+            if round(v1.value - v2.value, 2) == 0:
                 return None
-
-            # lower value + difference = 1 less than upper value. Works for separated by 1, since while loop.
-            if v1.value > v2.value:
-                while diff > 0.00:
-                    self.add_vertex((item1[0], round(v2.value + diff, 2)),
-                                    'value', round(v2.value + diff, 2))
-                    self.add_edge((item1[0], round(v2.value + diff, 2)),
-                                  (item1[0], round(v2.value + diff + 0.01, 2)))
-                    diff = round(diff - 0.01, 2)
-                self.add_edge((item1[0], v2.value), (item1[0], round(v2.value + 0.01, 2)))
-            else:  # v2.value > v1.value
-                while diff > 0.00:
-                    self.add_vertex((item1[0], round(v1.value + diff, 2)),
-                                    'value', round(v1.value + diff, 2))
-                    self.add_edge((item1[0], round(v1.value + diff, 2)),
-                                  (item1[0], round(v1.value + diff + 0.01, 2)))
-                    diff = round(diff - 0.01, 2)
-                self.add_edge((item1[0], v1.value), (item1[0], round(v1.value + 0.01, 2)))
         else:
             raise IndexError
 
+        b1, b2 = self.value_bins.value_to_bin(v1.value), self.value_bins.value_to_bin(v2.value)
+        if self.value_bins.irregular or b1 is None or b2 is None:
+            self._step_value_edges(item1, v1, v2)
+            return None
+
+        for b in self.value_bins.missing_links(item1[0], b1, b2):
+            low, high = self.value_bins.bin_to_value(b), self.value_bins.bin_to_value(b + 1)
+            self.add_vertex((item1[0], low), 'value', low)
+            self.add_vertex((item1[0], high), 'value', high)
+            self.add_edge((item1[0], low), (item1[0], high))
         return None
 
+    def _step_value_edges(self, item1: tuple, v1: ValueVertex, v2: ValueVertex) -> None:
+        """
+        Add the edges of connect_value_edges one 0.01 step at a time, for graphs the ValueBinTable can't describe.
+        """
+        low = v2 if v1.value > v2.value else v1
+        diff = round(abs(v1.value - v2.value) - 0.01, 2)
+
+        # lower value + difference = 1 less than upper value. Works for separated by 1, since while loop.
+        while diff > 0.00:
+            self.add_vertex((item1[0], round(low.value + diff, 2)), 'value', round(low.value + diff, 2))
+            self.add_edge((item1[0], round(low.value + diff, 2)), (item1[0], round(low.value + diff + 0.01, 2)))
+            diff = round(diff - 0.01, 2)
+        self.add_edge((item1[0], low.value), (item1[0], round(low.value + 0.01, 2)))
+
     def get_vertices(self) -> list:
         """
         Return every vertex in this graph in a list
         """
 
-        return list(self._vertices.values())
+        with instrumentation.stage('get_vertices'):
+            vertices = list(self.iter_vertices())
+        return vertices
+
+    def iter_vertices(self, stored_songs: bool = True) -> Iterator[Vertex]:
+        """
+        Yield every vertex in this graph, in the order get_vertices lists them, without building a list of all of
+        them. The vertices of the songs in store (see _song_vertex) are only yielded if stored_songs is True.
+
+        >>> g = Graph(SongStore())
+        >>> g.add_vertex(('energy', 0.5), 'value', 0.5)
+        >>> g.add_vertex('1010001', 'song')
+        >>> [vertex.item for vertex in g.iter_vertices()], len(list(g.iter_vertices(stored_songs=False)))
+        (['energy', '1010001'], 1)
+        """
+        yield from self._vertices.values()
+        if self.store is not None and stored_songs:
+            for song_id in self.store.id_rows:
+                yield self._song_vertex(song_id)
 
     def get_edges(self) -> set[tuple]:
         """
         Return every edge in this graph as a set of tuples (first vertex, second vertex)
+
+        Each edge is in the set in both directions. Use iter_edges to go through the edges of a large graph.
         """
         edges = set()
-        for v in self._vertices.values():
+        for v in self.get_vertices():
             for n in v.neighbours:
                 edges.add((n, v))
         return edges
 
+    def iter_edges(self, kind: Optional[str] = None) -> Iterator[tuple[Vertex, Vertex]]:
+        """
+        Yield every edge in this graph exactly once, as a tuple (first vertex, second vertex), without building
+        a collection of all of them. Edges between a song and a value are yielded as (song, value).
+
+        If kind is 'song-value' or 'value-value', only edges between a song and a value or between two values are
+        yielded.
+
+        >>> g = Graph()
+        >>> g.add_vertex('1010001', 'song')
+        >>> g.add_vertex(('energy', 0.60), 'value', 0.60)
+        >>> g.add_vertex(('energy', 0.61), 'value', 0.61)
+        >>> g.add_edge('1010001', ('energy', 0.60))
+        >>> g.add_edge(('energy', 0.60), ('energy', 0.61))
+        >>> len(list(g.iter_edges()))
+        2
+        >>> [(song.item, value.value) for song, value in g.iter_edges('song-value')]
+        [('1010001', 0.6)]
+
+        Preconditions:
+            - kind in {None, 'song-value', 'value-value'}
+        """
+        for v in self._vertices.values():
+            for n in v.neighbours:
+                if _is_edge_from(v, n, kind):
+                    yield v, n
+
+        if self.store is not None and kind in (None, 'song-value'):
+            for song_id in self.store.id_rows:
+                song_vertex = self._song_vertex(song_id)
+                yield from ((song_vertex, n) for n in song_vertex.neighbours)
+
     def get_song_vertex_by_name(self, song_name: str) -> SongVertex:
         """
         Returns a song vertex given the song's name
@@ -268,7 +537,7 @@ class Graph:
         if song_name not in self.song_names:
             raise IndexError
         else:
-            return self._vertices[self.song_names[song_name]]
+            return self._song_vertex(self.song_names[song_name])
 
     def get_song_by_name(self, song_name: str) -> str:
         """
@@ -281,10 +550,11 @@ class Graph:
         '1010001'
         """
 
-        if song_name not in self.song_names:
+        # One lookup rather than two: in compact mode, each lookup searches the store's string tables.
+        song_id = self.song_names.get(song_name)
+        if song_id is None:
             raise IndexError
-        else:
-            return self.song_names[song_name]
+        return song_id
 
     def get_song_by_id(self, song_id: str) -> str:
         """
@@ -297,10 +567,10 @@ class Graph:
         'Call Me Maybe'
         """
 
-        if song_id not in self.song_ids:
+        song_name = self.song_ids.get(song_id)
+        if song_name is None:
             raise IndexError
-        else:
-            return self.song_ids[song_id]
+        return song_name
 
     def get_value_vertex(self, vtype: str, value: float) -> ValueVertex:
         """
@@ -343,11 +613,11 @@ class Graph:
         0.06
         """
 
-        if song1 not in self._vertices or song2 not in self._vertices:
+        if not self._has_song(song1) or not self._has_song(song2):
             raise ValueError
 
-        value1 = self._vertices[song1].get_value_of_type(vtype)
-        value2 = self._vertices[song2].get_value_of_type(vtype)
+        value1 = self._value_of_type(song1, vtype)
+        value2 = self._value_of_type(song2, vtype)
         # return depth + the two edges from each song to the values.
         return round(abs(value2 - value1) + 0.02, 2)
 
@@ -385,30 +655,219 @@ class Graph:
 
         average = 0
         num_types = 0
-        for neighbour in self._vertices[song1].neighbours:
-            neighbour_type = neighbour.item
+        for neighbour_type in self._types_of(song1):
             average += self.get_similarity_by_type(song1, song2, neighbour_type)
             num_types += 1
 
         return round(average / num_types, 2)
 
-    def recommend_songs(self, song: str, limit: int) -> list[str]:
+    def recommend_songs(self, song: str, limit: int, method: str = 'scan',
+                        song_filter: Optional[RecommendationFilter] = None, order: str = 'legacy') -> list[str]:
         """
         Return a list of songs based on similarity scores to the given song.
+
+        In compact mode every song is scored at once over the store's feature array, and only the best
+        limit + 1 songs are sorted; the order (including ties) is the same as scoring each song separately.
+        With method='index', only the songs in value bins near the given song's are looked at, using a BinIndex
+        built on first use; the result is the same. Stores too large to index are scanned instead.
+
+        With method='weighted', songs are instead ranked by the distance between their bins and the given song's,
+        with each feature counted by the weight the store was built with (see feature_schema.FeatureSchema).
+        This needs a compact graph.
+
+        With method='ann', only the songs near the given song's in an AnnIndex (built on first use, unless one
+        was set with set_ann_index) are scored, so a few of the results may differ from 'scan' (or 'weighted',
+        if the index is weighted). This needs a compact graph.
+
+        If song_filter is given, the result is the best limit + 1 songs it allows, chosen as it says (see
+        recommendation_filter.RecommendationFilter): excluded songs are left out while the songs are scored, so a
+        filtered query costs about as much as an unfiltered one. This needs a compact graph, and skips the cache.
+
+        order says how songs are ranked by 'scan' and 'index' (see song_scoring.recommend_rows_ordered): 'legacy'
+        by the rounded average similarity, as in object mode; 'refined' by the distance between value bins, with
+        ties broken by the distance between the unrounded values; 'exact' by the distance between the unrounded
+        values alone. Remaining ties go to the song added first. Orders other than 'legacy' need a compact graph.
+
+        >>> import graph_delta
+        >>> g = Graph(SongStore())
+        >>> for b in range(101):
+        ...     g.add_vertex(('energy', b / 100), 'value', b / 100)
+        >>> for song_id, energy in enumerate([0.5, 0.5, 0.52, 0.8]):
+        ...     _ = graph_delta.upsert_song(g, str(song_id), 'Same' if energy == 0.5 else 'Other', {'energy': energy})
+        >>> g.recommend_songs('Same', 1)
+        ['0', '1']
+        >>> g.recommend_songs('Same', 1, song_filter=RecommendationFilter(exclude_seed=True))
+        ['2', '3']
+        >>> g.recommend_songs('Same', 1, 'index', RecommendationFilter(ranges={'energy': (0.7, 1.0)}))
+        ['3']
+        >>> _ = graph_delta.upsert_song(g, '4', 'Close', {'energy': 0.521})
+        >>> g.recommend_songs('Close', 1), g.recommend_songs('Close', 1, order='refined')
+        (['2', '4'], ['4', '2'])
+
+        Preconditions:
+            - method in {'scan', 'index', 'weighted', 'ann'}
+            - method not in {'weighted', 'ann'} or self.store is not None
+            - song_filter is None or self.store is not None
+            - order in song_scoring.ORDERS
+            - order == 'legacy' or (self.store is not None and method in {'scan', 'index'})
         """
 
+        instrumentation.count('recommend_songs.calls')
+        with instrumentation.query('recommend_songs'):
+            if song_filter is not None:
+                return self._recommend_filtered(song, limit, method, song_filter, order)
+            if self.cache is not None:
+                signature = self._signature(self.get_song_by_name(song), method, order)
+                result = self.cache.get(signature, limit)
+                if result is None:
+                    instrumentation.count('recommend_songs.cache_misses')
+                    result = self._recommend_songs(song, limit, method, order)
+                    self.cache.put(signature, limit, result)
+                return result
+            return self._recommend_songs(song, limit, method, order)
+
+    def _recommend_songs(self, song: str, limit: int, method: str, order: str = 'legacy') -> list[str]:
+        """
+        Return recommend_songs(song, limit, method, order=order), without using the cache.
+        """
+
+        if self.store is not None:
+            rows = self._recommend_rows(self.store.id_rows[self.get_song_by_name(song)], limit, method, order=order)
+            return [self.store.ids[row] for row in rows]
+
         song_similarity_dict = {}
-        for vertex in self.get_vertices():
-            if isinstance(vertex, SongVertex):
-                song_similarity_dict[vertex.item] = self.average_similarity(
-                    self.get_song_by_name(song), vertex.item)
-        sorted_similarity = sorted(song_similarity_dict, key=song_similarity_dict.get)
+        with instrumentation.stage('recommend_songs.average_similarity'):
+            for song_id in self._song_items():
+                song_similarity_dict[song_id] = self.average_similarity(self.get_song_by_name(song), song_id)
+        instrumentation.observe('recommend_songs.songs_scored', len(song_similarity_dict))
+        with instrumentation.stage('recommend_songs.sort'):
+            sorted_similarity = sorted(song_similarity_dict, key=song_similarity_dict.get)
         return sorted_similarity[:limit + 1]
 
+    def _recommend_filtered(self, song: str, limit: int, method: str,
+                            song_filter: RecommendationFilter, order: str = 'legacy') -> list[str]:
+        """
+        Return recommend_songs(song, limit, method, song_filter, order). Raise ValueError if this graph isn't
+        compact.
+        """
+        store = self.store
+        if store is None:
+            raise ValueError('recommendation filters need a compact graph')
+        row = store.id_rows[self.get_song_by_name(song)]
+        rows = song_filter.recommend_rows(store, row, limit, lambda allowed, count: self._recommend_rows(
+            row, count - 1, method, allowed, order))
+        return [store.ids[found] for found in rows]
+
+    def _recommend_rows(self, row: int, limit: int, method: str,
+                        allowed: Optional[np.ndarray] = None, order: str = 'legacy') -> np.ndarray:
+        """
+        Return the rows of the store recommend_songs picks for the song in the given row, only from the allowed
+        rows, if given.
+        """
+        with instrumentation.stage(f'recommend_songs.{method}'):
+            if method == 'index' and BinIndex.supports(self.store):
+                return self.get_bin_index().recommend_rows(row, limit, allowed, order)
+            if method == 'weighted':
+                return song_scoring.recommend_rows_weighted(self.store, row, limit, allowed)
+            if method == 'ann':
+                return self.get_ann_index().recommend_rows(row, limit, allowed=allowed)
+            return song_scoring.recommend_rows_ordered(self.store, row, limit, allowed, order)
+
+    def recommend_songs_batch(self, song_names: list[str], limit: int, block_size: int = 8,
+                              workers: int = 1) -> list[list[str]]:
+        """
+        Return [self.recommend_songs(song, limit) for song in song_names].
+
+        In compact mode the songs are scored block_size at a time against the whole store, optionally split
+        between worker processes sharing the store's feature array (see song_scoring.recommend_rows_batch).
+        """
+
+        if self.store is None:
+            return [self.recommend_songs(song, limit) for song in song_names]
+
+        results = [None] * len(song_names)
+        if self.cache is not None:
+            for i, song in enumerate(song_names):
+                results[i] = self.cache.get(self._signature(self.get_song_by_name(song)), limit)
+        missing = [i for i, result in enumerate(results) if result is None]
+
+        rows = [self.store.id_rows[self.get_song_by_name(song_names[i])] for i in missing]
+        for i, found in zip(missing, song_scoring.recommend_rows_batch(self.store, rows, limit, block_size, workers)):
+            results[i] = [self.store.ids[row] for row in found]
+            if self.cache is not None:
+                self.cache.put(self._signature(self.get_song_by_name(song_names[i])), limit, results[i])
+        return results
+
+    def enable_cache(self, max_size: int = 1024) -> RecommendationCache:
+        """
+        Put a new RecommendationCache of the given size in front of recommend_songs and return it.
+
+        >>> g = Graph()
+        >>> g.add_vertex(('energy', 0.6), 'value', 0.6)
+        >>> for song_id in ['1', '2', '3']:
+        ...     g.add_vertex(song_id, 'song')
+        ...     g.add_song(f'Song {song_id}', song_id)
+        ...     g.add_edge(song_id, ('energy', 0.6))
+        >>> cache = g.enable_cache(10)
+        >>> g.recommend_songs('Song 1', 1)
+        ['1', '2']
+        >>> g.recommend_songs('Song 3', 0)
+        ['1']
+        >>> cache.hits, cache.misses
+        (1, 1)
+        """
+        self.cache = RecommendationCache(max_size)
+        return self.cache
+
+    def get_bin_index(self) -> BinIndex:
+        """
+        Return the BinIndex of this graph's store, building it if it is out of date.
+
+        Preconditions:
+            - self.store is not None
+        """
+        if self._bin_index is None:
+            with instrumentation.stage('bin_index.build'):
+                self._bin_index = BinIndex(self.store)
+        return self._bin_index
+
+    def set_bin_index(self, index: BinIndex) -> None:
+        """
+        Use index (e.g. one loaded from a snapshot) as the BinIndex of this graph's store.
+
+        Preconditions:
+            - index.store is self.store
+        """
+        self._bin_index = index
+
+    def get_ann_index(self) -> AnnIndex:
+        """
+        Return the AnnIndex of this graph's store, building one with the default settings if it is out of date.
+
+        Preconditions:
+            - self.store is not None
+        """
+        if self._ann_index is None:
+            with instrumentation.stage('ann_index.build'):
+                self._ann_index = AnnIndex(self.store)
+        return self._ann_index
+
+    def set_ann_index(self, index: AnnIndex) -> None:
+        """
+        Use index (e.g. one loaded from a snapshot, or built with other settings) as the AnnIndex of this graph's
+        store.
+
+        Preconditions:
+            - index.store is self.store
+        """
+        self._ann_index = index
+
     def value_vertex_by_distance(self, vertex: ValueVertex, distance: int) -> Any:
         """
         Return the value vertexes [distance] away from the given vertex
 
+        The vertices are looked up in the graph's ValueBinTable, in time that doesn't depend on distance.
+
         >>> g = Graph()
         >>> g.add_vertex(('energy', 0.60), 'value', 0.60)
         >>> g.add_vertex(('energy', 0.61), 'value', 0.61)
@@ -428,20 +887,109 @@ class Graph:
 
         if distance == 0:
             return [vertex]
+
+        b = self.value_bins.value_to_bin(vertex.value)
+        if self.value_bins.irregular or b is None or self.value_bins.vertex(vertex.item, b) is not vertex:
+            return walk_value_chain(vertex, distance)
+        return {self.value_bins.vertex(vertex.item, c) for c in self.value_bins.bins_at_distance(b, distance)
+                if self.value_bins.vertex(vertex.item, c) is not None
+                and self.value_bins.connected(vertex.item, b, c)}
+
+    def _changed(self) -> None:
+        """
+        Forget everything derived from the contents of this graph, since it is about to change.
+        """
+        self._bin_index = None
+        self._ann_index = None
+        self._search_index = None
+        if self.cache is not None:
+            self.cache.clear()
+
+    def _signature(self, song_id: Any, method: str = 'scan', order: str = 'legacy') -> tuple:
+        """
+        Return the values of a song as a tuple, tagged with method if it ranks songs differently from 'scan'.
+        Songs with the same signature get the same recommendations from method and order.
+        """
+        store = self.store
+        if store is None or song_id not in store:
+            signature = tuple(sorted((vertex.item, vertex.value) for vertex in self._vertices[song_id].neighbours))
+        elif order == 'legacy':
+            signature = tuple(store.bins[store.id_rows[song_id]].tolist())
         else:
-            # It's a list for the sake of list.extend, better for this than set.union
-            vertices = []
-            for neighbour in vertex.get_value_neighbours():
-                vertices.extend(self.value_vertex_by_distance(neighbour, distance - 1))
+            # Songs in the same bins are ranked apart by their unrounded values.
+            signature = tuple([order] + np.nan_to_num(store.values[store.id_rows[song_id]], nan=-1.0).tolist())
+        return (method, signature) if method in {'weighted', 'ann'} else signature
+
+    def _has_song(self, song_id: Any) -> bool:
+        """
+        Return whether song_id is a song in this graph (a row of the store, or a vertex in _vertices).
+        """
+        if self.store is not None and song_id in self.store:
+            return True
+        return song_id in self._vertices
+
+    def _song_items(self) -> Iterator[Any]:
+        """
+        Return an iterator over the ids of every song in this graph, in the order they were added.
+        """
+        if self.store is not None:
+            yield from self.store.id_rows
+        for vertex in self._vertices.values():
+            if isinstance(vertex, SongVertex):
+                yield vertex.item
+
+    def _song_vertex(self, song_id: Any) -> SongVertex:
+        """
+        Return the SongVertex of the given song. In compact mode this is a new vertex built from the store,
+        connected to this graph's value vertices (which are not connected back to it).
+        """
+        if self.store is not None and song_id in self.store:
+            vertex = SongVertex(song_id)
+            vertex.neighbours = {self._vertices[(vtype, value)]
+                                 for vtype, value in self.store.get_values(song_id).items()}
+            return vertex
+        return self._vertices[song_id]
 
-            return {v for v in vertices if round(abs(v.value - vertex.value), 2) == distance / 100}
+    def _value_of_type(self, song_id: Any, vtype: str) -> float:
+        """
+        Return the value of the given type for a song, raising IndexError if it has none.
+        """
+        if self.store is not None and song_id in self.store:
+            return self.store.get_value(song_id, vtype)
+        return self._vertices[song_id].get_value_of_type(vtype)
+
+    def _types_of(self, song_id: Any) -> list[str]:
+        """
+        Return the types of the values a song is connected to.
+        """
+        if self.store is not None and song_id in self.store:
+            return list(self.store.get_values(song_id))
+        return [neighbour.item for neighbour in self._vertices[song_id].neighbours]
+
+
+def _is_edge_from(v: Vertex, n: Vertex, kind: Optional[str]) -> bool:
+    """
+    Return whether Graph.iter_edges(kind) yields the edge between v and its neighbour n as (v, n): each edge of
+    the requested kind is yielded from exactly one of its vertices, the song's side for an edge between a song
+    and a value.
+    """
+    if isinstance(v, SongVertex) and isinstance(n, ValueVertex):
+        return kind in (None, 'song-value')
+    if isinstance(n, SongVertex) and isinstance(v, ValueVertex):
+        return False
+    if id(v) > id(n):
+        return False
+    return kind is None or (kind == 'value-value' and isinstance(v, ValueVertex) and isinstance(n, ValueVertex))
 
 
 if __name__ == '__main__':
     doctest.testmod()
 
     python_ta.check_all(config={
-        'extra-imports': ['annotations', 'Any'],  # the names (strs) of imported modules
+        'extra-imports': ['annotations', 'Any', 'gc', 'numpy', 'song_store', 'instrumentation', 'song_scoring',
+                          'bin_index', 'ann_index', 'recommendation_cache', 'recommendation_filter',
+                          'song_search', 'value_bins'],  # the names (strs) of imported modules
         'allowed-io': [],  # the names (strs) of functions that call print/open/input
+        'disable': ['E9959'],  # python_ta takes the __slots__ of each vertex class as overwriting the last
         'max-line-length': 120
     })
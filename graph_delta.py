@@ -0,0 +1,300 @@
+"""CSC111 Winter 2024 Project 2
+    File containing functions to add, update and remove songs of a loaded graph, and to keep a change log of
+    them next to its snapshot.
+
+    A change is a tuple (action, song id, song name, values), where action is 'upsert' (add the song, or replace
+    its name and values) or 'remove', and values maps each type to a value in [0, 1]. Removals have no name or
+    values.
+
+    The change log is a file of JSON lines. The first line records the source CSV file it applies to (like a
+    snapshot header); each other line is a change. Changes are only ever appended, so ingesting a delta never
+    rewrites the snapshot; load_graph replays the entries the snapshot doesn't include yet.
+"""
+from __future__ import annotations
+from typing import Iterable, Iterator, Optional
+import csv
+import doctest
+import json
+import os
+import numpy as np
+import python_ta
+import graph_classes
+import graph_snapshot
+from bin_index import BinIndex
+from feature_schema import FeatureSchema, LEGACY_SCHEMA
+
+Change = tuple[str, str, Optional[str], dict[str, float]]
+
+ACTIONS = ('upsert', 'remove')
+
+
+def read_delta(delta_file: str, schema: FeatureSchema = LEGACY_SCHEMA) -> Iterator[Change]:
+    """
+    Yield the changes in the CSV file delta_file. Its header has the columns action, id and name, then a
+    column for each feature of schema, named after the feature. Raw feature values are normalised by schema;
+    empty values are left out.
+
+    Raise ValueError if a row has an unknown action.
+    """
+    with open(delta_file, encoding='utf-8', newline='') as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            action = row['action']
+            if action not in ACTIONS:
+                raise ValueError(f'unknown action {action!r}')
+            values = {}
+            if action == 'upsert':
+                for feature in schema.features:
+                    if row.get(feature.name):
+                        values[feature.name] = float(feature.normalise(np.array(float(row[feature.name]))))
+            yield action, row['id'], row['name'] if action == 'upsert' else None, values
+
+
+def apply_changes(graph: graph_classes.Graph, changes: Iterable[Change]) -> dict[str, int]:
+    """
+    Apply changes to graph in order and return how many songs were added, updated and removed. Removing a song
+    that isn't in the graph does nothing.
+
+    Raise ValueError if a change has an unknown action, or is an upsert without a name.
+
+    >>> g = graph_classes.Graph()
+    >>> g.add_vertex(('energy', 0.5), 'value', 0.5)
+    >>> apply_changes(g, [('upsert', '1', 'Song 1', {'energy': 0.5}), ('upsert', '1', 'Song 1', {}),
+    ...                   ('remove', '1', None, {}), ('remove', '2', None, {})])
+    {'added': 1, 'updated': 1, 'removed': 1}
+    """
+    counts = {'added': 0, 'updated': 0, 'removed': 0}
+    for action, song_id, song_name, values in changes:
+        if action == 'upsert':
+            if song_name is None:
+                raise ValueError(f'upsert of song {song_id!r} without a name')
+            counts['added' if upsert_song(graph, song_id, song_name, values) else 'updated'] += 1
+        elif action == 'remove':
+            counts['removed'] += remove_song(graph, song_id)
+        else:
+            raise ValueError(f'unknown action {action!r}')
+    return counts
+
+
+def upsert_song(graph: graph_classes.Graph, song_id: str, song_name: str, values: dict[str, float]) -> bool:
+    """
+    Add a song with the given name and values (mapping each type to a value in [0, 1]) to graph, or replace the
+    name and values of the song with that id if there is one. Return whether the song is new. Each type must have
+    a value vertex in graph for the value rounded to 2 decimals.
+
+    Unlike Graph.add_vertex, add_song and add_edge, this keeps the indexes and cache of a compact graph up to date
+    instead of dropping them, in time that doesn't depend on the number of songs.
+
+    >>> g = graph_classes.Graph()
+    >>> for value in [0.5, 0.6]:
+    ...     g.add_vertex(('energy', value), 'value', value)
+    >>> upsert_song(g, '1', 'Song 1', {'energy': 0.5})
+    True
+    >>> upsert_song(g, '1', 'Song One', {'energy': 0.6})
+    False
+    >>> song = g.get_song_vertex_by_name('Song One')
+    >>> g.song_names['Song One'], 'Song 1' in g.song_names, song.get_value_of_type('energy')
+    ('1', False, 0.6)
+    """
+    store = graph.store
+    if store is not None:
+        row = store.id_rows.get(song_id)
+        old_bins = store.bins[row].copy() if row is not None else None
+        old_name = store.names[row] if row is not None else None
+        bins = np.full(len(store.feature_types), store.missing, dtype=store.bins.dtype)
+        raw_values = np.full(len(store.feature_types), np.nan, dtype=np.float32)
+        columns = [store.column(feature) for feature in values]
+        raw_values[columns] = list(values.values())
+        bins[columns] = store.values_to_bins(np.array(list(values.values()), dtype=float))
+        _song_changed(graph, store.set_row(song_id, song_name, bins, raw_values), old_bins)
+        _song_renamed(graph, song_id, old_name, song_name)
+        return old_bins is None
+
+    # In object mode the song's edges are replaced, which drops the indexes and cache of graph anyway.
+    is_new = not graph.detach_song(song_id)
+    graph.add_vertex(song_id, 'song')
+    for vtype, value in values.items():
+        graph.add_edge(song_id, (vtype, round(value, 2)))
+    old_name = graph.song_ids.get(song_id)
+    if old_name != song_name:
+        graph.song_ids[song_id] = song_name
+        _forget_song_name(graph, old_name, song_id)
+        if song_name not in graph.song_names:
+            graph.song_names[song_name] = song_id
+        elif not is_new:
+            graph.song_names[song_name] = _first_song_named(graph, song_name)
+    return is_new
+
+
+def remove_song(graph: graph_classes.Graph, song_id: str) -> bool:
+    """
+    Remove the song with the given id, and its edges, from graph. Return whether there was one.
+
+    As with upsert_song, the indexes and cache of a compact graph are kept up to date rather than dropped.
+
+    >>> g = graph_classes.Graph()
+    >>> g.add_vertex(('energy', 0.5), 'value', 0.5)
+    >>> for song_id in ['1', '2']:
+    ...     _ = upsert_song(g, song_id, 'Same Name', {'energy': 0.5})
+    >>> remove_song(g, '1'), remove_song(g, '1')
+    (True, False)
+    >>> g.song_names['Same Name'], len(list(g.iter_edges()))
+    ('2', 1)
+    """
+    store = graph.store
+    if store is not None:
+        if song_id not in store:
+            return False
+        row = store.id_rows[song_id]
+        old_bins, old_name = store.bins[row].copy(), store.names[row]
+        _song_changed(graph, store.remove_song(song_id), old_bins)
+        _song_renamed(graph, song_id, old_name, None)
+        return True
+
+    if not graph.detach_song(song_id, remove=True):
+        return False
+    _forget_song_name(graph, graph.song_ids.pop(song_id, None), song_id)
+    return True
+
+
+def ingest_delta(graph: graph_classes.Graph, changes: Iterable[Change], information_file: str) -> dict[str, int]:
+    """
+    Apply changes to graph, a graph loaded from information_file, and append them to its change log, so
+    load_graph(information_file, snapshot=True) includes them from now on. Return the counts of apply_changes.
+    """
+    changes = list(changes)
+    counts = apply_changes(graph, changes)
+    append_to_log(graph_snapshot.log_path(information_file), changes, information_file)
+    return counts
+
+
+def append_to_log(path: str, changes: Iterable[Change], information_file: str) -> None:
+    """
+    Append changes to the change log at path. A log that is missing or for another version of information_file
+    is started over.
+    """
+    source = graph_snapshot.source_signature(information_file)
+    mode = 'a' if _read_source(path) == source else 'w'
+    with open(path, mode, encoding='utf-8') as file:
+        if mode == 'w':
+            file.write(json.dumps({'source': source}) + '\n')
+        for action, song_id, song_name, values in changes:
+            file.write(json.dumps([action, song_id, song_name, values]) + '\n')
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def read_log(path: str, information_file: str) -> list[Change]:
+    """
+    Return the changes in the change log at path, or an empty list if it is missing or for another version of
+    information_file.
+    """
+    if _read_source(path) != graph_snapshot.source_signature(information_file):
+        return []
+    with open(path, encoding='utf-8') as file:
+        next(file)
+        return [tuple(json.loads(line)) for line in file if line.strip()]
+
+
+def replay_log(graph: graph_classes.Graph, path: str, information_file: str, start: int = 0) -> int:
+    """
+    Apply the changes in the change log at path, from entry start on, to graph. Return the number of entries
+    in the log.
+    """
+    changes = read_log(path, information_file)
+    apply_changes(graph, changes[start:])
+    return len(changes)
+
+
+def save_checkpoint(graph: graph_classes.Graph, information_file: str) -> None:
+    """
+    Rewrite the snapshot of graph, a compact graph loaded from information_file with snapshot=True, so it
+    includes every change in the change log and load_graph doesn't have to replay them. Any AnnIndex of graph
+    is saved too, with its changes merged.
+
+    Preconditions:
+        - graph.store is not None
+    """
+    index = None
+    if BinIndex.supports(graph.store):
+        index = graph.get_bin_index()
+        index.merge_changes()
+    log_entries = len(read_log(graph_snapshot.log_path(information_file), information_file))
+    graph_snapshot.write_snapshot(graph.store, index, graph_snapshot.snapshot_path(information_file),
+                                  information_file, log_entries)
+    ann_index = graph.get_ann_index() if os.path.exists(graph_snapshot.ann_path(information_file)) else None
+    if ann_index is not None:
+        ann_index.merge_changes()
+        graph_snapshot.write_ann_index(ann_index, graph_snapshot.ann_path(information_file), information_file)
+
+
+def _song_changed(graph: graph_classes.Graph, row: int, old_bins: Optional[np.ndarray]) -> None:
+    """
+    Update the indexes of graph after the song in the given row of its store was added (old_bins is None),
+    changed or removed, and clear its cache.
+    """
+    bin_index, ann_index, _ = graph.built_indexes()
+    if bin_index is not None:
+        bin_index.update(row, old_bins)
+    if ann_index is not None:
+        ann_index.update(row, old_bins)
+    if graph.cache is not None:
+        graph.cache.clear()
+
+
+def _song_renamed(graph: graph_classes.Graph, song_id: str, old_name: Optional[str], new_name: Optional[str]) -> None:
+    """
+    Update the search index of graph after the song with the given id went from old_name to new_name, where None
+    means it didn't have a name (it was added) or doesn't any more (it was removed).
+    """
+    search_index = graph.built_indexes()[2]
+    if search_index is None or old_name == new_name:
+        return
+    if old_name is not None:
+        search_index.remove_song(song_id, old_name)
+    if new_name is not None:
+        search_index.add_song(song_id, new_name)
+
+
+def _forget_song_name(graph: graph_classes.Graph, song_name: Optional[str], song_id: str) -> None:
+    """
+    Update graph.song_names after the song with the given id stopped having song_name: the name moves to the
+    first other song that has it, or is dropped. Object mode only.
+    """
+    if song_name is None or graph.song_names.get(song_name) != song_id:
+        return
+    first = _first_song_named(graph, song_name)
+    if first is None:
+        del graph.song_names[song_name]
+    else:
+        graph.song_names[song_name] = first
+
+
+def _first_song_named(graph: graph_classes.Graph, song_name: str) -> Optional[str]:
+    """
+    Return the id of the first song added to graph with song_name, or None if there is none. Object mode only.
+    This looks through every song.
+    """
+    return next((song_id for song_id, name in graph.song_ids.items() if name == song_name), None)
+
+
+def _read_source(path: str) -> Optional[dict]:
+    """
+    Return the source signature recorded by the change log at path, or None if there is no readable log there.
+    """
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.loads(file.readline()).get('source')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'csv', 'json', 'os', 'numpy', 'graph_classes', 'graph_snapshot',
+                          'bin_index', 'feature_schema'],  # the names (strs) of imported modules
+        'allowed-io': ['read_delta', 'append_to_log', 'read_log', '_read_source'],
+        'max-line-length': 120
+    })
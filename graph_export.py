@@ -0,0 +1,564 @@
+"""CSC111 Winter 2024 Project 2
+    File containing functions to export a Graph, or the RecommendationSubgraph of a recommendation (what
+    load_visualization_graph builds), to compact files other tools can read, and to import them back as a Graph.
+
+    Every exported graph is a table of numbered nodes (see NodeTable) and its edges, in one of two formats:
+        - CSR: a numpy .npz file (compressed by default) of the adjacency of the graph in compressed sparse row
+          form, where the neighbours of node i are indices[indptr[i]:indptr[i + 1]] (each edge is listed from
+          both of its nodes), with the node table:
+            - kinds: the kind of each node (VALUE, SONG or OTHER)
+            - items, item_offsets: the item of each node, utf-8 encoded one after the other (see StringTable)
+            - values: the value of each value node, or NaN
+            - names, name_offsets, name_codes: the distinct song names, in the same layout, and the index in names
+              of the name of each node, or -1
+            - feature_types, resolution, weights, song_values: if the graph is compact, the types, resolution and
+              weights of its SongStore and the unrounded values of each song node, so it is restored exactly
+        - Edge lists: two gzip-compressed, tab-separated files, prefix.nodes.tsv.gz with the columns graph, node,
+          kind, item, name and value, and prefix.edges.tsv.gz with the columns graph, source and target. One pair
+          of files holds any number of graphs, numbered from 0 in the graph column.
+
+    Both are written a chunk of edges at a time, from the vertices and SongStore of a graph, without going through
+    networkx or building the set of edges (see Graph.get_edges).
+"""
+from __future__ import annotations
+from typing import Callable, Iterable, Iterator, Optional, Sequence
+import argparse
+import csv
+import doctest
+import gc
+import gzip
+import itertools
+import math
+import operator
+import sys
+import time
+import numpy as np
+import python_ta
+import graph_loaders
+from graph_classes import Graph, SongVertex, ValueVertex, Vertex
+from graph_visualization import RecommendationSubgraph
+from song_store import SongStore, bin_dtype
+from string_table import StringColumn, StringTable
+
+# The kinds of nodes, and their names in edge list files.
+VALUE, SONG, OTHER = 0, 1, 2
+KIND_NAMES = ('value', 'song', 'other')
+
+# The number of edges (or nodes) written at a time.
+CHUNK_SIZE = 65536
+
+NODE_COLUMNS = ('graph', 'node', 'kind', 'item', 'name', 'value')
+EDGE_COLUMNS = ('graph', 'source', 'target')
+
+
+class NodeTable:
+    """
+    The nodes of an exported graph, in the order they are numbered.
+
+    The item of a song node is its id (or, for a RecommendationSubgraph, its name), the item of a value node is its
+    type, and the item of any other vertex is str of its item.
+
+    Instance Attributes:
+        - kinds:
+            The int8 array of the kind of each node: VALUE, SONG or OTHER.
+        - items:
+            The item of each node.
+        - values:
+            The float64 array of the value of each value node, with NaN for other nodes.
+        - names:
+            The name of each song node, or None.
+        - feature_types:
+            The types of the values of the graph, or None if they aren't known (see restore).
+        - resolution:
+            The number of bins per unit of value, or 0 if it isn't known.
+        - weights:
+            The weight of each of feature_types (see SongStore.weights), or None.
+        - song_values:
+            The (song nodes, len(feature_types)) float32 array of the unrounded values of each song node (see
+            SongStore.values), or None if the graph isn't compact.
+
+    Representation Invariants:
+        - len(self.kinds) == len(self.items) == len(self.values) == len(self.names)
+        - self.song_values is None or len(self.song_values) == (self.kinds == SONG).sum()
+    """
+    kinds: np.ndarray
+    items: StringTable
+    values: np.ndarray
+    names: StringColumn
+    feature_types: Optional[tuple[str, ...]]
+    resolution: int
+    weights: Optional[tuple[float, ...]]
+    song_values: Optional[np.ndarray]
+
+    def __init__(self, kinds: np.ndarray, items: StringTable, values: np.ndarray, names: StringColumn,
+                 feature_types: Optional[Sequence[str]] = None, resolution: int = 0,
+                 weights: Optional[Sequence[float]] = None, song_values: Optional[np.ndarray] = None) -> None:
+        """
+        Initialize a new node table with the given nodes.
+        """
+        self.kinds = kinds
+        self.items = items
+        self.values = values
+        self.names = names
+        self.feature_types = tuple(feature_types) if feature_types is not None else None
+        self.resolution = resolution
+        self.weights = tuple(weights) if weights is not None else None
+        self.song_values = song_values
+
+    def __len__(self) -> int:
+        """
+        Return the number of nodes in this table.
+        """
+        return len(self.kinds)
+
+    def item(self, node: int) -> str | tuple[str, float]:
+        """
+        Return the item of the vertex restored from the given node: (type, value) for a value node, as in
+        Graph._vertices, and the item in this table otherwise.
+        """
+        if self.kinds[node] == VALUE:
+            return self.items[node], float(self.values[node])
+        return self.items[node]
+
+
+def write_csr(source: Graph | RecommendationSubgraph, path: str, compress: bool = True) -> tuple[int, int]:
+    """
+    Write source to a CSR file at path and return its number of nodes and edges.
+
+    >>> import os, tempfile
+    >>> g = Graph()
+    >>> g.add_vertex(('energy', 0.6), 'value', 0.6)
+    >>> g.add_vertex(('energy', 0.61), 'value', 0.61)
+    >>> g.add_vertex('1010001', 'song')
+    >>> g.add_song('Call Me Maybe', '1010001')
+    >>> g.add_edge('1010001', ('energy', 0.61))
+    >>> g.add_edge(('energy', 0.6), ('energy', 0.61))
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     write_csr(g, os.path.join(directory, 'graph.npz'))
+    ...     restored = read_csr(os.path.join(directory, 'graph.npz'))
+    (3, 2)
+    >>> song = restored.get_song_vertex_by_name('Call Me Maybe')
+    >>> song.item, song.get_value_of_type('energy'), len(restored.get_edges())
+    ('1010001', 0.61, 4)
+    """
+    nodes, edge_chunks = _export(source)
+    indptr, indices = _csr(len(nodes), edge_chunks)
+    arrays = {'indptr': indptr, 'indices': indices, 'kinds': nodes.kinds,
+              'items': nodes.items.buffer, 'item_offsets': nodes.items.offsets, 'values': nodes.values,
+              'names': nodes.names.table.buffer, 'name_offsets': nodes.names.table.offsets,
+              'name_codes': nodes.names.codes}
+    if nodes.feature_types is not None:
+        arrays['feature_types'] = np.array(nodes.feature_types, dtype=str)
+        arrays['resolution'] = np.array(nodes.resolution)
+    if nodes.weights is not None:
+        arrays['weights'] = np.array(nodes.weights)
+    if nodes.song_values is not None:
+        arrays['song_values'] = nodes.song_values
+    with open(path, 'wb') as file:
+        (np.savez_compressed if compress else np.savez)(file, **arrays)
+    return len(nodes), len(indices) // 2
+
+
+def read_csr(path: str, compact: Optional[bool] = None, resolution: int = 100) -> Graph:
+    """
+    Return the graph in the CSR file at path. The graph is compact if compact is True, or if compact is None and
+    it was compact when it was written (see restore).
+    """
+    with np.load(path) as data:
+        nodes = NodeTable(data['kinds'], StringTable.from_arrays(data['items'], data['item_offsets'], index=False),
+                          data['values'], StringColumn.from_arrays(
+                              StringTable.from_arrays(data['names'], data['name_offsets'], index=False),
+                              data['name_codes']),
+                          np.asarray(data['feature_types']).tolist() if 'feature_types' in data else None,
+                          int(data['resolution']) if 'resolution' in data else 0,
+                          np.asarray(data['weights']).tolist() if 'weights' in data else None,
+                          data['song_values'] if 'song_values' in data else None)
+        indptr, indices = data['indptr'], data['indices']
+    if compact is None:
+        compact = nodes.song_values is not None
+    return restore(nodes, indptr, indices, compact, resolution)
+
+
+def edge_list_paths(prefix: str) -> tuple[str, str]:
+    """
+    Return the paths of the node and edge files of the edge lists with the given prefix.
+    """
+    return prefix + '.nodes.tsv.gz', prefix + '.edges.tsv.gz'
+
+
+def write_edge_lists(sources: Iterable[Graph | RecommendationSubgraph], prefix: str,
+                     compresslevel: int = 6) -> tuple[int, int, int]:
+    """
+    Write every graph of sources, in order, to the edge lists with the given prefix, and return the number of
+    graphs, nodes and edges written. Only one graph is held in memory at a time, so sources can be a generator.
+
+    >>> import os, tempfile
+    >>> subgraphs = [RecommendationSubgraph(['A', 'B'], ('energy',), 100, np.array([0, 0]), np.array([60, 61]),
+    ...                                     np.array([[0, 2], [1, 3], [2, 3]])),
+    ...              RecommendationSubgraph(['C'], ('energy',), 100, np.array([0]), np.array([5]), np.array([[0, 1]]))]
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     write_edge_lists(subgraphs, os.path.join(directory, 'subgraphs'))
+    ...     restored = list(read_edge_lists(os.path.join(directory, 'subgraphs')))
+    (2, 6, 4)
+    >>> [len(graph.get_vertices()) for graph in restored]
+    [4, 2]
+    >>> [(song.item, value.item, value.value) for song, value in restored[1].iter_edges('song-value')]
+    [('C', 'energy', 0.05)]
+    """
+    node_path, edge_path = edge_list_paths(prefix)
+    num_graphs = num_nodes = num_edges = 0
+    with gzip.open(node_path, 'wt', compresslevel=compresslevel, newline='', encoding='utf-8') as node_file, \
+            gzip.open(edge_path, 'wt', compresslevel=compresslevel, newline='', encoding='utf-8') as edge_file:
+        node_writer = csv.writer(node_file, delimiter='\t', lineterminator='\n')
+        edge_writer = csv.writer(edge_file, delimiter='\t', lineterminator='\n')
+        node_writer.writerow(NODE_COLUMNS)
+        edge_writer.writerow(EDGE_COLUMNS)
+        for graph_number, source in enumerate(sources):
+            nodes, edge_chunks = _export(source)
+            for start in range(0, len(nodes), CHUNK_SIZE):
+                node_writer.writerows(_node_rows(nodes, graph_number, start, min(start + CHUNK_SIZE, len(nodes))))
+            for chunk in edge_chunks():
+                edge_writer.writerows(zip(itertools.repeat(graph_number), chunk[:, 0].tolist(),
+                                          chunk[:, 1].tolist()))
+                num_edges += len(chunk)
+            num_graphs, num_nodes = num_graphs + 1, num_nodes + len(nodes)
+    return num_graphs, num_nodes, num_edges
+
+
+def write_edge_list(source: Graph | RecommendationSubgraph, prefix: str, compresslevel: int = 6) -> tuple[int, int]:
+    """
+    Write source to the edge lists with the given prefix and return its number of nodes and edges.
+    """
+    return write_edge_lists([source], prefix, compresslevel)[1:]
+
+
+def read_edge_lists(prefix: str, compact: bool = False, resolution: int = 100) -> Iterator[Graph]:
+    """
+    Yield each graph in the edge lists with the given prefix, in order (see restore for compact).
+
+    Edge lists don't keep the unrounded values of songs, and a song name written as an empty string is read as
+    no name.
+    """
+    node_path, edge_path = edge_list_paths(prefix)
+    with gzip.open(node_path, 'rt', newline='', encoding='utf-8') as node_file, \
+            gzip.open(edge_path, 'rt', newline='', encoding='utf-8') as edge_file:
+        node_rows, edge_rows = csv.reader(node_file, delimiter='\t'), csv.reader(edge_file, delimiter='\t')
+        next(node_rows, None)
+        next(edge_rows, None)
+        edge_groups = itertools.groupby(edge_rows, key=operator.itemgetter(0))
+        pending = next(edge_groups, None)
+        for graph_number, group in itertools.groupby(node_rows, key=operator.itemgetter(0)):
+            rows = list(group)
+            edges = np.zeros(0, dtype=np.int64)
+            if pending is not None and pending[0] == graph_number:
+                ends = itertools.chain.from_iterable(map(operator.itemgetter(1, 2), pending[1]))
+                edges = np.fromiter(map(int, ends), dtype=np.int64)
+                pending = next(edge_groups, None)
+            nodes = NodeTable(np.array([KIND_NAMES.index(row[2]) for row in rows], dtype=np.int8),
+                              _unindexed([row[3] for row in rows]),
+                              np.array([float(row[5]) if row[5] else math.nan for row in rows]),
+                              StringColumn([row[4] or None for row in rows]))
+            edges = edges.reshape(-1, 2)
+            indptr, indices = _csr(len(nodes), lambda edges=edges: iter([edges]))
+            yield restore(nodes, indptr, indices, compact, resolution)
+
+
+def read_edge_list(prefix: str, compact: bool = False, resolution: int = 100) -> Graph:
+    """
+    Return the first graph in the edge lists with the given prefix.
+    """
+    return next(read_edge_lists(prefix, compact, resolution))
+
+
+def restore(nodes: NodeTable, indptr: np.ndarray, indices: np.ndarray, compact: bool = False,
+            resolution: int = 100) -> Graph:
+    """
+    Return the graph with the given nodes and CSR adjacency.
+
+    If compact is True, the song nodes become the rows of a SongStore (see Graph.store), holding the types in
+    nodes.feature_types, or else the types of the value nodes in the order they first appear, with
+    nodes.resolution, or else the given resolution. Raise ValueError if a song node is joined to anything but
+    value nodes of those types, or to two of the same type.
+    """
+    # As when loading, the graph only creates objects that stay alive.
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        sources = np.repeat(np.arange(len(nodes)), np.diff(indptr))
+        upper = sources < indices
+        if compact:
+            return _restore_compact(nodes, _song_store(nodes, indptr, indices, resolution), sources[upper],
+                                    indices[upper])
+        graph = Graph()
+        items = list(nodes.items)
+        for node in np.flatnonzero(nodes.kinds == VALUE).tolist():
+            items[node] = nodes.item(node)
+        for item, kind in zip(items, nodes.kinds.tolist()):
+            if kind == VALUE:
+                graph.add_vertex(item, 'value', item[1])
+            else:
+                graph.add_vertex(item, 'song' if kind == SONG else None)
+        for node in np.flatnonzero(nodes.names.codes >= 0).tolist():
+            graph.add_song(nodes.names[node], items[node])
+        for node1, node2 in zip(sources[upper].tolist(), indices[upper].tolist()):
+            graph.add_edge(items[node1], items[node2])
+        return graph
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def main(arguments: Optional[list[str]] = None) -> int:
+    """
+    Export the compact graph of the CSV file given on the command line and return the exit status.
+    """
+    parser = argparse.ArgumentParser(description='Export the song graph to a CSR file or gzipped edge lists.')
+    parser.add_argument('information_file', help='the CSV file of songs')
+    parser.add_argument('output', help='the CSR file, or the prefix of the edge list files')
+    parser.add_argument('--format', choices=('csr', 'edges'), default='csr')
+    parser.add_argument('--snapshot', action='store_true', help='load the songs from their snapshot')
+    parser.add_argument('--uncompressed', action='store_true', help='write an uncompressed CSR file')
+    options = parser.parse_args(arguments)
+
+    graph = graph_loaders.load_graph(options.information_file, compact=True, snapshot=options.snapshot)
+    start = time.perf_counter()
+    if options.format == 'csr':
+        num_nodes, num_edges = write_csr(graph, options.output, compress=not options.uncompressed)
+    else:
+        num_nodes, num_edges = write_edge_list(graph, options.output)
+    print(f'Wrote {num_nodes} nodes and {num_edges} edges in {time.perf_counter() - start:.2f} s')
+    return 0
+
+
+def _export(source: Graph | RecommendationSubgraph) -> tuple[NodeTable, Callable[[], Iterator[np.ndarray]]]:
+    """
+    Return the nodes of source and a function returning a new iterator over its edges, as (number of edges, 2)
+    arrays of the nodes each joins, every edge once.
+    """
+    if isinstance(source, RecommendationSubgraph):
+        return _export_subgraph(source)
+    return _export_graph(source)
+
+
+def _export_graph(graph: Graph) -> tuple[NodeTable, Callable[[], Iterator[np.ndarray]]]:
+    """
+    Return the nodes and edges of graph, as in _export: its vertices, then the songs in its store.
+    """
+    vertices = list(graph.iter_vertices(stored_songs=False))
+    node_of = {id(vertex): node for node, vertex in enumerate(vertices)}
+    kinds = np.fromiter((VALUE if isinstance(vertex, ValueVertex) else SONG if isinstance(vertex, SongVertex)
+                         else OTHER for vertex in vertices), dtype=np.int8, count=len(vertices))
+    items = _unindexed([vertex.item if isinstance(vertex.item, str) else str(vertex.item) for vertex in vertices])
+    values = np.array([vertex.value if isinstance(vertex, ValueVertex) else math.nan for vertex in vertices],
+                      dtype=np.float64)
+
+    def edge_chunks() -> Iterator[np.ndarray]:
+        pairs = []
+        for node, vertex in enumerate(vertices):
+            pairs.extend((node, other) for other in map(node_of.__getitem__, map(id, vertex.neighbours))
+                         if node < other)
+            if len(pairs) >= CHUNK_SIZE:
+                yield np.array(pairs, dtype=np.int64)
+                pairs = []
+        if pairs:
+            yield np.array(pairs, dtype=np.int64)
+        if store is not None:
+            yield from _store_edges(store, rows, _value_nodes(store, vertices), len(vertices))
+
+    store = graph.store
+    if store is None:
+        names = StringColumn([graph.song_ids.get(vertex.item) if isinstance(vertex, SongVertex) else None
+                              for vertex in vertices])
+        return NodeTable(kinds, items, values, names), edge_chunks
+
+    rows = np.setdiff1d(np.arange(len(store)), np.array(store.removed_rows(), dtype=np.int64))
+    song_ids = store.ids.take(rows)
+    items = StringTable.from_arrays(np.concatenate((items.buffer, song_ids.buffer)), np.concatenate((
+        items.offsets, song_ids.offsets[1:] + items.offsets[-1])), index=False)
+    nodes = NodeTable(np.concatenate((kinds, np.full(len(rows), SONG, dtype=np.int8))), items,
+                      np.concatenate((values, np.full(len(rows), math.nan))),
+                      StringColumn.from_arrays(store.names.table, np.concatenate((
+                          np.full(len(vertices), -1, dtype=np.int32), store.names.codes[rows]))),
+                      store.feature_types, store.resolution, store.weights, store.values[rows])
+    return nodes, edge_chunks
+
+
+def _value_nodes(store: SongStore, vertices: list[Vertex]) -> np.ndarray:
+    """
+    Return the (len(store.feature_types), store.missing + 1) array of the node among vertices of the value vertex
+    of each type and bin of store, or -1.
+    """
+    value_nodes = np.full((len(store.feature_types), store.missing + 1), -1, dtype=np.int64)
+    for node, vertex in enumerate(vertices):
+        if isinstance(vertex, ValueVertex) and vertex.item in store.feature_types:
+            b = store.value_to_bin(vertex.value)
+            # Songs are joined to the vertex with exactly the value of their bin, as in Graph._song_vertex.
+            if 0 <= b < store.missing and store.bin_to_value(b) == vertex.value:
+                value_nodes[store.column(vertex.item), b] = node
+    return value_nodes
+
+
+def _store_edges(store: SongStore, rows: np.ndarray, value_nodes: np.ndarray, first_node: int) -> Iterator[np.ndarray]:
+    """
+    Yield the edges between the given rows of store, numbered from first_node, and their value nodes.
+
+    Raise ValueError if a song has a value without a value vertex.
+    """
+    columns = np.arange(len(store.feature_types))
+    for start in range(0, len(rows), CHUNK_SIZE):
+        bins = store.bins[rows[start:start + CHUNK_SIZE]]
+        targets = value_nodes[columns, bins]
+        present = bins != store.missing
+        if (targets[present] < 0).any():
+            row, column = np.argwhere(present & (targets < 0))[0].tolist()
+            raise ValueError(f'song {store.ids[int(rows[start + row])]!r} has a {store.feature_types[column]} value '
+                             f'without a value vertex')
+        songs = np.broadcast_to(np.arange(first_node + start, first_node + start + len(bins))[:, np.newaxis],
+                                bins.shape)
+        yield np.column_stack((songs[present], targets[present]))
+
+
+def _export_subgraph(subgraph: RecommendationSubgraph) -> tuple[NodeTable, Callable[[], Iterator[np.ndarray]]]:
+    """
+    Return the nodes and edges of subgraph, as in _export, with the same node numbers.
+    """
+    num_songs, num_values = len(subgraph.song_names), len(subgraph.value_bins)
+    kinds = np.concatenate((np.full(num_songs, SONG, dtype=np.int8), np.full(num_values, VALUE, dtype=np.int8)))
+    nodes = NodeTable(kinds,
+                      _unindexed(subgraph.song_names + [subgraph.feature_types[vtype]
+                                                        for vtype in subgraph.value_types.tolist()]),
+                      np.concatenate((np.full(num_songs, math.nan), subgraph.value_bins / subgraph.resolution)),
+                      StringColumn.from_arrays(StringTable(), np.full(num_songs + num_values, -1, dtype=np.int32)),
+                      subgraph.feature_types, subgraph.resolution)
+    return nodes, lambda: iter([subgraph.edges.astype(np.int64)])
+
+
+def _csr(num_nodes: int, edge_chunks: Callable[[], Iterator[np.ndarray]]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the CSR adjacency (indptr, indices) of the graph with the given number of nodes and edges, listing each
+    edge from both of its nodes. The edges are gone through twice, once to count the degree of each node.
+    """
+    degrees = np.zeros(num_nodes, dtype=np.int64)
+    for chunk in edge_chunks():
+        degrees += np.bincount(chunk.ravel(), minlength=num_nodes)
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(degrees, out=indptr[1:])
+    indices = np.empty(indptr[-1], dtype=np.int32 if num_nodes < 2 ** 31 else np.int64)
+
+    cursors = indptr[:-1].copy()
+    for chunk in edge_chunks():
+        sources = np.concatenate((chunk[:, 0], chunk[:, 1]))
+        order = np.argsort(sources, kind='stable')
+        sources, targets = sources[order], np.concatenate((chunk[:, 1], chunk[:, 0]))[order]
+        # The k-th neighbour of a node in this chunk goes k places after the neighbours already placed.
+        firsts = np.flatnonzero(np.diff(sources, prepend=-1))
+        counts = np.diff(firsts, append=len(sources))
+        indices[cursors[sources] + np.arange(len(sources)) - np.repeat(firsts, counts)] = targets
+        cursors[sources[firsts]] += counts
+    return indptr, indices
+
+
+def _song_store(nodes: NodeTable, indptr: np.ndarray, indices: np.ndarray, resolution: int) -> SongStore:
+    """
+    Return the SongStore of the compact graph with the given nodes and CSR adjacency, whose row i is the i-th song
+    node (see restore).
+    """
+    feature_types, resolution, type_of, bin_of = _value_bins(nodes, resolution)
+    invalid = (type_of < 0) | (bin_of < 0) | (bin_of > resolution)
+
+    songs = np.flatnonzero(nodes.kinds == SONG)
+    song_rows, neighbours = _neighbours(indptr, indices, songs)
+    if invalid[neighbours].any():
+        first = int(np.argmax(invalid[neighbours]))
+        raise ValueError(f'song node {songs[song_rows[first]]} is joined to node {neighbours[first]}, which is not '
+                         f'a value node of one of {feature_types}')
+
+    dtype = bin_dtype(resolution)
+    bins = np.full((len(songs), len(feature_types)), np.iinfo(dtype).max, dtype=dtype)
+    bins[song_rows, type_of[neighbours]] = bin_of[neighbours]
+    # A song joined to two values of one type sets fewer bins than it has neighbours.
+    doubled = np.count_nonzero(bins != np.iinfo(dtype).max, axis=1) < np.bincount(song_rows, minlength=len(songs))
+    if doubled.any():
+        raise ValueError(f'song node {songs[np.argmax(doubled)]} is joined to two value nodes of one type')
+    return SongStore.from_arrays(feature_types, resolution, nodes.items.take(songs),
+                                 StringColumn.from_arrays(nodes.names.table, nodes.names.codes[songs]), bins,
+                                 weights=nodes.weights, values=nodes.song_values)
+
+
+def _value_bins(nodes: NodeTable, resolution: int) -> tuple[tuple[str, ...], int, np.ndarray, np.ndarray]:
+    """
+    Return the feature types and resolution of the store restored from nodes (see restore), and the column and
+    bin of each node, or -1 for a node that isn't a value node of those types.
+    """
+    value_nodes = np.flatnonzero(nodes.kinds == VALUE)
+    value_types = [nodes.items[node] for node in value_nodes.tolist()]
+    feature_types = nodes.feature_types or tuple(dict.fromkeys(value_types))
+    resolution = nodes.resolution or resolution
+    type_of = np.full(len(nodes), -1, dtype=np.int64)
+    type_of[value_nodes] = [feature_types.index(vtype) if vtype in feature_types else -1 for vtype in value_types]
+    bin_of = np.where(type_of >= 0, np.rint(np.nan_to_num(nodes.values) * resolution), -1).astype(np.int64)
+    return feature_types, resolution, type_of, bin_of
+
+
+def _neighbours(indptr: np.ndarray, indices: np.ndarray, nodes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the arrays (positions, neighbours) of every neighbour of the given nodes in the CSR adjacency, where
+    neighbours[k] is a neighbour of nodes[positions[k]].
+    """
+    starts, counts = indptr[nodes], indptr[nodes + 1] - indptr[nodes]
+    firsts = np.cumsum(counts) - counts
+    positions = np.repeat(np.arange(len(nodes)), counts)
+    return positions, indices[np.repeat(starts - firsts, counts) + np.arange(counts.sum())]
+
+
+def _restore_compact(nodes: NodeTable, store: SongStore, sources: np.ndarray, targets: np.ndarray) -> Graph:
+    """
+    Return the compact graph with the given nodes, whose song nodes are the rows of store, and whose edges between
+    lower and higher nodes are sources[i] to targets[i] (see restore).
+    """
+    graph = Graph(store)
+    for node in np.flatnonzero(nodes.kinds != SONG).tolist():
+        item = nodes.item(node)
+        graph.add_vertex(item, 'value' if nodes.kinds[node] == VALUE else None, item[1] if isinstance(item, tuple)
+                         else None)
+    others = (nodes.kinds[sources] != SONG) & (nodes.kinds[targets] != SONG)
+    for node1, node2 in zip(sources[others].tolist(), targets[others].tolist()):
+        graph.add_edge(nodes.item(node1), nodes.item(node2))
+    return graph
+
+
+def _node_rows(nodes: NodeTable, graph_number: int, start: int, stop: int) -> Iterator[tuple]:
+    """
+    Return the edge list rows of the nodes from start up to stop.
+    """
+    names_table = nodes.names.table
+    names = [names_table[code] if code >= 0 else '' for code in nodes.names.codes[start:stop].tolist()]
+    values = ['' if math.isnan(value) else repr(value) for value in nodes.values[start:stop].tolist()]
+    kinds = [KIND_NAMES[kind] for kind in nodes.kinds[start:stop].tolist()]
+    return zip(itertools.repeat(graph_number), range(start, stop), kinds, nodes.items.strings(start, stop), names,
+               values)
+
+
+def _unindexed(strings: list[str]) -> StringTable:
+    """
+    Return a table of strings without a hash index (see StringTable.from_arrays), since nodes aren't looked up
+    by item.
+    """
+    table = StringTable.from_arrays(np.zeros(0, dtype=np.uint8), np.zeros(1, dtype=np.int64), index=False)
+    table.extend(strings)
+    return table
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'argparse', 'csv', 'gc', 'gzip', 'itertools', 'math', 'operator', 'sys',
+                          'time', 'numpy', 'graph_classes', 'graph_visualization', 'graph_loaders', 'song_store',
+                          'string_table'],
+        # the names (strs) of functions that call print/open/input
+        'allowed-io': ['write_csr', 'write_edge_lists', 'read_edge_lists', 'main'],
+        'max-line-length': 120
+    })
+
+    sys.exit(main())
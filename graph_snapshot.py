@@ -0,0 +1,279 @@
+"""CSC111 Winter 2024 Project 2
+    File containing functions to save the songs of a compact graph to a binary snapshot file and load them back.
+
+    A snapshot file starts with the 8 bytes MAGIC, then the format version and the length of a JSON header as two
+    little-endian uint32s, then the header itself. The header describes the source CSV file (so a stale snapshot
+    can be detected) and the offset, dtype and shape of each array section. Sections start on ALIGNMENT byte
+    boundaries so they can be memory-mapped directly:
+        - bins: the SongStore feature bins
+        - values: the unrounded SongStore feature values
+        - ids, id_offsets: the song ids, utf-8 encoded one after the other, and their offsets (see StringTable)
+        - names, name_offsets: the distinct song names, in the same layout
+        - name_codes: the index in names of the name of each song, or -1
+        - first_rows: the row of the first song with each name, or -1 (see SongStore.first_rows)
+        - removed: the rows of removed songs (see SongStore.remove_song)
+        - index_rows, index_starts: the BinIndex of the store, empty if the store is too large to index
+
+    An AnnIndex of the same songs is saved in a separate file next to the snapshot, in the same layout but
+    starting with ANN_MAGIC, with the sections centroids, rows and starts.
+
+    Songs added, changed or removed since the snapshot was written are kept in a change log next to it (see
+    graph_delta). The header records how many entries of the log the snapshot already includes.
+"""
+from __future__ import annotations
+from typing import Optional
+import doctest
+import json
+import os
+import struct
+import numpy as np
+import python_ta
+from song_store import SongStore
+from string_table import StringColumn, StringTable
+from bin_index import BinIndex
+from ann_index import AnnIndex
+
+MAGIC = b'SONGSNAP'
+ANN_MAGIC = b'SONGANN\0'
+VERSION = 5
+ALIGNMENT = 64
+_PREFIX = struct.Struct('<8sII')
+
+
+def snapshot_path(information_file: str) -> str:
+    """
+    Return the default path of the snapshot of information_file.
+
+    >>> snapshot_path('tracks.csv')
+    'tracks.csv.snapshot'
+    """
+    return information_file + '.snapshot'
+
+
+def ann_path(information_file: str) -> str:
+    """
+    Return the default path of the saved AnnIndex of information_file.
+
+    >>> ann_path('tracks.csv')
+    'tracks.csv.ann'
+    """
+    return information_file + '.ann'
+
+
+def log_path(information_file: str) -> str:
+    """
+    Return the default path of the change log of information_file.
+
+    >>> log_path('tracks.csv')
+    'tracks.csv.log'
+    """
+    return information_file + '.log'
+
+
+def source_signature(information_file: str) -> dict[str, int]:
+    """
+    Return the size and modification time of information_file, which decide whether a snapshot is out of date.
+    """
+    stat = os.stat(information_file)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def write_snapshot(store: SongStore, index: Optional[BinIndex], path: str, information_file: str,
+                   log_entries: int = 0) -> None:
+    """
+    Write a snapshot of store and its index (if it has one) to path, recording the signature of information_file
+    and that the first log_entries entries of its change log are included. The index must have no changes left
+    to merge (see BinIndex.merge_changes).
+    """
+    sections = {
+        'bins': np.ascontiguousarray(store.bins),
+        'values': np.ascontiguousarray(store.values),
+        'ids': store.ids.buffer,
+        'id_offsets': store.ids.offsets,
+        'names': store.names.table.buffer,
+        'name_offsets': store.names.table.offsets,
+        'name_codes': store.names.codes,
+        'first_rows': store.first_rows,
+        'removed': np.array(store.removed_rows(), dtype=np.int64),
+        'index_rows': index.rows.astype(np.int64) if index is not None else np.zeros(0, dtype=np.int64),
+        'index_starts': index.starts.astype(np.int64) if index is not None else np.zeros(0, dtype=np.int64)
+    }
+    header = {
+        'source': source_signature(information_file),
+        'feature_types': list(store.feature_types),
+        'resolution': store.resolution,
+        'weights': list(store.weights),
+        'num_songs': len(store),
+        'log_entries': log_entries
+    }
+    _write_file(path, MAGIC, header, sections)
+
+
+def read_snapshot(path: str,
+                  information_file: Optional[str] = None) -> Optional[tuple[SongStore, Optional[BinIndex], int]]:
+    """
+    Return the store, index (None if it had none) and number of change log entries included saved in the
+    snapshot at path, or None if there is no usable snapshot there: the file is missing, has another format
+    version, or doesn't match the current size and modification time of information_file (when one is given).
+
+    The arrays are memory-mapped copy-on-write, so processes loading the same snapshot share its pages.
+
+    >>> import tempfile, graph_classes, graph_delta, graph_loaders
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> information_file = os.path.join(directory.name, 'songs.csv')
+    >>> with open(information_file, 'w', encoding='utf-8') as file:
+    ...     _ = file.write('id,name,danceability,energy,valence\\n')
+    >>> store = SongStore()
+    >>> store.add_rows(['a', 'b'], ['A', 'B'], np.array([[10, 20, 30], [40, 50, 60]]))
+    2
+    >>> write_snapshot(store, None, snapshot_path(information_file), information_file)
+    >>> loaded, index, log_entries = read_snapshot(snapshot_path(information_file), information_file)
+    >>> list(loaded.id_rows), loaded.get_value('b', 'energy'), index, log_entries
+    (['a', 'b'], 0.5, None, 0)
+
+    Changes appended to the log after the snapshot was written are replayed on top of it:
+
+    >>> changes = [('upsert', 'c', 'C', {'energy': 0.7}), ('remove', 'a', None, {})]
+    >>> graph_delta.append_to_log(log_path(information_file), changes, information_file)
+    >>> graph = graph_classes.Graph(loaded)
+    >>> graph_loaders.add_value_vertices(graph)
+    >>> graph_delta.replay_log(graph, log_path(information_file), information_file, log_entries)
+    2
+    >>> list(graph.store.id_rows), graph.store.get_value('c', 'energy'), graph.song_names['C']
+    (['b', 'c'], 0.7, 'c')
+
+    A snapshot of another format version is not used:
+
+    >>> with open(snapshot_path(information_file), 'r+b') as file:
+    ...     _ = file.seek(len(MAGIC))
+    ...     _ = file.write(struct.pack('<I', VERSION - 1))
+    >>> read_snapshot(snapshot_path(information_file), information_file) is None
+    True
+    >>> directory.cleanup()
+    """
+    saved = _read_file(path, MAGIC, information_file)
+    if saved is None:
+        return None
+    header, arrays = saved
+
+    ids = StringTable.from_arrays(arrays['ids'], arrays['id_offsets'])
+    names = StringColumn.from_arrays(StringTable.from_arrays(arrays['names'], arrays['name_offsets']),
+                                     arrays['name_codes'])
+    store = SongStore.from_arrays(header['feature_types'], header['resolution'], ids, names, arrays['bins'],
+                                  arrays['first_rows'], header['weights'], arrays['removed'].tolist(),
+                                  arrays['values'])
+    if len(arrays['index_starts']) == 0:
+        return store, None, header['log_entries']
+    return store, BinIndex.from_arrays(store, arrays['index_rows'], arrays['index_starts']), header['log_entries']
+
+
+def write_ann_index(index: AnnIndex, path: str, information_file: str) -> None:
+    """
+    Write index to path, recording the signature of information_file.
+    """
+    header = {
+        'source': source_signature(information_file),
+        'num_songs': len(index.store),
+        'probes': index.probes,
+        'weighted': index.weighted
+    }
+    _write_file(path, ANN_MAGIC, header, {'centroids': index.centroids, 'rows': index.rows.astype(np.int64),
+                                          'starts': index.starts.astype(np.int64)})
+
+
+def read_ann_index(path: str, store: SongStore, information_file: Optional[str] = None) -> Optional[AnnIndex]:
+    """
+    Return the AnnIndex of store saved at path, or None if there is no usable one there: as for read_snapshot,
+    or if it was saved for a store with another number of songs.
+    """
+    saved = _read_file(path, ANN_MAGIC, information_file)
+    if saved is None or saved[0]['num_songs'] != len(store):
+        return None
+    header, arrays = saved
+    return AnnIndex.from_arrays(store, arrays['centroids'], arrays['rows'], arrays['starts'], header['probes'],
+                                header['weighted'])
+
+
+def _write_file(path: str, magic: bytes, header: dict, sections: dict[str, np.ndarray]) -> None:
+    """
+    Write a file starting with magic, with the given header and array sections, to path.
+
+    The file is written under a temporary name and then renamed, so other processes never see half a file.
+    """
+    header['sections'] = {}
+
+    # The header holds the section offsets, which depend on the header length, so measure it with offsets
+    # at least as long as the real ones first.
+    for name, array in sections.items():
+        header['sections'][name] = {'offset': 10 ** 15, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+    offset = _align(_PREFIX.size + len(json.dumps(header).encode('utf-8')))
+    for name, array in sections.items():
+        header['sections'][name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        offset = _align(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(_PREFIX.pack(magic, VERSION, len(header_bytes)))
+        file.write(header_bytes)
+        for name, array in sections.items():
+            file.seek(header['sections'][name]['offset'])
+            file.write(array.tobytes())
+        file.truncate(offset)
+    os.replace(temp_path, path)
+
+
+def _read_file(path: str, magic: bytes,
+               information_file: Optional[str]) -> Optional[tuple[dict, dict[str, np.ndarray]]]:
+    """
+    Return the header and memory-mapped array sections of the file at path, or None if it is missing, doesn't
+    start with magic, has another format version, or doesn't match information_file (when one is given).
+    """
+    header = _read_header(path, magic)
+    if header is None or (information_file is not None and header['source'] != source_signature(information_file)):
+        return None
+
+    arrays = {}
+    for name, section in header['sections'].items():
+        shape = tuple(section['shape'])
+        if 0 in shape:
+            arrays[name] = np.zeros(shape, dtype=section['dtype'])
+        else:
+            arrays[name] = np.memmap(path, dtype=section['dtype'], mode='c', offset=section['offset'], shape=shape)
+    return header, arrays
+
+
+def _read_header(path: str, magic: bytes = MAGIC) -> Optional[dict]:
+    """
+    Return the header of the file at path, or None if it is missing, doesn't start with magic or is not of the
+    current format version.
+    """
+    try:
+        with open(path, 'rb') as file:
+            found, version, header_length = _PREFIX.unpack(file.read(_PREFIX.size))
+            if found != magic or version != VERSION:
+                return None
+            return json.loads(file.read(header_length).decode('utf-8'))
+    except (OSError, struct.error, ValueError):
+        return None
+
+
+def _align(offset: int) -> int:
+    """
+    Return the smallest multiple of ALIGNMENT that is at least offset.
+
+    >>> _align(65)
+    128
+    """
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'json', 'os', 'struct', 'numpy', 'song_store', 'string_table', 'bin_index',
+                          'ann_index'],
+        'allowed-io': ['_write_file', '_read_header'],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 120
+    })
@@ -0,0 +1,288 @@
+"""CSC111 Winter 2024 Project 2
+    File containing the RecommendationSubgraph class, the part of a graph shown for a recommendation, the
+    function that builds it, and the SubgraphLayout class that decides where its nodes are drawn.
+"""
+from __future__ import annotations
+import doctest
+import numpy as np
+import python_ta
+import graph_classes
+import instrumentation
+
+
+class RecommendationSubgraph:
+    """
+    The subgraph shown for a recommendation: the given song, the recommended songs, and for each type, every
+    value vertex from the lowest to the highest value of those songs, with the chain of edges between them.
+    This is the graph load_visualization_graph returns, as a compact edge list.
+
+    Nodes 0 to len(song_names) - 1 are the songs (the given song first), and the rest are value vertices,
+    grouped by type in the order of feature_types and sorted by value.
+
+    Instance Attributes:
+        - song_names:
+            The names of the songs, one node each.
+        - feature_types:
+            The types of the value vertices.
+        - resolution:
+            The number of bins per unit of value.
+        - value_types:
+            The index in feature_types of the type of each value node.
+        - value_bins:
+            The bin (value times resolution) of each value node.
+        - edges:
+            A (number of edges, 2) array of the nodes joined by each edge: every edge between a song and a
+            value, then every edge between consecutive values.
+
+    Representation Invariants:
+        - len(self.value_types) == len(self.value_bins)
+        - self.edges.min() >= 0 and self.edges.max() < self.num_nodes()
+    """
+    song_names: list[str]
+    feature_types: tuple[str, ...]
+    resolution: int
+    value_types: np.ndarray
+    value_bins: np.ndarray
+    edges: np.ndarray
+
+    def __init__(self, song_names: list[str], feature_types: tuple[str, ...], resolution: int,
+                 value_types: np.ndarray, value_bins: np.ndarray, edges: np.ndarray) -> None:
+        """
+        Initialize a new subgraph with the given nodes and edges.
+        """
+        self.song_names = song_names
+        self.feature_types = feature_types
+        self.resolution = resolution
+        self.value_types = value_types
+        self.value_bins = value_bins
+        self.edges = edges
+
+    def num_nodes(self) -> int:
+        """
+        Return the number of nodes in this subgraph.
+        """
+        return len(self.song_names) + len(self.value_bins)
+
+    def value(self, node: int) -> tuple[str, float]:
+        """
+        Return the type and value of the given value node.
+        """
+        i = node - len(self.song_names)
+        return self.feature_types[self.value_types[i]], int(self.value_bins[i]) / self.resolution
+
+    def labels(self) -> list[str]:
+        """
+        Return the label of each node, as drawn by main.display_graph: the name of a song, or the type and value
+        of a value vertex.
+        """
+        return self.song_names + [f'{vtype}, {value}' for vtype, value in map(self.value, range(
+            len(self.song_names), self.num_nodes()))]
+
+    def to_graph(self) -> graph_classes.Graph:
+        """
+        Return this subgraph as a Graph, with the same vertices and edges as the original
+        load_visualization_graph.
+        """
+        graph = graph_classes.Graph()
+        items = list(self.song_names)
+        for node in range(len(self.song_names), self.num_nodes()):
+            item = self.value(node)
+            graph.add_vertex(item, 'value', item[1])
+            items.append(item)
+        for song_name in self.song_names:
+            graph.add_vertex(song_name, 'song')
+        for node1, node2 in self.edges.tolist():
+            graph.add_edge(items[node1], items[node2])
+        return graph
+
+
+class SubgraphLayout:
+    """
+    Deterministic positions for the nodes of RecommendationSubgraphs.
+
+    The values of each type lie on their own axis out from the centre, the i-th of n types at an angle of
+    90 + 360 * i / n degrees, with the value 0 at inner_radius and the value 1 at inner_radius + 1. So with three
+    types there are three axes, and every value vertex is always drawn in the same place; these positions are
+    computed once per set of types and cached.
+
+    The songs are placed inside the axes by their feature coordinates: the given song at the centre, and each
+    other song moved from it along each axis by how much its value of that type differs from the given song's.
+    These moves are scaled so the song furthest from the centre is song_radius from it, since recommended songs
+    are by design all close to the given song. Songs that would be drawn in exactly the same place are spread
+    around it.
+
+    Instance Attributes:
+        - inner_radius:
+            The distance from the centre of the value 0 of each type.
+        - song_radius:
+            The greatest distance of a song from the centre.
+        - spread:
+            The distance from their shared place of songs that would be drawn in the same place.
+
+    >>> layout = SubgraphLayout()
+    >>> (layout.value_positions(('energy', 'valence'), 2).round(2) + 0.0).tolist()
+    [[[0.0, 0.5], [0.0, 1.0], [0.0, 1.5]], [[0.0, -0.5], [0.0, -1.0], [0.0, -1.5]]]
+    """
+    inner_radius: float
+    song_radius: float
+    spread: float
+    _value_positions: dict[tuple[tuple[str, ...], int], np.ndarray]
+
+    def __init__(self, inner_radius: float = 0.5, song_radius: float = 0.4, spread: float = 0.04) -> None:
+        """
+        Initialize a new layout with no cached positions.
+        """
+        self.inner_radius = inner_radius
+        self.song_radius = song_radius
+        self.spread = spread
+        self._value_positions = {}
+
+    def value_positions(self, feature_types: tuple[str, ...], resolution: int) -> np.ndarray:
+        """
+        Return the (types, resolution + 1, 2) array of the position of each bin of each of feature_types.
+        """
+        key = (feature_types, resolution)
+        if key not in self._value_positions:
+            angles = np.pi / 2 + 2 * np.pi * np.arange(len(feature_types)) / max(len(feature_types), 1)
+            directions = np.column_stack((np.cos(angles), np.sin(angles)))
+            radii = self.inner_radius + np.arange(resolution + 1) / resolution
+            self._value_positions[key] = directions[:, np.newaxis, :] * radii[np.newaxis, :, np.newaxis]
+        return self._value_positions[key]
+
+    def positions(self, subgraph: RecommendationSubgraph) -> np.ndarray:
+        """
+        Return the (subgraph.num_nodes(), 2) array of the position of each node of subgraph.
+
+        >>> subgraph = RecommendationSubgraph(['A', 'B', 'C'], ('energy', 'valence'), 2, np.array([0, 0, 1, 1]),
+        ...                                   np.array([1, 2, 1, 2]),
+        ...                                   np.array([[0, 3], [0, 5], [1, 4], [1, 5], [2, 3], [2, 6]]))
+        >>> (SubgraphLayout().positions(subgraph).round(3) + 0.0).tolist()[:3]
+        [[0.0, 0.0], [0.0, 0.4], [0.0, -0.4]]
+        """
+        num_songs = len(subgraph.song_names)
+        positions = np.zeros((subgraph.num_nodes(), 2))
+        positions[num_songs:] = self.value_positions(subgraph.feature_types, subgraph.resolution)[
+            subgraph.value_types, subgraph.value_bins]
+
+        # Each song moves from the centre by the offset of each of its values from the given song's value of the
+        # same type; given_nodes[t] is the node of the given song's value of type t, or -1 if it has none.
+        song_edges = subgraph.edges[subgraph.edges[:, 0] < num_songs]
+        given_nodes = np.full(len(subgraph.feature_types), -1)
+        given_edges = song_edges[song_edges[:, 0] == 0, 1]
+        given_nodes[subgraph.value_types[given_edges - num_songs]] = given_edges
+        from_nodes = given_nodes[subgraph.value_types[song_edges[:, 1] - num_songs]]
+        song_edges, from_nodes = song_edges[from_nodes >= 0], from_nodes[from_nodes >= 0]
+        np.add.at(positions, song_edges[:, 0], positions[song_edges[:, 1]] - positions[from_nodes])
+        furthest = np.linalg.norm(positions[:num_songs], axis=1).max(initial=0.0)
+        if furthest > 0:
+            positions[:num_songs] *= self.song_radius / furthest
+
+        # Spread songs drawn in the same place around it, in the order they appear in subgraph.
+        _, group, sizes = np.unique(positions[:num_songs].round(6), axis=0, return_inverse=True, return_counts=True)
+        group = group.reshape(-1)
+        shared = np.flatnonzero(sizes[group] > 1)
+        if len(shared) > 0:
+            rank = np.zeros(num_songs)
+            for g in np.unique(group[shared]):
+                members = np.flatnonzero(group == g)
+                rank[members] = np.arange(len(members)) / len(members)
+            angles = 2 * np.pi * rank[shared]
+            positions[shared] += self.spread * np.column_stack((np.cos(angles), np.sin(angles)))
+        return positions
+
+
+def build_subgraph(main_graph: graph_classes.Graph, songs: list[str], given_song: str) -> RecommendationSubgraph:
+    """
+    Return the subgraph of main_graph shown for the recommendation of songs (a list of song ids, as returned by
+    recommend_songs) for given_song (a song name), in one pass over the songs' value bins.
+
+    As in load_visualization_graph, each song is a node named after it, connected to the values of the first
+    song with that name.
+
+    >>> import graph_delta
+    >>> g = graph_classes.Graph()
+    >>> for value in [0.2, 0.21, 0.22]:
+    ...     g.add_vertex(('energy', value), 'value', value)
+    >>> _ = graph_delta.upsert_song(g, '1', 'A', {'energy': 0.2})
+    >>> _ = graph_delta.upsert_song(g, '2', 'B', {'energy': 0.22})
+    >>> subgraph = build_subgraph(g, ['1', '2'], 'A')
+    >>> subgraph.labels()
+    ['A', 'B', 'energy, 0.2', 'energy, 0.21', 'energy, 0.22']
+    >>> subgraph.edges.tolist()
+    [[0, 2], [1, 4], [2, 3], [3, 4]]
+    """
+    with instrumentation.stage('build_subgraph'):
+        subgraph = _build_subgraph(main_graph, songs, given_song)
+    instrumentation.observe('build_subgraph.nodes', subgraph.num_nodes())
+    instrumentation.observe('build_subgraph.edges', len(subgraph.edges))
+    return subgraph
+
+
+def _build_subgraph(main_graph: graph_classes.Graph, songs: list[str], given_song: str) -> RecommendationSubgraph:
+    """
+    Return build_subgraph(main_graph, songs, given_song), without instrumentation.
+    """
+    song_names = [given_song]
+    for song_id in songs:
+        song_name = main_graph.get_song_by_id(song_id)
+        if song_name not in song_names:
+            song_names.append(song_name)
+    feature_types, resolution, bins = _song_bins(main_graph, song_names)
+
+    value_types, value_bins, song_edges, chain_edges = [], [], [], []
+    first_node = len(song_names)
+    for column in range(len(feature_types)):
+        present = np.flatnonzero(bins[:, column] >= 0)
+        if len(present) == 0:
+            continue
+        column_bins = bins[present, column]
+        if bins[0, column] >= 0:
+            # Every chain starts at the given song's value, so together they cover the lowest to highest value.
+            nodes = np.arange(column_bins.min(), column_bins.max() + 1)
+            chain_edges.append(first_node + np.column_stack((np.arange(len(nodes) - 1), np.arange(1, len(nodes)))))
+        else:
+            nodes = np.unique(column_bins)
+        song_edges.append(np.column_stack((present, first_node + np.searchsorted(nodes, column_bins))))
+        value_types.append(np.full(len(nodes), column))
+        value_bins.append(nodes)
+        first_node += len(nodes)
+
+    edges = np.concatenate(song_edges + chain_edges) if song_edges else np.zeros((0, 2))
+    return RecommendationSubgraph(song_names, feature_types, resolution,
+                                  np.concatenate(value_types or [np.zeros(0)]).astype(np.int32),
+                                  np.concatenate(value_bins or [np.zeros(0)]).astype(np.int32),
+                                  edges.astype(np.int32))
+
+
+def _song_bins(main_graph: graph_classes.Graph,
+               song_names: list[str]) -> tuple[tuple[str, ...], int, np.ndarray]:
+    """
+    Return the value types of main_graph, its resolution, and an array of the bin of each value of the first
+    song with each of song_names, with -1 for missing values.
+    """
+    if main_graph.store is not None:
+        store = main_graph.store
+        bins = store.bins[[store.name_rows[song_name] for song_name in song_names]].astype(np.int32)
+        bins[bins == store.missing] = -1
+        return store.feature_types, store.resolution, bins
+
+    resolution = main_graph.value_bins.resolution
+    values = [main_graph.get_song_vertex_by_name(song_name).value_vertices for song_name in song_names]
+    feature_types = tuple(dict.fromkeys(vtype for song_values in values for vtype in song_values))
+    bins = np.full((len(song_names), len(feature_types)), -1, dtype=np.int32)
+    for i, song_values in enumerate(values):
+        for column, vtype in enumerate(feature_types):
+            if vtype in song_values:
+                bins[i, column] = round(song_values[vtype].value * resolution)
+    return feature_types, resolution, bins
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'numpy', 'graph_classes', 'instrumentation'],
+        # the names (strs) of imported modules
+        'allowed-io': [],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 120
+    })
@@ -0,0 +1,435 @@
+"""CSC111 Winter 2024 Project 2
+    File containing the opt-in instrumentation of the graph: timers, counters and histograms of the stages of
+    load_graph, recommend_songs and the visualization subgraph build, and a hook to profile single queries.
+
+    Instrumentation is off until enable() is called, and collects into one module-level Metrics. While it is off,
+    stage() returns one shared object that does nothing, and count() and observe() return at once, so the
+    instrumented code costs about a function call per stage. The collected metrics can be written out as a JSON
+    snapshot with export_json().
+"""
+from __future__ import annotations
+from typing import Any, Callable, Optional
+import cProfile
+import doctest
+import json
+import math
+import threading
+import time
+import python_ta
+
+
+class Histogram:
+    """
+    A histogram of non-negative values, in buckets of powers of two: a value v is counted in the smallest bucket
+    2 ** e with v <= 2 ** e, and values of 0 in the bucket 0.
+
+    Instance Attributes:
+        - count:
+            The number of values observed.
+        - total:
+            The sum of the values observed.
+        - minimum:
+            The smallest value observed, or None if there were none.
+        - maximum:
+            The largest value observed, or None if there were none.
+
+    >>> h = Histogram()
+    >>> for value in [0, 1, 3, 3, 10]:
+    ...     h.observe(value)
+    >>> h.buckets()
+    {0.0: 1, 1.0: 1, 4.0: 2, 16.0: 1}
+    >>> h.quantile(0.5), h.quantile(0.99)
+    (4.0, 10)
+    """
+    count: int
+    total: float
+    minimum: Optional[float]
+    maximum: Optional[float]
+    _buckets: dict[int, int]
+
+    def __init__(self) -> None:
+        """
+        Initialize a new histogram of no values.
+        """
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self._buckets = {}
+
+    def observe(self, value: float) -> None:
+        """
+        Count value in this histogram.
+        """
+        exponent = math.ceil(math.log2(value)) if value > 0 else None
+        self._buckets[exponent] = self._buckets.get(exponent, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def buckets(self) -> dict[float, int]:
+        """
+        Return the number of values in each non-empty bucket, by the bucket's upper bound, in increasing order.
+        """
+        ordered = sorted(self._buckets.items(), key=lambda item: -math.inf if item[0] is None else item[0])
+        return {0.0 if exponent is None else 2.0 ** exponent: n for exponent, n in ordered}
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Return an upper bound of the q-th quantile (0 <= q <= 1) of the values: the upper bound of the bucket it
+        is in, or the largest value if that is smaller. Return None if there were no values.
+        """
+        if self.count == 0:
+            return None
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for upper, n in self.buckets().items():
+            seen += n
+            if seen >= rank:
+                return min(upper, self.maximum)
+        return self.maximum
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Return a summary of this histogram that can be written as JSON.
+        """
+        return {'count': self.count, 'total': self.total, 'min': self.minimum, 'max': self.maximum,
+                'mean': self.total / self.count if self.count else None,
+                'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99),
+                'buckets': {repr(upper): n for upper, n in self.buckets().items()}}
+
+
+class Metrics:
+    """
+    The counters, timers and histograms collected while instrumentation is enabled. A timer is a histogram of the
+    durations, in milliseconds, of a stage.
+
+    Instance Attributes:
+        - counters:
+            The value of each counter, by name.
+        - timers:
+            The histogram of the durations of each stage, by name.
+        - histograms:
+            The histogram of each other kind of value observed, by name.
+        - profiles:
+            The profilers attached to queries by profile_queries, in the order the queries ran.
+        - enabled:
+            Whether the functions of this module (stage, count, ...) collect into these metrics. Only the
+            module's own metrics (see enable) are ever enabled.
+
+    >>> metrics = Metrics()
+    >>> metrics.count('recommend_songs.calls')
+    >>> metrics.record_time('recommend_songs', 1.5)
+    >>> metrics.snapshot()['counters']
+    {'recommend_songs.calls': 1}
+    >>> metrics.snapshot()['timers_ms']['recommend_songs']['max']
+    1.5
+    """
+    counters: dict[str, int]
+    timers: dict[str, Histogram]
+    histograms: dict[str, Histogram]
+    profiles: list[Any]
+    enabled: bool
+    _lock: threading.Lock
+    _profiler_factories: list[Callable[[], Any]]
+
+    def __init__(self) -> None:
+        """
+        Initialize new, empty metrics.
+        """
+        self.counters = {}
+        self.timers = {}
+        self.histograms = {}
+        self.profiles = []
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._profiler_factories = []
+
+    def start(self) -> None:
+        """
+        Forget every metric collected so far, and enable these metrics. self.profiles is emptied in place, so
+        the list returned by profile_queries stays the one profilers are added to.
+        """
+        with self._lock:
+            self.counters = {}
+            self.timers = {}
+            self.histograms = {}
+            self.profiles.clear()
+            self._profiler_factories = []
+            self.enabled = True
+
+    def stop(self) -> None:
+        """
+        Disable these metrics, keeping the metrics collected so far.
+        """
+        self.enabled = False
+
+    def count(self, name: str, n: int = 1) -> None:
+        """
+        Add n to the counter with the given name.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Count value in the histogram with the given name.
+        """
+        with self._lock:
+            self.histograms.setdefault(name, Histogram()).observe(value)
+
+    def record_time(self, name: str, milliseconds: float) -> None:
+        """
+        Count a duration of the stage with the given name.
+        """
+        with self._lock:
+            self.timers.setdefault(name, Histogram()).observe(milliseconds)
+
+    def profile_queries(self, num_queries: int = 1, factory: Callable[[], Any] = cProfile.Profile) -> None:
+        """
+        Run each of the next num_queries queries (see query) under a new profiler made by factory, and add the
+        profilers to self.profiles.
+
+        factory may return any context manager that profiles the code run inside it, such as a cProfile.Profile
+        (the default, whose results can be read with pstats) or a sampling profiler.
+        """
+        with self._lock:
+            self._profiler_factories = [factory] * num_queries
+
+    def next_profiler(self) -> Optional[Any]:
+        """
+        Return the profiler to run the next query under, and add it to self.profiles, or return None if no
+        more queries are to be profiled.
+        """
+        with self._lock:
+            if not self._profiler_factories:
+                return None
+            profiler = self._profiler_factories.pop()()
+            self.profiles.append(profiler)
+            return profiler
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Return all the metrics collected so far, as a dict that can be written as JSON.
+        """
+        with self._lock:
+            return {'counters': dict(sorted(self.counters.items())),
+                    'timers_ms': {name: self.timers[name].to_dict() for name in sorted(self.timers)},
+                    'histograms': {name: self.histograms[name].to_dict() for name in sorted(self.histograms)},
+                    'profiled_queries': len(self.profiles)}
+
+
+class _Stage:
+    """
+    A context manager that records the time taken by the code inside it as a duration of the given stage.
+    """
+    _metrics: Metrics
+    _name: str
+    _start: float
+
+    def __init__(self, metrics: Metrics, name: str) -> None:
+        """
+        Initialize a new stage recording its durations into metrics.
+        """
+        self._metrics = metrics
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self) -> _Stage:
+        """
+        Start timing this stage.
+        """
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """
+        Record the time since this stage was entered.
+        """
+        self._metrics.record_time(self._name, (time.perf_counter() - self._start) * 1000)
+
+
+class _Query(_Stage):
+    """
+    A stage that is also run under a profiler, if the metrics have one for it (see Metrics.profile_queries).
+    """
+    _profiler: Optional[Any]
+
+    def __init__(self, metrics: Metrics, name: str) -> None:
+        """
+        Initialize a new query stage recording its durations into metrics.
+        """
+        super().__init__(metrics, name)
+        self._profiler = None
+
+    def __enter__(self) -> _Query:
+        """
+        Start the next profiler of the metrics, if there is one, and start timing this stage.
+        """
+        self._profiler = self._metrics.next_profiler()
+        if self._profiler is not None:
+            self._profiler.__enter__()
+        return super().__enter__()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """
+        Record the time since this stage was entered, and stop its profiler.
+        """
+        super().__exit__(*exc_info)
+        if self._profiler is not None:
+            self._profiler.__exit__(*exc_info)
+
+
+class _NoStage:
+    """
+    The context manager stage and query return while instrumentation is disabled, which does nothing.
+    """
+
+    def __enter__(self) -> _NoStage:
+        """
+        Do nothing.
+        """
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """
+        Do nothing.
+        """
+        return None
+
+
+_NO_STAGE = _NoStage()
+
+# The metrics collected by this module, while they are enabled.
+_METRICS = Metrics()
+
+
+def enable() -> Metrics:
+    """
+    Start collecting metrics anew, and return the metrics they are collected into. The metrics of an earlier
+    enable() are the same object, so they are forgotten; keep a snapshot() of them to compare runs.
+
+    >>> metrics = enable()
+    >>> with stage('load_graph.read'):
+    ...     count('load_graph.songs', 3)
+    >>> disable() is metrics
+    True
+    >>> metrics.counters, metrics.timers['load_graph.read'].count
+    ({'load_graph.songs': 3}, 1)
+    >>> with stage('load_graph.read'):
+    ...     count('load_graph.songs', 3)
+    >>> metrics.counters
+    {'load_graph.songs': 3}
+    """
+    _METRICS.start()
+    return _METRICS
+
+
+def disable() -> Optional[Metrics]:
+    """
+    Stop collecting metrics, and return the metrics collected, or None if instrumentation was not enabled.
+    """
+    if not _METRICS.enabled:
+        return None
+    _METRICS.stop()
+    return _METRICS
+
+
+def get_metrics() -> Optional[Metrics]:
+    """
+    Return the metrics being collected, or None if instrumentation is disabled.
+    """
+    return _METRICS if _METRICS.enabled else None
+
+
+def stage(name: str) -> Any:
+    """
+    Return a context manager that times the code inside it as a duration of the stage with the given name.
+    """
+    if not _METRICS.enabled:
+        return _NO_STAGE
+    return _Stage(_METRICS, name)
+
+
+def query(name: str) -> Any:
+    """
+    Return stage(name), which also runs the code inside it under a profiler if one was asked for with
+    profile_queries.
+    """
+    if not _METRICS.enabled:
+        return _NO_STAGE
+    return _Query(_METRICS, name)
+
+
+def count(name: str, n: int = 1) -> None:
+    """
+    Add n to the counter with the given name.
+    """
+    if _METRICS.enabled:
+        _METRICS.count(name, n)
+
+
+def observe(name: str, value: float) -> None:
+    """
+    Count value in the histogram with the given name.
+    """
+    if _METRICS.enabled:
+        _METRICS.observe(name, value)
+
+
+def profile_queries(num_queries: int = 1, factory: Callable[[], Any] = cProfile.Profile) -> list[Any]:
+    """
+    Enable instrumentation if it isn't, run the next num_queries queries under new profilers made by factory
+    (see Metrics.profile_queries), and return the list the profilers will be added to. The next enable()
+    empties it.
+
+    >>> import pstats, graph_classes, graph_delta
+    >>> g = graph_classes.Graph()
+    >>> g.add_vertex(('energy', 0.5), 'value', 0.5)
+    >>> _ = graph_delta.upsert_song(g, '1', 'A', {'energy': 0.5})
+    >>> profiles = profile_queries()
+    >>> g.recommend_songs('A', 1)
+    ['1']
+    >>> _ = pstats.Stats(profiles[0])
+    >>> metrics = disable()
+    >>> len(profiles), metrics.counters['recommend_songs.calls']
+    (1, 1)
+    """
+    if not _METRICS.enabled:
+        enable()
+    _METRICS.profile_queries(num_queries, factory)
+    return _METRICS.profiles
+
+
+def export_json(path: str) -> dict[str, Any]:
+    """
+    Write a snapshot of the metrics collected so far to the JSON file at path, and return it. After disable(),
+    these are the metrics collected until then.
+
+    >>> import os, tempfile
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> _ = enable()
+    >>> count('load_graph.songs', 3)
+    >>> _ = disable()
+    >>> export_json(os.path.join(directory.name, 'metrics.json'))['counters']
+    {'load_graph.songs': 3}
+    >>> directory.cleanup()
+    """
+    snapshot = _METRICS.snapshot()
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(snapshot, file, indent=2)
+    return snapshot
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'cProfile', 'json', 'math', 'threading', 'time'],
+        # the names (strs) of imported modules
+        'allowed-io': ['export_json'],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 120
+    })
@@ -0,0 +1,137 @@
+"""CSC111 Winter 2024 Project 2
+    File containing a load generator for the recommendation service: it sends /recommend requests to a running
+    RecommendationService from many connections at once and reports the latency and throughput.
+
+        python recommendation_service.py spotify_songs.csv --port 8111
+        python load_generator.py spotify_songs.csv --port 8111 --requests 5000 --concurrency 32
+
+    The songs asked about are picked at random from the CSV file, so a few of them repeat, as with real users.
+"""
+from __future__ import annotations
+from typing import Any, Optional
+import argparse
+import asyncio
+import csv
+import doctest
+import itertools
+import json
+import random
+import sys
+import time
+from urllib.parse import urlencode
+import python_ta
+from recommendation_service import fetch_json
+
+
+async def run_load(host: str, port: int, song_names: list[str], num_requests: int, concurrency: int,
+                   limit: int = 10, method: Optional[str] = None, order: Optional[str] = None) -> dict[str, Any]:
+    """
+    Send num_requests /recommend requests for song_names (in turn) to the service at host and port, over
+    concurrency connections each sending one request at a time, and return the report of summarise.
+    """
+    targets = itertools.cycle([f'/recommend?{urlencode(_parameters(name, limit, method, order))}'
+                               for name in song_names])
+    remaining = iter(range(num_requests))
+    latencies, statuses = [], {}
+
+    async def client() -> None:
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for _ in remaining:
+                start = time.perf_counter()
+                status, _ = await fetch_json(reader, writer, next(targets))
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return summarise(latencies, time.perf_counter() - start, statuses)
+
+
+def summarise(latencies: list[float], elapsed: float, statuses: dict[int, int]) -> dict[str, Any]:
+    """
+    Return the report of a load run: the number of requests, the requests per second, the 50th and 99th
+    percentile and the largest latency in milliseconds, and the number of responses with each status.
+
+    >>> report = summarise([0.001] * 99 + [0.1], 0.5, {200: 100})
+    >>> report['requests_per_second'], report['p50_ms'], report['p99_ms'], report['max_ms'], report['statuses']
+    (200.0, 1.0, 1.0, 100.0, {'200': 100})
+    """
+    ordered = sorted(latencies)
+    if not ordered:
+        return {'requests': 0, 'requests_per_second': 0.0, 'p50_ms': None, 'p99_ms': None, 'max_ms': None,
+                'statuses': {}}
+    return {'requests': len(ordered), 'requests_per_second': round(len(ordered) / elapsed, 1),
+            'p50_ms': round(_percentile(ordered, 0.5) * 1000, 3),
+            'p99_ms': round(_percentile(ordered, 0.99) * 1000, 3),
+            'max_ms': round(ordered[-1] * 1000, 3), 'statuses': {str(status): n for status, n in statuses.items()}}
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    """
+    Return the q-th percentile (0 <= q <= 1) of the non-empty sorted list ordered, by the nearest rank.
+    """
+    return ordered[max(0, min(len(ordered) - 1, round(q * len(ordered)) - 1))]
+
+
+def _parameters(song_name: str, limit: int, method: Optional[str], order: Optional[str] = None) -> dict[str, Any]:
+    """
+    Return the query parameters of a /recommend request.
+    """
+    parameters = {'song': song_name, 'limit': limit}
+    if method is not None:
+        parameters['method'] = method
+    if order is not None:
+        parameters['order'] = order
+    return parameters
+
+
+def sample_song_names(information_file: str, num_songs: int, seed: int = 111) -> list[str]:
+    """
+    Return num_songs song names picked at random (with replacement) from the CSV file information_file.
+    """
+    with open(information_file, encoding='utf-8', newline='') as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        names = [row[1] for row in reader]
+    return random.Random(seed).choices(names, k=num_songs)
+
+
+def main(arguments: Optional[list[str]] = None) -> int:
+    """
+    Run the load described on the command line, print its report as JSON and return the exit status: 1 if any
+    request failed.
+    """
+    parser = argparse.ArgumentParser(description='Measure the latency and throughput of the recommendation service.')
+    parser.add_argument('information_file', help='the CSV file the service was started with')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8111)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--songs', type=int, default=500, help='the number of (random) songs asked about')
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--method', default=None)
+    parser.add_argument('--order', default=None)
+    options = parser.parse_args(arguments)
+
+    song_names = sample_song_names(options.information_file, options.songs)
+    report = asyncio.run(run_load(options.host, options.port, song_names, options.requests, options.concurrency,
+                                  options.limit, options.method, options.order))
+    print(json.dumps(report, indent=2))
+    return 0 if set(report['statuses']) <= {'200'} else 1
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'argparse', 'asyncio', 'csv', 'itertools', 'json', 'random', 'sys',
+                          'time', 'urllib.parse', 'recommendation_service'],
+        # the names (strs) of imported modules
+        'allowed-io': ['sample_song_names', 'main'],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 120
+    })
+
+    sys.exit(main())
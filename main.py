@@ -5,54 +5,79 @@
     File contains user interface and main block
 """
 from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+import gc
+import threading
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-import networkx as nx
+from matplotlib.collections import LineCollection
+import numpy as np
 import python_ta
 import graph_classes
 import graph_loaders
+import graph_visualization
+
+# How often, in milliseconds, the Tk main loop checks whether the worker thread has finished.
+POLL_MS = 50
+
+# How many song names are suggested as the user types.
+SUGGESTIONS = 8
 
 
 # visualizing the graph
-def display_graph(g: graph_classes.Graph = None) -> None:
+def display_graph(subgraph: graph_visualization.RecommendationSubgraph = None) -> None:
     """
     Display the graph in the Tkinter window.
+
+    The figure, its nodes, edges and labels are created once and then updated in place: node positions come from
+    layout, which draws each value vertex in the same place for every query, so only the labels of nodes that
+    appear, move or disappear change between queries.
     """
-    global figure, canvas, toolbar
+    global figure, canvas, toolbar, nodes, edges
 
-    if canvas is not None:
-        figure.clear()
-    else:
+    if canvas is None:
         figure = plt.figure(figsize=(15, 8))
         canvas = FigureCanvasTkAgg(figure, master=graph_frame)
+        ax = figure.add_subplot()
+        ax.set_axis_off()
+        ax.set_aspect('equal')
+        limit = layout.inner_radius + 1.2
+        ax.set_xlim(-limit, limit)
+        ax.set_ylim(-limit, limit)
+        edges = ax.add_collection(LineCollection([], colors='lightgray', linewidths=1, alpha=0.5, zorder=1))
+        nodes = ax.scatter([], [], s=500, alpha=0.5, zorder=2)
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
-    ax = figure.add_subplot()
-    values = ['danceability', 'energy', 'valence']
-    node_colors = []
-
-    if g is None:
-        vis = nx.Graph()
-        vis.add_node("No data available")
+    if subgraph is None:
+        keys, labels, positions = ["No data available"], ["No data available"], np.zeros((1, 2))
+        node_colors = ['blue']
+        edges.set_segments([])
     else:
-        vis = nx.Graph()
-        for edge in g.get_edges():
-            node1, node2 = edge_values(edge)
-            vis.add_edge(node1, node2)
-
-        for node in vis.nodes:
-            if any(value in node for value in values):
-                node_colors.append('green')
-            else:
-                node_colors.append('blue')
-
-    pos = nx.random_layout(vis)
-    nx.draw(vis, ax=ax, pos=pos, with_labels=True, node_size=500, font_size=10,
-            node_color=node_colors, edge_color='lightgray', width=1, alpha=0.5)
-    canvas.draw()
-    canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        keys, positions = subgraph.labels(), layout.positions(subgraph)
+        num_songs = len(subgraph.song_names)
+        node_colors = ['blue'] * num_songs + ['green'] * (len(keys) - num_songs)
+        edges.set_segments(positions[subgraph.edges])
+        # The axis shows the type of a value, so values are labelled by the value alone, and only at the ends of
+        # each chain and for the given song.
+        labelled = np.zeros(len(keys), dtype=bool)
+        labelled[:num_songs] = True
+        labelled[subgraph.edges[subgraph.edges[:, 0] == 0, 1]] = True
+        chain_ends = np.flatnonzero(np.diff(subgraph.value_types, prepend=-1, append=-1) != 0)
+        labelled[num_songs + chain_ends[:-1]] = True
+        labelled[num_songs + chain_ends[1:] - 1] = True
+        labels = subgraph.song_names + [str(subgraph.value(node)[1]) if labelled[node] else ''
+                                        for node in range(num_songs, len(keys))]
+        if subgraph.feature_types not in axis_artists:
+            show_axes(subgraph.feature_types, subgraph.resolution)
+
+    nodes.set_offsets(positions)
+    nodes.set_facecolor(node_colors)
+    update_labels(keys, labels, positions)
+    canvas.draw_idle()
 
     if toolbar is None:
         toolbar = NavigationToolbar2Tk(canvas, graph_frame)
@@ -62,62 +87,214 @@ def display_graph(g: graph_classes.Graph = None) -> None:
         toolbar.update()
 
 
-def edge_values(edge: tuple) -> tuple:
+def update_labels(keys: list[str], labels: list[str], positions: np.ndarray) -> None:
+    """
+    Show each of labels at its position, reusing the text of the labels with the same key already shown and
+    removing the rest. Empty labels are not shown.
     """
-    Helper function for load_graph, returns edge values dependent on what position is a ValueVertex
+    shown = {}
+    for key, label, (x, y) in zip(keys, labels, positions.tolist()):
+        if label == '':
+            continue
+        text = node_labels.pop(key, None)
+        if text is None:
+            text = nodes.axes.text(x, y, label, fontsize=10, ha='center', va='center', zorder=3)
+        elif text.get_position() != (x, y):
+            text.set_position((x, y))
+        shown[key] = text
+    for text in node_labels.values():
+        text.remove()
+    node_labels.clear()
+    node_labels.update(shown)
+
+
+def show_axes(feature_types: tuple[str, ...], resolution: int) -> None:
+    """
+    Draw the axis of each of feature_types and label its outer end with its name, replacing the axes of any
+    other types.
+    """
+    for texts in axis_artists.values():
+        for text in texts:
+            text.remove()
+    axis_artists.clear()
+    value_positions = layout.value_positions(feature_types, resolution)
+    ends = value_positions[:, -1] * 1.08
+    axis_artists[feature_types] = [nodes.axes.text(x, y, vtype, fontsize=12, fontweight='bold', ha='center',
+                                                   va='center', zorder=3)
+                                   for vtype, (x, y) in zip(feature_types, ends.tolist())]
+    axis_artists[feature_types].append(nodes.axes.add_collection(LineCollection(
+        value_positions[:, [0, -1]], colors='whitesmoke', linewidths=3, zorder=0)))
+
+
+def load_main_graph(information_file: str) -> graph_classes.Graph:
+    """
+    Load the graph of information_file, enable its recommendation cache and build its song name search index.
+    This runs on the worker thread.
+    """
+    loaded = graph_loaders.load_graph(information_file, snapshot=True)
+    loaded.enable_cache()
+    loaded.get_search_index()
+    # Everything loaded lives until the window closes; keep garbage collection from scanning it on every pass.
+    gc.freeze()
+    return loaded
+
+
+def update_suggestions(*_) -> None:
+    """
+    Show the song names matching what is typed in the entry box, once the graph has finished loading. Names that
+    several songs share show how many.
+    """
+    suggestion_listbox.delete(0, tk.END)
+    suggested_names.clear()
+    if not graph_future.done() or graph_future.exception() is not None:
+        return
+    main_graph = graph_future.result()
+    for name in main_graph.search_song_names(song_var.get(), SUGGESTIONS):
+        count = len(main_graph.song_ids_named(name))
+        suggestion_listbox.insert(tk.END, name if count == 1 else f'{name} ({count} songs)')
+        suggested_names.append(name)
+
+
+def choose_suggestion(_) -> None:
+    """
+    Put the song name selected in the suggestion list into the entry box.
+    """
+    selection = suggestion_listbox.curselection()
+    if selection:
+        song_var.set(suggested_names[selection[0]])
+        song_entry.icursor(tk.END)
+
+
+def find_recommendations(song_name: str, num_recommendations: int, cancelled: threading.Event) \
+        -> Optional[tuple[list[str], graph_visualization.RecommendationSubgraph]]:
     """
+    Return the names of the songs recommended for song_name and the subgraph to display, or None if there is no
+    song named song_name. This runs on the worker thread, once the graph has finished loading.
 
-    if isinstance(edge[0], graph_classes.ValueVertex) and isinstance(edge[1], graph_classes.ValueVertex):
-        node1 = f'{edge[0].item}, {edge[0].value}'
-        node2 = f'{edge[1].item}, {edge[1].value}'
-    elif isinstance(edge[0], graph_classes.ValueVertex):
-        node1 = f'{edge[0].item}, {edge[0].value}'
-        node2 = edge[1].item
-    elif isinstance(edge[1], graph_classes.ValueVertex):
-        node1 = edge[0].item
-        node2 = f'{edge[1].item}, {edge[1].value}'
+    Once cancelled is set, the query stops before its next stage and returns None.
+    """
+    main_graph = graph_future.result()
+    if cancelled.is_set() or not main_graph.does_song_name_exist(song_name):
+        return None
+    graph_data = main_graph.recommend_songs(song_name, num_recommendations, 'index', order='refined')
+    if cancelled.is_set():
+        return None
+    names = [main_graph.get_song_by_id(song) for song in graph_data if song in main_graph.song_ids]
+    return names, graph_visualization.build_subgraph(main_graph, graph_data, song_name)
+
+
+def show_busy(message: str) -> None:
+    """
+    Show message in the status bar and start the progress indicator.
+    """
+    status_var.set(message)
+    progress_bar.start(10)
+
+
+def show_idle(message: str) -> None:
+    """
+    Show message in the status bar and stop the progress indicator.
+    """
+    progress_bar.stop()
+    status_var.set(message)
+
+
+def finish_loading() -> None:
+    """
+    Report once the graph has finished loading; until then, check again every POLL_MS milliseconds.
+    """
+    if not graph_future.done():
+        root.after(POLL_MS, finish_loading)
+    elif graph_future.exception() is not None:
+        show_idle(f'Could not load the songs: {graph_future.exception()}')
     else:
-        node1 = edge[0].item
-        node2 = edge[1].item
-    return (node1, node2)
+        update_suggestions()
+        if query is None:
+            show_idle('Songs loaded')
 
 
 def submission_of_user() -> None:
     """
-    Handle the submit action: generate graph data based on user input and display the graph.
+    Handle the submit action: generate graph data based on user input on the worker thread, and display it once
+    it is ready. A query from an earlier submit is cancelled: it never starts if it is still waiting, and stops
+    before its next stage if it is running. Its result is never shown.
     """
-    song_name = song_entry.get()
-    num_recommendations = int(limit_var.get())
+    global query, query_cancelled
 
-    if graph.does_song_name_exist(song_name):
-        graph_data = graph.recommend_songs(song_name, num_recommendations)
-        recommendation_graph = graph_loaders.load_visualization_graph(graph, graph_data, song_name)
+    if query is not None:
+        query.cancel()
+        query_cancelled.set()
+        query = None
+        query_cancelled = None
+    if graph_future.done() and graph_future.exception() is not None:
+        tk.messagebox.showwarning(title='Error', message="The songs could not be loaded")
+        return
 
-        display_graph(recommendation_graph)
+    song_name = song_var.get()
+    query_cancelled = threading.Event()
+    query = worker.submit(find_recommendations, song_name, int(limit_var.get()), query_cancelled)
+    show_busy('Finding recommendations...' if graph_future.done() else 'Loading songs...')
+    root.after(POLL_MS, finish_query, query, song_name)
 
-        song_listbox.delete(0, tk.END)
 
-        for song in graph_data:
-            if song in graph.song_ids:
-                song_listbox.insert(tk.END, graph.get_song_by_id(song))
+def finish_query(submitted: Future, song_name: str) -> None:
+    """
+    Display the result of the submitted query for song_name once it is ready, unless another query was
+    submitted since.
+    """
+    global query
+
+    if submitted is not query:
+        return
+    if not submitted.done():
+        root.after(POLL_MS, finish_query, submitted, song_name)
+        return
+    query = None
+
+    if submitted.exception() is not None:
+        show_idle('')
+        tk.messagebox.showwarning(title='Error', message=f"Could not recommend songs: {submitted.exception()}")
+    elif submitted.result() is None:
+        show_idle('')
+        close_matches = graph_future.result().search_song_names(song_name, 3)
+        hint = '\nDid you mean: ' + ', '.join(close_matches) + '?' if close_matches else ''
+        tk.messagebox.showwarning(title='Error', message="Song not in data base" + hint)
     else:
-        tk.messagebox.showwarning(title='Error', message="Song not in data base")
+        names, subgraph = submitted.result()
+        display_graph(subgraph)
+
+        song_listbox.delete(0, tk.END)
+
+        for name in names:
+            song_listbox.insert(tk.END, name)
+        show_idle(f'{len(names)} songs found')
 
 
 if __name__ == '__main__':
     python_ta.check_all(config={
-        'extra-imports': ['tkinter', 'matplotlib.pyplot', 'matplotlib.backends.backend_tkagg',
-                          'networkx', 'graph_loaders', 'graph_classes'],
+        'extra-imports': ['annotations', 'concurrent.futures', 'gc', 'threading', 'tkinter', 'matplotlib.pyplot',
+                          'matplotlib.backends.backend_tkagg', 'matplotlib.collections', 'numpy', 'graph_classes',
+                          'graph_loaders', 'graph_visualization'],
         'allowed-io': [],  # the names (strs) of functions that call print/open/input
         'max-line-length': 120
     })
 
-    # create graph
-    graph = graph_loaders.load_graph("tracks_features_one_million_necessary_columns.csv")
+    # load the graph on a worker thread, so the window is usable while it loads; queries run on the same
+    # thread, one at a time, after it
+    worker = ThreadPoolExecutor(max_workers=1)
+    graph_future = worker.submit(load_main_graph, "tracks_features_one_million_necessary_columns.csv")
+    query = None
+    query_cancelled = None
+
     # create GUI
     figure = None
     canvas = None
     toolbar = None
+    nodes = None
+    edges = None
+    node_labels = {}
+    axis_artists = {}
+    layout = graph_visualization.SubgraphLayout()
 
     root = tk.Tk()
     root.title("Music Recommendations")
@@ -131,7 +308,8 @@ if __name__ == '__main__':
     input_frame.pack(fill=tk.X)
 
     tk.Label(input_frame, text="Enter Song Name:").pack(side=tk.LEFT)
-    song_entry = tk.Entry(input_frame)
+    song_var = tk.StringVar(root)
+    song_entry = tk.Entry(input_frame, textvariable=song_var, width=40)
     song_entry.pack(side=tk.LEFT, padx=5)
 
     tk.Label(input_frame, text="Number of Recommendations:").pack(side=tk.LEFT)
@@ -140,6 +318,15 @@ if __name__ == '__main__':
     limit_dropdown = ttk.Combobox(input_frame, textvariable=limit_var, values=["5", "10", "20"])
     limit_dropdown.pack(side=tk.LEFT, padx=5)
 
+    suggestion_frame = tk.Frame(root)
+    suggestion_frame.pack(fill=tk.X)
+    suggestion_listbox = tk.Listbox(suggestion_frame, width=50, height=SUGGESTIONS)
+    suggestion_listbox.pack(padx=10, fill=tk.X)
+    suggested_names = []
+    song_var.trace_add('write', update_suggestions)
+    suggestion_listbox.bind('<<ListboxSelect>>', choose_suggestion)
+    suggestion_listbox.bind('<Double-Button-1>', lambda _: submission_of_user())
+
     listbox_frame = tk.Frame(root)
     listbox_frame.pack(fill=tk.BOTH, expand=True)
     song_listbox = tk.Listbox(listbox_frame, width=50, height=10)
@@ -147,5 +334,16 @@ if __name__ == '__main__':
 
     submit_button = tk.Button(input_frame, text="Submit", command=submission_of_user)
     submit_button.pack(side=tk.LEFT, padx=5)
+    song_entry.bind('<Return>', lambda _: submission_of_user())
+
+    status_frame = tk.Frame(root)
+    status_frame.pack(fill=tk.X)
+    status_var = tk.StringVar(root)
+    tk.Label(status_frame, textvariable=status_var).pack(side=tk.LEFT, padx=5)
+    progress_bar = ttk.Progressbar(status_frame, mode='indeterminate', length=200)
+    progress_bar.pack(side=tk.RIGHT, padx=5)
 
+    show_busy('Loading songs...')
+    root.after(POLL_MS, finish_loading)
     root.mainloop()
+    worker.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,126 @@
+"""CSC111 Winter 2024 Project 2
+    File containing the RecommendationCache class, a bounded cache of recommend_songs results.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Optional
+import doctest
+import python_ta
+
+
+class RecommendationCache:
+    """
+    A least recently used cache of recommendations, keyed by the signature of the given song: the tuple of its
+    value bins. Songs with the same signature get the same recommendations, so they share an entry.
+
+    Each entry keeps the result for the largest limit asked for so far. Since results are sorted by score, the
+    result for a smaller limit is just the start of it.
+
+    Instance Attributes:
+        - max_size:
+            The maximum number of entries kept.
+        - hits:
+            The number of get calls answered from this cache.
+        - misses:
+            The number of get calls that weren't.
+        - evictions:
+            The number of entries removed to make room for new ones.
+        - invalidations:
+            The number of times this cache was cleared because the graph changed.
+
+    Representation Invariants:
+        - self.max_size > 0
+        - len(self._entries) <= self.max_size
+    """
+    max_size: int
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    _entries: OrderedDict[Any, tuple[int, list[str]]]
+
+    def __init__(self, max_size: int = 1024) -> None:
+        """
+        Initialize an empty cache holding at most max_size entries.
+
+        Preconditions:
+            - max_size > 0
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        """
+        Return the number of entries in this cache.
+        """
+        return len(self._entries)
+
+    def get(self, signature: Any, limit: int) -> Optional[list[str]]:
+        """
+        Return the cached recommendations for a song with the given signature and limit, or None if there are
+        none for at least that limit.
+
+        >>> cache = RecommendationCache()
+        >>> cache.put((1, 2, 3), 2, ['a', 'b', 'c'])
+        >>> cache.get((1, 2, 3), 1)
+        ['a', 'b']
+        >>> cache.get((1, 2, 3), 5) is None
+        True
+        """
+        entry = self._entries.get(signature)
+        if entry is None or entry[0] < limit:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(signature)
+        self.hits += 1
+        return entry[1][:limit + 1]
+
+    def put(self, signature: Any, limit: int, result: list[str]) -> None:
+        """
+        Cache the recommendations for a song with the given signature and limit, unless recommendations for a
+        larger limit are already cached. Evict the least recently used entry if this cache is full.
+
+        >>> cache = RecommendationCache(max_size=1)
+        >>> cache.put((1, 2, 3), 2, ['a', 'b', 'c'])
+        >>> cache.put((4, 5, 6), 0, ['d'])
+        >>> cache.get((1, 2, 3), 0) is None, cache.evictions
+        (True, 1)
+        """
+        entry = self._entries.get(signature)
+        if entry is not None and entry[0] >= limit:
+            self._entries.move_to_end(signature)
+            return
+        self._entries[signature] = (limit, list(result))
+        self._entries.move_to_end(signature)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Remove every entry from this cache, because the graph it caches results for has changed.
+        """
+        if self._entries:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict[str, int]:
+        """
+        Return the size and counters of this cache.
+        """
+        return {'size': len(self._entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'invalidations': self.invalidations}
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'collections', 'Any'],  # the names (strs) of imported modules
+        'allowed-io': [],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 120
+    })
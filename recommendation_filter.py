@@ -0,0 +1,176 @@
+"""CSC111 Winter 2024 Project 2
+    File containing the RecommendationFilter class, the songs a recommendation may include and how varied they
+    must be, applied while the songs are scored rather than to a finished result.
+"""
+from __future__ import annotations
+from typing import Callable, Iterable, Mapping, Optional
+import doctest
+import math
+import numpy as np
+import python_ta
+import instrumentation
+from song_store import SongStore
+
+# The number of candidates per song in the result that a filter choosing among candidates (see
+# RecommendationFilter.chooses) starts from. If too few of them are chosen, the pool grows by this factor.
+POOL_FACTOR = 4
+
+
+class RecommendationFilter:
+    """
+    Which songs a recommendation (see Graph.recommend_songs) may include, and how varied they must be.
+
+    Songs excluded by id or title, songs outside a range, and (if exclude_seed) the given song and every other
+    song with its name are left out before the closest songs are selected, so they never take a place in the
+    result. If distinct, only the closest of the songs sharing both a name and every value bin (such as
+    re-releases of one recording) is kept. If diversity is more than 0, the songs are picked from the closest
+    candidates by maximal marginal relevance: each next song is the one minimising
+
+        (1 - diversity) * distance to the given song - diversity * distance to the nearest song picked
+
+    where distances are weighted mean differences of values, as in song_scoring.weighted_distances.
+
+    Instance Attributes:
+        - exclude_ids:
+            The ids of songs never recommended.
+        - exclude_titles:
+            The names of songs never recommended.
+        - exclude_seed:
+            Whether the given song, and every other song with its name, is left out.
+        - ranges:
+            The inclusive range (lowest, highest) each recommended song's value of a type must be in, by type.
+            Songs missing a value of such a type are left out.
+        - distinct:
+            Whether only the closest of the songs sharing a name and every value bin is recommended.
+        - diversity:
+            The weight of the distance to the songs already picked in maximal marginal relevance, or 0 to
+            recommend the closest songs.
+
+    Representation Invariants:
+        - 0 <= self.diversity < 1
+        - all(low <= high for low, high in self.ranges.values())
+    """
+    exclude_ids: frozenset[str]
+    exclude_titles: frozenset[str]
+    exclude_seed: bool
+    ranges: dict[str, tuple[float, float]]
+    distinct: bool
+    diversity: float
+
+    def __init__(self, exclude_ids: Iterable[str] = (), exclude_titles: Iterable[str] = (),
+                 exclude_seed: bool = False, ranges: Optional[Mapping[str, tuple[float, float]]] = None,
+                 distinct: bool = False, diversity: float = 0.0) -> None:
+        """
+        Initialize a new filter. A filter made with no arguments allows every song.
+        """
+        self.exclude_ids = frozenset(exclude_ids)
+        self.exclude_titles = frozenset(exclude_titles)
+        self.exclude_seed = exclude_seed
+        self.ranges = dict(ranges or {})
+        self.distinct = distinct
+        self.diversity = diversity
+
+    def chooses(self) -> bool:
+        """
+        Return whether this filter chooses among the closest allowed songs (if distinct or diverse), so that
+        more candidates than the result holds must be scored.
+        """
+        return self.distinct or self.diversity > 0
+
+    def recommend_rows(self, store: SongStore, row: int, limit: int,
+                       rank: Callable[[np.ndarray, int], np.ndarray]) -> np.ndarray:
+        """
+        Return the rows of the best limit + 1 songs this filter allows for the song in the given row of store,
+        chosen as it says, where rank(allowed, count) returns the rows of the count closest songs among the allowed
+        rows, closest first.
+
+        If this filter chooses among candidates, POOL_FACTOR times as many as the result holds are ranked, and
+        POOL_FACTOR times more each time too few of them are chosen.
+        """
+        with instrumentation.stage('recommend_songs.filter'):
+            allowed = self.allowed_rows(store, row)
+        pool = (limit + 1) * POOL_FACTOR if self.chooses() else limit + 1
+        candidates = rank(allowed, pool)
+        rows = self.choose(store, row, candidates, limit)
+        while len(rows) <= limit and len(candidates) >= pool:
+            pool *= POOL_FACTOR
+            candidates = rank(allowed, pool)
+            rows = self.choose(store, row, candidates, limit)
+        return rows
+
+    def allowed_rows(self, store: SongStore, row: int) -> np.ndarray:
+        """
+        Return a boolean array of whether each row of store may be recommended for the song in the given row.
+
+        >>> store = SongStore()
+        >>> for song_id, values in enumerate([[0.1, 0.2, 0.3], [0.1, 0.8, 0.3], [0.1, 0.7, 0.3], [0.1, 0.9, 0.3]]):
+        ...     _ = store.add_row(str(song_id), f'Song {song_id % 2}', values)
+        >>> RecommendationFilter(ranges={'energy': (0.7, 1.0)}).allowed_rows(store, 0).tolist()
+        [False, True, True, True]
+        >>> RecommendationFilter(exclude_ids={'2'}, exclude_seed=True).allowed_rows(store, 0).tolist()
+        [False, True, False, True]
+        """
+        allowed = np.ones(len(store), dtype=bool)
+        for vtype, (low, high) in self.ranges.items():
+            # Rounding away the error of scaling makes a bound on a bin's value include that bin. The highest
+            # bin is at most the resolution, so missing values (the largest bin) are never in range.
+            values = store.bins[:, store.column(vtype)]
+            allowed &= values >= max(math.ceil(round(low * store.resolution, 6)), 0)
+            allowed &= values <= min(math.floor(round(high * store.resolution, 6)), store.resolution)
+        excluded = [store.id_rows[song_id] for song_id in self.exclude_ids if song_id in store.id_rows]
+        for song_name in self.exclude_titles:
+            excluded.extend(store.rows_named(song_name))
+        if self.exclude_seed:
+            excluded.append(row)
+            excluded.extend(store.rows_named(store.names[row]))
+        allowed[excluded] = False
+        return allowed
+
+    def choose(self, store: SongStore, row: int, candidates: np.ndarray, limit: int) -> np.ndarray:
+        """
+        Return up to limit + 1 of candidates, the allowed rows closest to the given row (closest first), as this
+        filter picks them.
+
+        >>> store = SongStore()
+        >>> for song_id, values in enumerate([[0.5, 0.5, 0.5], [0.5, 0.5, 0.52], [0.5, 0.5, 0.52], [0.5, 0.4, 0.5]]):
+        ...     _ = store.add_row(str(song_id), 'Same' if song_id < 3 else 'Other', values)
+        >>> RecommendationFilter(distinct=True).choose(store, 0, np.array([0, 1, 2, 3]), 2).tolist()
+        [0, 1, 3]
+        >>> RecommendationFilter(diversity=0.7).choose(store, 0, np.array([0, 1, 2, 3]), 1).tolist()
+        [0, 3]
+        """
+        if self.distinct:
+            keys = np.column_stack((store.bins[candidates], np.unique(
+                [store.names[candidate] for candidate in candidates.tolist()], return_inverse=True)[1]))
+            firsts = np.unique(keys, axis=0, return_index=True)[1]
+            candidates = candidates[np.sort(firsts)]
+        if self.diversity <= 0 or len(candidates) <= 1:
+            return candidates[:limit + 1]
+
+        # Distances are taken over the types the given song has; the candidates have them too.
+        weights = np.array(store.weights) * (store.bins[row] != store.missing)
+        bins = store.bins[candidates].astype(np.int32)
+        scale = store.resolution * max(weights.sum(), 1e-12)
+        relevance = (np.abs(bins - store.bins[row].astype(np.int32)) @ weights) / scale
+        nearest_picked = np.full(len(candidates), np.inf)
+        available = np.ones(len(candidates), dtype=bool)
+        picked = []
+        for _ in range(min(limit + 1, len(candidates))):
+            penalty = np.where(np.isfinite(nearest_picked), nearest_picked, 0.0)
+            scores = np.where(available, (1 - self.diversity) * relevance - self.diversity * penalty, np.inf)
+            best = int(np.argmin(scores))
+            picked.append(best)
+            available[best] = False
+            nearest_picked = np.minimum(nearest_picked, (np.abs(bins - bins[best]) @ weights) / scale)
+        return candidates[picked]
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'math', 'numpy', 'instrumentation',
+                          'song_store'],  # the names (strs) of imported modules
+        'allowed-io': [],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 120
+    })
@@ -0,0 +1,404 @@
+"""CSC111 Winter 2024 Project 2
+    File containing the RecommendationService class, a local HTTP/JSON service answering recommendation queries
+    without the Tk app, and a small client for it.
+
+    The service loads the graph once and answers every request from it:
+
+        python recommendation_service.py spotify_songs.csv --port 8111
+
+    It understands these requests, with the parameters in the query string (or, for POST, a JSON object body):
+
+        GET /recommend?song=<name>&limit=<n>&method=<method>&order=<order>
+            The ids and names of the songs recommended for the song with the given name (see
+            Graph.recommend_songs). limit defaults to 10, and method and order to the service's.
+        GET /search?q=<text>&limit=<n>
+            Song names for autocompleting text (see Graph.search_song_names).
+        GET /health
+            The number of songs, requests and queries of the service.
+
+    Responses are JSON objects; errors have status 400, 404 or 500 and an 'error' key.
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+from urllib.parse import parse_qsl, urlsplit
+import argparse
+import asyncio
+import doctest
+import json
+import sys
+import python_ta
+import graph_classes
+import graph_loaders
+import song_scoring
+from bin_index import BinIndex
+
+# The largest limit a request may ask for.
+MAX_LIMIT = 100
+
+# The methods of recommend_songs a request may ask for, and those that need a compact graph.
+METHODS = ('scan', 'index', 'weighted', 'ann')
+COMPACT_METHODS = ('weighted', 'ann')
+
+# The methods that may rank songs by an order other than 'legacy' (see song_scoring.ORDERS).
+ORDERED_METHODS = ('scan', 'index')
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error'}
+
+
+class RecommendationService:
+    """
+    An asyncio HTTP/JSON front end to one graph's recommend_songs.
+
+    Requests are read and answered on the event loop, while the CPU-bound scoring runs in a pool of worker
+    threads. All the workers share the one graph, which the service only reads: its indexes are built by prepare
+    before the first request, so no query changes it. numpy releases the interpreter lock for parts of scoring a
+    compact graph, so the workers' queries partly overlap, and the event loop keeps reading requests meanwhile.
+
+    Requests may only use the 'ann' method if it is the service's default method, since building the AnnIndex
+    of a large graph takes seconds and is only done by prepare.
+
+    Identical queries (the same song, limit, method and order) that arrive while one is being scored wait for its
+    result instead of being scored again.
+
+    Instance Attributes:
+        - graph:
+            The graph the recommendations come from.
+        - method:
+            The method of recommend_songs used by requests that don't give one.
+        - order:
+            The order of recommend_songs used by requests that don't give one.
+        - requests:
+            The number of requests answered.
+        - queries:
+            The number of recommend_songs calls made.
+        - coalesced:
+            The number of /recommend requests answered by a query made for an identical request.
+
+    Representation Invariants:
+        - self.method in METHODS
+        - self.order in song_scoring.ORDERS
+        - self.queries + self.coalesced <= self.requests
+    """
+    graph: graph_classes.Graph
+    method: str
+    order: str
+    requests: int
+    queries: int
+    coalesced: int
+    _executor: ThreadPoolExecutor
+    _in_flight: dict[tuple[str, int, str, str], asyncio.Future]
+
+    def __init__(self, graph: graph_classes.Graph, workers: int = 4, method: str = 'index',
+                 order: str = 'legacy') -> None:
+        """
+        Initialize a new service for graph, scoring with the given number of worker threads.
+
+        Preconditions:
+            - workers > 0
+            - method in METHODS
+            - order in song_scoring.ORDERS
+        """
+        self.graph = graph
+        self.method = method
+        self.order = order
+        self.requests = 0
+        self.queries = 0
+        self.coalesced = 0
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='recommend')
+        self._in_flight = {}
+
+    def prepare(self) -> None:
+        """
+        Build the indexes of the graph that queries use, so that serving requests never changes the graph.
+        """
+        self.graph.get_search_index()
+        if self.graph.store is not None:
+            if BinIndex.supports(self.graph.store):
+                self.graph.get_bin_index()
+            if self.method == 'ann':
+                self.graph.get_ann_index()
+
+    async def recommend(self, song: str, limit: int, method: str, order: str = 'legacy') -> list[str]:
+        """
+        Return graph.recommend_songs(song, limit, method, order=order), scored by a worker, or by the query
+        already in flight for the same arguments.
+        """
+        key = (song, limit, method, order)
+        if key in self._in_flight:
+            self.coalesced += 1
+            return await asyncio.shield(self._in_flight[key])
+
+        self.queries += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, self.graph.recommend_songs, song, limit, method, None, order)
+        self._in_flight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    async def respond(self, http_method: str, target: str, body: bytes) -> tuple[int, dict[str, Any]]:
+        """
+        Return the status and JSON object answering the request http_method target with the given body.
+
+        >>> import graph_delta
+        >>> g = graph_classes.Graph()
+        >>> g.add_vertex(('energy', 0.5), 'value', 0.5)
+        >>> for song_id, song_name in enumerate(['Call Me Maybe', 'Call On Me']):
+        ...     _ = graph_delta.upsert_song(g, str(song_id), song_name, {'energy': 0.5})
+        >>> service = RecommendationService(g, workers=1, method='scan')
+        >>> status, answer = asyncio.run(service.respond('GET', '/recommend?song=Call+On+Me&limit=1', b''))
+        >>> status, answer['ids'], answer['names']
+        (200, ['0', '1'], ['Call Me Maybe', 'Call On Me'])
+        >>> asyncio.run(service.respond('POST', '/recommend', b'{"song": "Cal Me Maybe"}'))
+        (404, {'error': 'song not found', 'suggestions': ['Call Me Maybe']})
+        >>> asyncio.run(service.respond('GET', '/recommend?song=Call+On+Me&limit=x', b''))
+        (400, {'error': 'limit must be an integer from 0 to 100'})
+        >>> asyncio.run(service.respond('GET', '/recommend?song=Call+On+Me&method=ann', b''))
+        (400, {'error': 'method ann not available'})
+        """
+        self.requests += 1
+        url = urlsplit(target)
+        if http_method not in {'GET', 'POST'}:
+            return 405, {'error': f'method {http_method} not allowed'}
+        try:
+            parameters = dict(parse_qsl(url.query))
+            if http_method == 'POST' and body:
+                parameters.update(json.loads(body))
+        except (ValueError, TypeError):
+            return 400, {'error': 'parameters must be a query string or a JSON object'}
+
+        if url.path == '/recommend':
+            return await self._respond_recommend(parameters)
+        if url.path == '/search':
+            limit = _limit(parameters, 8)
+            if limit is None:
+                return 400, {'error': f'limit must be an integer from 0 to {MAX_LIMIT}'}
+            return 200, {'names': self.graph.search_song_names(str(parameters.get('q', '')), limit)}
+        if url.path == '/health':
+            return 200, {'songs': len(self.graph.song_ids), 'requests': self.requests, 'queries': self.queries,
+                         'coalesced': self.coalesced, 'in_flight': len(self._in_flight)}
+        return 404, {'error': f'no such path {url.path}'}
+
+    async def _respond_recommend(self, parameters: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+        """
+        Return the status and JSON object answering a /recommend request with the given parameters.
+        """
+        song = parameters.get('song')
+        limit = _limit(parameters, 10)
+        method = parameters.get('method', self.method)
+        order = parameters.get('order', self.order if method in ORDERED_METHODS else 'legacy')
+        if not isinstance(song, str):
+            return 400, {'error': 'song is required'}
+        if limit is None:
+            return 400, {'error': f'limit must be an integer from 0 to {MAX_LIMIT}'}
+        if method not in METHODS or (method in COMPACT_METHODS and self.graph.store is None) or (
+                method == 'ann' and self.method != 'ann'):
+            return 400, {'error': f'method {method} not available'}
+        if order not in song_scoring.ORDERS or (order != 'legacy' and (
+                method not in ORDERED_METHODS or self.graph.store is None)):
+            return 400, {'error': f'order {order} not available'}
+        if not self.graph.does_song_name_exist(song):
+            return 404, {'error': 'song not found', 'suggestions': self.graph.search_song_names(song, 5)}
+
+        ids = await self.recommend(song, limit, method, order)
+        return 200, {'song': song, 'limit': limit, 'method': method, 'order': order, 'ids': ids,
+                     'names': [self.graph.get_song_by_id(song_id) for song_id in ids]}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Answer the HTTP/1.1 requests sent on one connection, until the client closes it or asks to. A request
+        whose query fails is answered with status 500, and the connection stays open.
+
+        >>> import graph_delta
+        >>> g = graph_classes.Graph()
+        >>> g.add_vertex(('energy', 0.5), 'value', 0.5)
+        >>> _ = graph_delta.upsert_song(g, '1', 'Maybe', {'energy': 0.5})
+        >>> def fail(*args) -> list[str]:
+        ...     raise KeyError(args[0])
+        >>> g.recommend_songs = fail
+        >>> async def ask() -> list[tuple[int, dict]]:
+        ...     server = await RecommendationService(g, workers=1, method='scan').start(port=0)
+        ...     async with server:
+        ...         reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        ...         answers = [await fetch_json(reader, writer, target) for target in ['/recommend?song=Maybe',
+        ...                                                                           '/health']]
+        ...         writer.close()
+        ...         await writer.wait_closed()
+        ...     return answers
+        >>> for answer in asyncio.run(ask()):
+        ...     print(answer)
+        (500, {'error': "internal error: KeyError('Maybe')"})
+        (200, {'songs': 1, 'requests': 2, 'queries': 1, 'coalesced': 0, 'in_flight': 0})
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = await _read_headers(reader)
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                parts = request_line.decode('latin-1').split()
+                status, answer = await self._answer(parts, body)
+                keep_alive = headers.get('connection', '').lower() != 'close' and parts[-1] != 'HTTP/1.0'
+                writer.write(_response(status, answer, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # The server is shutting down while the connection is open; close it quietly.
+            pass
+        finally:
+            writer.close()
+
+    async def _answer(self, parts: list[str], body: bytes) -> tuple[int, dict[str, Any]]:
+        """
+        Return the status and JSON object answering the request with the given request line, split in parts, and
+        body. Any error raised while answering it is answered with status 500.
+        """
+        if len(parts) != 3:
+            return 400, {'error': 'malformed request line'}
+        try:
+            return await self.respond(parts[0], parts[1], body)
+        except Exception as error:
+            # A bug in a query must not drop the connection without an answer.
+            return 500, {'error': f'internal error: {error!r}'}
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8111) -> asyncio.Server:
+        """
+        Start serving requests on host and port (0 for any free port) and return the server.
+
+        >>> import graph_delta
+        >>> g = graph_classes.Graph()
+        >>> g.add_vertex(('energy', 0.5), 'value', 0.5)
+        >>> _ = graph_delta.upsert_song(g, '1', 'Maybe', {'energy': 0.5})
+        >>> async def ask() -> tuple[int, dict]:
+        ...     server = await RecommendationService(g, workers=1, method='scan').start(port=0)
+        ...     async with server:
+        ...         reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        ...         answer = await fetch_json(reader, writer, '/recommend?song=Maybe&limit=0')
+        ...         writer.close()
+        ...         await writer.wait_closed()
+        ...     return answer
+        >>> asyncio.run(ask())
+        (200, {'song': 'Maybe', 'limit': 0, 'method': 'scan', 'order': 'legacy', 'ids': ['1'], 'names': ['Maybe']})
+        """
+        self.prepare()
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self) -> None:
+        """
+        Stop the worker threads, once the queries they are scoring are done.
+        """
+        self._executor.shutdown(wait=True)
+
+
+async def fetch_json(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                     target: str) -> tuple[int, dict[str, Any]]:
+    """
+    Send a GET request for target on an open connection to a RecommendationService, and return the status and
+    JSON object of the response. The connection is kept open for the next request.
+    """
+    writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = await _read_headers(reader)
+    return status, json.loads(await reader.readexactly(int(headers['content-length'])))
+
+
+async def _read_headers(reader: asyncio.StreamReader) -> dict[str, str]:
+    """
+    Read HTTP header lines from reader up to the blank line after them, and return them by lowercase name.
+    """
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            return headers
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+
+def _response(status: int, answer: dict[str, Any], keep_alive: bool) -> bytes:
+    """
+    Return the bytes of an HTTP response with the given status and JSON object.
+    """
+    body = json.dumps(answer).encode('utf-8')
+    return (f'HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\nConnection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+            ).encode('latin-1') + body
+
+
+def _limit(parameters: dict[str, Any], default: int) -> Optional[int]:
+    """
+    Return the limit parameter of a request, or default if it has none, or None if it is not a valid limit.
+
+    >>> _limit({'limit': '20'}, 10), _limit({}, 10), _limit({'limit': -1}, 10), _limit({'limit': True}, 10)
+    (20, 10, None, None)
+    """
+    limit = parameters.get('limit', default)
+    if isinstance(limit, bool):
+        return None
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return None
+    return limit if 0 <= limit <= MAX_LIMIT else None
+
+
+async def serve(service: RecommendationService, host: str, port: int) -> None:
+    """
+    Serve requests with service on host and port until cancelled.
+    """
+    server = await service.start(host, port)
+    print(f'Serving {len(service.graph.song_ids)} songs on http://{host}:{server.sockets[0].getsockname()[1]}')
+    async with server:
+        await server.serve_forever()
+
+
+def main(arguments: Optional[list[str]] = None) -> int:
+    """
+    Load the graph named on the command line and serve it until interrupted.
+    """
+    parser = argparse.ArgumentParser(description='Serve song recommendations over HTTP.')
+    parser.add_argument('information_file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8111)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--method', choices=METHODS, default='index')
+    parser.add_argument('--order', choices=song_scoring.ORDERS, default='refined',
+                        help="how 'scan' and 'index' rank songs (see Graph.recommend_songs)")
+    parser.add_argument('--no-snapshot', action='store_true',
+                        help='build the graph from the CSV file, even if it has a snapshot')
+    options = parser.parse_args(arguments)
+
+    graph = graph_loaders.load_graph(options.information_file, compact=True, snapshot=not options.no_snapshot,
+                                     ann=options.method == 'ann')
+    service = RecommendationService(graph, options.workers, options.method, options.order)
+    try:
+        asyncio.run(serve(service, options.host, options.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'concurrent.futures', 'urllib.parse', 'argparse', 'asyncio', 'json',
+                          'sys', 'graph_classes', 'graph_loaders', 'song_scoring',
+                          'bin_index'],  # the names (strs) of imported modules
+        'allowed-io': ['serve'],  # the names (strs) of functions that call print/open/input
+        'disable': ['W0718'],  # _answer answers any error raised by a query with status 500
+        'max-line-length': 120
+    })
+
+    sys.exit(main())
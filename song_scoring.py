@@ -0,0 +1,399 @@
+"""CSC111 Winter 2024 Project 2
+    File containing functions that score every song of a SongStore against a query song at once.
+"""
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from multiprocessing import shared_memory
+import doctest
+import numpy as np
+import python_ta
+import instrumentation
+from song_store import SongStore, missing_bin
+
+
+def bin_distances(store: SongStore, row: int, columns: list[int]) -> np.ndarray:
+    """
+    Return an array holding, for every song in store, the sum over the given columns of the absolute
+    difference between its bin and the bin of the song in the given row. Songs missing any of those
+    columns get a distance of -1.
+
+    >>> store = SongStore()
+    >>> _ = store.add_row('a', 'A', [0.10, 0.20, 0.30])
+    >>> _ = store.add_row('b', 'B', [0.12, 0.20, 0.25])
+    >>> bin_distances(store, 0, [0, 1, 2]).tolist()
+    [0, 7]
+    """
+    return _bin_distances(store.bins, row, columns)
+
+
+def _bin_distances(all_bins: np.ndarray, row: int, columns: list[int]) -> np.ndarray:
+    """
+    Return bin_distances for the store with the given feature bins.
+    """
+    bins = all_bins[:, columns]
+    distances = np.abs(bins.astype(np.int32) - bins[row].astype(np.int32)).sum(axis=1)
+    distances[(bins == missing_bin(bins)).any(axis=1)] = -1
+    return distances
+
+
+def legacy_score_table(num_types: int, resolution: int = 100) -> np.ndarray:
+    """
+    Return an array mapping a summed bin distance to the score Graph.average_similarity gives two songs
+    that are that distance apart over num_types types.
+
+    Each bin of distance counts 0.01, each type adds 0.02 for the two edges from the songs to the value vertices,
+    and the average is rounded to 2 decimals, just like in get_similarity_by_type and average_similarity.
+
+    >>> legacy_score_table(3)[:6].tolist()
+    [0.02, 0.02, 0.03, 0.03, 0.03, 0.04]
+    """
+    return np.array([round((d / resolution + 0.02 * num_types) / num_types, 2)
+                     for d in range(num_types * resolution + 1)])
+
+
+def score_ranks(num_types: int, resolution: int = 100) -> np.ndarray:
+    """
+    Return an array mapping a summed bin distance over num_types types to the rank of its score among all
+    distinct scores in legacy_score_table(num_types, resolution). Songs are ordered by rank exactly as they
+    would be by score.
+
+    >>> score_ranks(3)[:6].tolist()
+    [0, 0, 1, 1, 1, 2]
+    """
+    scores = legacy_score_table(num_types, resolution)
+    # The score table is non-decreasing in distance, so ranking by distance through it only merges equal scores.
+    return np.searchsorted(np.unique(scores), scores).astype(np.int32)
+
+
+def top_k(keys: np.ndarray, k: int) -> np.ndarray:
+    """
+    Return the indices of the k smallest keys, sorted by key and then by index, i.e. the first k indices of a
+    stable sort of keys. Only the selected keys are sorted; the rest are found with a partial selection.
+
+    >>> top_k(np.array([3, 1, 2, 1, 3, 0]), 4).tolist()
+    [5, 1, 3, 2]
+    """
+    if k <= 0:
+        return np.zeros(0, dtype=np.intp)
+    if k >= len(keys):
+        return np.argsort(keys, kind='stable')
+    kth = np.partition(keys, k - 1)[k - 1]
+    below = np.flatnonzero(keys < kth)
+    below = below[np.argsort(keys[below], kind='stable')]
+    ties = np.flatnonzero(keys == kth)[:k - len(below)]
+    return np.concatenate((below, ties))
+
+
+def recommend_rows(store: SongStore, row: int, limit: int, allowed: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Return the rows of the limit + 1 songs most similar to the song in the given row, in the same order as
+    Graph.recommend_songs: by average similarity, ties broken by the order songs were added. The song
+    itself is included (it always has the best score).
+
+    Songs missing a value the query song has are skipped, as are the rows that are False in allowed, if given
+    (see recommendation_filter.RecommendationFilter.allowed_rows).
+
+    >>> store = SongStore()
+    >>> for values in [[0.1, 0.2, 0.3], [0.1, 0.2, 0.31], [0.5, 0.5, 0.5]]:
+    ...     _ = store.add_row(str(len(store)), 'Song', values)
+    >>> recommend_rows(store, 0, 1).tolist(), recommend_rows(store, 0, 1, np.array([False, False, True])).tolist()
+    ([0, 1], [2])
+    """
+    return _recommend_rows(store.bins, store.resolution, row, limit, allowed)
+
+
+def _recommend_rows(bins: np.ndarray, resolution: int, row: int, limit: int,
+                    allowed: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Return recommend_rows for the store with the given feature bins and resolution.
+    """
+    columns = [i for i in range(bins.shape[1]) if bins[row, i] != missing_bin(bins)]
+    with instrumentation.stage('recommend_rows.score'):
+        distances = _bin_distances(bins, row, columns)
+        ranks = score_ranks(len(columns), resolution)
+        scored = distances >= 0
+        if allowed is not None:
+            scored &= allowed
+        keys = np.where(scored, ranks[distances], len(ranks))
+    with instrumentation.stage('recommend_rows.select'):
+        rows = top_k(keys, limit + 1)
+    return rows[keys[rows] < len(ranks)]
+
+
+# The orders recommend_rows_ordered can rank songs in.
+ORDERS = ('legacy', 'refined', 'exact')
+
+
+def raw_distances(store: SongStore, row: int, columns: list[int], rows: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Return an array holding, for every song in store (or just the given rows), the sum over the given columns of
+    the absolute difference between its unrounded value and that of the song in the given row, as a float64.
+    Songs missing any of those columns get a distance of infinity.
+
+    >>> store = SongStore()
+    >>> _ = store.add_row('a', 'A', [0.101, 0.20, 0.30])
+    >>> _ = store.add_row('b', 'B', [0.12, 0.20, 0.25])
+    >>> raw_distances(store, 0, [0, 1, 2]).round(6).tolist()
+    [0.0, 0.069]
+    """
+    values = store.values[:, columns] if rows is None else store.values[rows][:, columns]
+    distances = np.abs(values.astype(np.float64) - store.values[row, columns].astype(np.float64)).sum(axis=1)
+    distances[np.isnan(distances)] = np.inf
+    return distances
+
+
+def recommend_rows_ordered(store: SongStore, row: int, limit: int, allowed: Optional[np.ndarray] = None,
+                           order: str = 'legacy') -> np.ndarray:
+    """
+    Return the rows of the limit + 1 songs closest to the song in the given row, by the given order:
+        - 'legacy': by average similarity as Graph.average_similarity rounds it (see recommend_rows)
+        - 'refined': by summed bin distance, ties broken by the summed distance of the unrounded values
+        - 'exact': by the summed distance of the unrounded values
+    Any ties left are broken by the order songs were added, so the result never depends on how it was found.
+    As in recommend_rows, songs missing a value the song in the given row has and rows not allowed are skipped.
+
+    >>> store = SongStore()
+    >>> for values in [[0.50, 0.5, 0.5], [0.514, 0.5, 0.5], [0.506, 0.5, 0.5], [0.496, 0.5, 0.5]]:
+    ...     _ = store.add_row(str(len(store)), 'Song', values)
+    >>> [recommend_rows_ordered(store, 0, 2, order=order).tolist() for order in ORDERS]
+    [[0, 1, 2], [0, 3, 2], [0, 3, 2]]
+    """
+    if order == 'legacy':
+        return recommend_rows(store, row, limit, allowed)
+
+    columns = [i for i in range(store.bins.shape[1]) if store.bins[row, i] != store.missing]
+    if order == 'exact':
+        with instrumentation.stage('recommend_rows.score'):
+            distances = raw_distances(store, row, columns)
+            if allowed is not None:
+                distances = np.where(allowed, distances, np.inf)
+        with instrumentation.stage('recommend_rows.select'):
+            rows = top_k(distances, limit + 1)
+        return rows[np.isfinite(distances[rows])]
+
+    with instrumentation.stage('recommend_rows.score'):
+        distances = _bin_distances(store.bins, row, columns)
+        scored = distances >= 0
+        if allowed is not None:
+            scored &= allowed
+        keys = np.where(scored, distances, np.iinfo(np.int32).max)
+    with instrumentation.stage('recommend_rows.select'):
+        # Every song as close in bins as the limit + 1st closest may still be in the result.
+        rows = top_k(keys, limit + 1)
+        rows = rows[keys[rows] != np.iinfo(np.int32).max]
+        if len(rows) > 0:
+            rows = np.flatnonzero(keys <= keys[rows[-1]])
+        return order_rows(store, row, rows, keys[rows], columns)[:limit + 1]
+
+
+def order_rows(store: SongStore, row: int, rows: np.ndarray, keys: np.ndarray, columns: list[int]) -> np.ndarray:
+    """
+    Return rows sorted by keys, ties broken by the distance of their unrounded values (over columns) from the
+    song in the given row, and then by row.
+    """
+    return rows[np.lexsort((rows, raw_distances(store, row, columns, rows), keys))]
+
+
+def weighted_distances(store: SongStore, row: int) -> np.ndarray:
+    """
+    Return an array holding, for every song in store, the weighted mean over all features of the absolute
+    difference between its value and the value of the song in the given row, using store.weights. Songs
+    missing a value the song in the given row has get a distance of infinity.
+
+    The cost is one pass over the feature array per feature, whatever the resolution.
+
+    >>> store = SongStore(weights=[2, 1, 1])
+    >>> _ = store.add_row('a', 'A', [0.10, 0.20, 0.30])
+    >>> _ = store.add_row('b', 'B', [0.14, 0.20, 0.26])
+    >>> weighted_distances(store, 0).round(6).tolist()
+    [0.0, 0.03]
+    """
+    bins = store.bins
+    query = bins[row]
+    distances = np.zeros(len(bins))
+    missing = np.zeros(len(bins), dtype=bool)
+    total_weight = 0.0
+    for column, weight in enumerate(store.weights):
+        if query[column] == store.missing or weight == 0:
+            continue
+        values = bins[:, column]
+        distances += weight * np.abs(values.astype(np.int32) - int(query[column]))
+        missing |= values == store.missing
+        total_weight += weight
+    distances /= store.resolution * max(total_weight, 1e-12)
+    distances[missing] = np.inf
+    return distances
+
+
+def recommend_rows_weighted(store: SongStore, row: int, limit: int,
+                            allowed: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Return the rows of the limit + 1 songs closest to the song in the given row by weighted_distances, closest
+    first, ties broken by the order songs were added. Unlike recommend_rows, distances are not rounded, so
+    every feature and bin resolution counts. As in recommend_rows, only allowed rows are recommended.
+
+    >>> store = SongStore(weights=[0, 1, 1])
+    >>> _ = store.add_row('a', 'A', [0.10, 0.20, 0.30])
+    >>> _ = store.add_row('b', 'B', [0.90, 0.21, 0.30])
+    >>> _ = store.add_row('c', 'C', [0.10, 0.22, 0.30])
+    >>> recommend_rows_weighted(store, 0, 1).tolist()
+    [0, 1]
+    """
+    distances = weighted_distances(store, row)
+    if allowed is not None:
+        distances = np.where(allowed, distances, np.inf)
+    rows = top_k(distances, limit + 1)
+    return rows[np.isfinite(distances[rows])]
+
+
+def recommend_rows_batch(store: SongStore, rows: list[int], limit: int, block_size: int = 8,
+                         workers: int = 1) -> list[np.ndarray]:
+    """
+    Return [recommend_rows(store, row, limit) for row in rows], scoring block_size query songs against the whole
+    store at a time. Each block needs about 6 * block_size * len(store) bytes of memory (twice that for stores
+    with more than 32766 possible distances).
+
+    If workers is more than 1, the rows are split between that many processes, which all read the store's
+    feature bins from one block of shared memory instead of each getting a copy.
+
+    >>> store = SongStore()
+    >>> _ = store.add_row('a', 'A', [0.10, 0.20, 0.30])
+    >>> _ = store.add_row('b', 'B', [0.50, 0.50, 0.50])
+    >>> _ = store.add_row('c', 'C', [0.11, 0.20, 0.30])
+    >>> [r.tolist() for r in recommend_rows_batch(store, [0, 1], 1, block_size=1)]
+    [[0, 2], [1, 0]]
+    """
+    if workers <= 1 or len(rows) <= 1:
+        return _recommend_rows_batch(store.bins, store.resolution, rows, limit, block_size)
+
+    bins = store.bins
+    memory = shared_memory.SharedMemory(create=True, size=max(bins.nbytes, 1))
+    try:
+        np.ndarray(bins.shape, dtype=bins.dtype, buffer=memory.buf)[:] = bins
+        parts = [rows[worker::workers] for worker in range(workers)]
+        with ProcessPoolExecutor(workers, initializer=_attach_shared_bins,
+                                 initargs=(memory.name, bins.shape, bins.dtype, store.resolution)) as executor:
+            results = list(executor.map(_recommend_shared_rows, parts, [limit] * workers, [block_size] * workers))
+    finally:
+        memory.close()
+        memory.unlink()
+
+    # Part i holds rows i, i + workers, i + 2 * workers, ...; put the results back in the order of rows.
+    ordered = [np.zeros(0, dtype=np.intp)] * len(rows)
+    for i, part_results in enumerate(results):
+        ordered[i::workers] = part_results
+    return ordered
+
+
+def _recommend_rows_batch(bins: np.ndarray, resolution: int, rows: list[int], limit: int,
+                          block_size: int) -> list[np.ndarray]:
+    """
+    Return recommend_rows_batch for the store with the given feature bins and resolution, in this process.
+    """
+    ranks = score_ranks(bins.shape[1], resolution)
+    # widest[d] is the largest distance whose score has the same rank as distance d.
+    widest = (np.searchsorted(ranks, np.arange(ranks[-1] + 1), side='right') - 1)[ranks]
+    complete = ~(bins == missing_bin(bins)).any(axis=1)
+    columns = bins.T.astype(np.int16 if len(ranks) < np.iinfo(np.int16).max else np.int32)
+    results = []
+    for start in range(0, len(rows), block_size):
+        block = np.asarray(rows[start:start + block_size], dtype=np.intp)
+        distances, kth_distances = _block_distances(columns, block, complete, limit)
+        # Any song tied in score with the limit + 1st closest song may still be in the result, so keep every
+        # song up to the farthest distance with that score.
+        cutoffs = widest[np.minimum(kth_distances, len(ranks) - 1)]
+        results.extend(_closest_rows(distances[i], cutoffs[i], ranks, limit) if complete[row]
+                       else _recommend_rows(bins, resolution, int(row), limit) for i, row in enumerate(block))
+    return results
+
+
+def _block_distances(columns: np.ndarray, block: np.ndarray, complete: np.ndarray,
+                     limit: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the summed bin distances from each song in block to every song, given the feature bins of every
+    song one column at a time, and the limit + 1st smallest distance from each song in block. Songs that aren't
+    complete get the largest distance of the dtype of columns.
+    """
+    distances = np.zeros((len(block), columns.shape[1]), dtype=columns.dtype)
+    difference = np.empty_like(distances)
+    for column in columns:
+        np.subtract(column, column[block][:, np.newaxis], out=difference)
+        distances += np.abs(difference, out=difference)
+    distances[:, ~complete] = np.iinfo(columns.dtype).max
+    kth = min(limit, columns.shape[1] - 1)
+    if kth < 0:
+        return distances, np.zeros(len(block), dtype=columns.dtype)
+    return distances, np.partition(distances, kth, axis=1)[:, kth]
+
+
+def _closest_rows(distances: np.ndarray, cutoff: int, ranks: np.ndarray, limit: int) -> np.ndarray:
+    """
+    Return the rows of the limit + 1 songs with the best ranked of the given summed bin distances, ties broken
+    by row, given that none of them is farther than cutoff.
+    """
+    candidates = np.flatnonzero(distances <= cutoff)
+    order = np.argsort(ranks[distances[candidates]], kind='stable')
+    return candidates[order][:limit + 1]
+
+
+class _SharedBins:
+    """
+    The feature bins and resolution a worker process of recommend_rows_batch reads from shared memory.
+
+    Instance Attributes:
+        - memory:
+            The shared memory block holding the bins, or None if this process isn't attached to one.
+        - bins:
+            The feature bins of the store, in memory.
+        - resolution:
+            The number of bins per unit of value of the store.
+    """
+    memory: Optional[shared_memory.SharedMemory]
+    bins: np.ndarray
+    resolution: int
+
+    def __init__(self) -> None:
+        """
+        Initialize feature bins that aren't attached to any shared memory.
+        """
+        self.memory = None
+        self.bins = np.zeros((0, 0))
+        self.resolution = 0
+
+    def attach(self, name: str, shape: tuple[int, int], dtype: np.dtype, resolution: int) -> None:
+        """
+        Attach to the shared memory block with the given name, holding feature bins of the given shape and dtype.
+        """
+        self.memory = shared_memory.SharedMemory(name=name)
+        self.bins = np.ndarray(shape, dtype=dtype, buffer=self.memory.buf)
+        self.resolution = resolution
+
+
+# The feature bins shared with this process, if it is a worker process of recommend_rows_batch.
+_SHARED_BINS = _SharedBins()
+
+
+def _attach_shared_bins(name: str, shape: tuple[int, int], dtype: np.dtype, resolution: int) -> None:
+    """
+    Attach this worker process to the shared memory block holding the feature bins.
+    """
+    _SHARED_BINS.attach(name, shape, dtype, resolution)
+
+
+def _recommend_shared_rows(rows: list[int], limit: int, block_size: int) -> list[np.ndarray]:
+    """
+    Return recommend_rows_batch for the given rows of the shared feature bins.
+    """
+    return _recommend_rows_batch(_SHARED_BINS.bins, _SHARED_BINS.resolution, rows, limit, block_size)
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'concurrent.futures', 'multiprocessing', 'numpy', 'instrumentation',
+                          'song_store'],  # the names (strs) of imported modules
+        'allowed-io': [],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 120
+    })
@@ -0,0 +1,304 @@
+"""CSC111 Winter 2024 Project 2
+    File containing the SongSearchIndex class, an index of song names for prefix and typo-tolerant search.
+"""
+from __future__ import annotations
+from typing import Optional, Sequence
+import bisect
+import doctest
+import numpy as np
+import python_ta
+
+# The number of titles fuzzy scores exactly, out of those sharing the most trigrams with the query.
+FUZZY_CANDIDATES = 100
+
+# Roughly how many index entries fuzzy reads per query: it counts the query's rarest trigrams first, and stops
+# adding more once their titles add up to this many.
+FUZZY_POSTINGS = 100_000
+
+
+class SongSearchIndex:
+    """
+    An index of the distinct names (titles) of a set of songs, for the search box.
+
+    Titles are compared case-insensitively, with runs of whitespace read as one space. A sorted list of them
+    answers prefix searches by binary search. For typo-tolerant searches, each title is split into trigrams
+    (the overlapping three letter pieces of its text padded with spaces), and an inverted index maps each
+    trigram to the titles that contain it: the titles sharing the most trigrams with the query are then scored
+    by how similar their trigrams are.
+
+    Several songs can have the same title; the index keeps the ids of all of them.
+
+    Songs added or removed after the index was built are kept up to date by add_song and remove_song: titles
+    the index wasn't built with are searched one by one, which stays fast as long as there are few of them.
+
+    Instance Attributes:
+        - titles:
+            The distinct titles the index was built with.
+
+    >>> index = SongSearchIndex(['1', '2', '3', '4'], ['Yellow', 'Yesterday', 'Yellow Submarine', 'Yellow'])
+    >>> index.prefix('yel')
+    ['Yellow', 'Yellow Submarine']
+    >>> index.song_ids('Yellow')
+    ['1', '4']
+    >>> index.fuzzy('yesturday')
+    ['Yesterday']
+    >>> index.search('yelow')
+    ['Yellow']
+    """
+    titles: list[str]
+    _sorted_keys: list[str]
+    _sorted_titles: np.ndarray
+    _song_ids: list[str]
+    _song_order: np.ndarray
+    _song_starts: np.ndarray
+    _live: np.ndarray
+    _title_numbers: dict[str, int]
+    _gram_keys: np.ndarray
+    _gram_starts: np.ndarray
+    _gram_titles: np.ndarray
+    _removed: set[str]
+    _extra: dict[str, list[str]]
+
+    def __init__(self, ids: Sequence[str], names: Sequence[Optional[str]]) -> None:
+        """
+        Build the index of the songs with the given ids and names. Songs whose name is None are left out.
+
+        Preconditions:
+            - len(ids) == len(names)
+        """
+        self.titles = [title for title in dict.fromkeys(names) if title is not None]
+        numbers = {title: number for number, title in enumerate(self.titles)}
+        song_titles = np.fromiter((numbers.get(name, -1) for name in names), dtype=np.int64, count=len(names))
+        self._title_numbers = numbers
+        self._song_ids = list(ids)
+
+        present = np.flatnonzero(song_titles >= 0)
+        order = np.argsort(song_titles[present], kind='stable')
+        self._song_order = present[order].astype(np.int32)
+        counts = np.bincount(song_titles[present], minlength=len(self.titles))
+        self._song_starts = np.concatenate(([0], np.cumsum(counts)))
+        self._live = counts.astype(np.int32)
+
+        keys = [' '.join(title.casefold().split()) for title in self.titles]
+        title_order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._sorted_keys = [keys[i] for i in title_order]
+        self._sorted_titles = np.array(title_order, dtype=np.int32)
+        self._gram_keys, self._gram_starts, self._gram_titles = _build_trigram_index(keys)
+
+        self._removed = set()
+        self._extra = {}
+
+    def __len__(self) -> int:
+        """
+        Return the number of distinct titles with at least one song in this index.
+        """
+        return int(np.count_nonzero(self._live)) + len(self._new_titles())
+
+    def __contains__(self, title: object) -> bool:
+        """
+        Return whether some song in this index has exactly the given title.
+        """
+        number = self._title_numbers.get(title)
+        return self._live[number] > 0 if number is not None else title in self._extra
+
+    def song_ids(self, title: str) -> list[str]:
+        """
+        Return the ids of the songs with exactly the given title: those the index was built with, in the order
+        they were given, then those added since.
+        """
+        ids = []
+        number = self._title_numbers.get(title)
+        if number is not None:
+            ids = self._base_ids(number)
+            if self._removed:
+                ids = [song_id for song_id in ids if song_id not in self._removed]
+        return ids + self._extra.get(title, [])
+
+    def add_song(self, song_id: str, title: str) -> None:
+        """
+        Add the song with the given id and title to this index. The song must not already be in it.
+        """
+        number = self._title_numbers.get(title)
+        if song_id in self._removed and number is not None and song_id in self._base_ids(number):
+            self._removed.discard(song_id)
+        else:
+            self._extra.setdefault(title, []).append(song_id)
+        if number is not None:
+            self._live[number] += 1
+
+    def remove_song(self, song_id: str, title: str) -> None:
+        """
+        Remove the song with the given id and title from this index, if it is in it.
+        """
+        number = self._title_numbers.get(title)
+        extra = self._extra.get(title)
+        if extra is not None and song_id in extra:
+            extra.remove(song_id)
+            if not extra:
+                del self._extra[title]
+        elif number is not None and song_id not in self._removed and song_id in self._base_ids(number):
+            self._removed.add(song_id)
+        else:
+            return
+        if number is not None:
+            self._live[number] -= 1
+
+    def prefix(self, query: str, limit: int = 10) -> list[str]:
+        """
+        Return up to limit titles that start with query, in alphabetical order.
+        """
+        key = normalise(query)
+        if key == '':
+            return []
+        found = []
+        i = bisect.bisect_left(self._sorted_keys, key)
+        while i < len(self._sorted_keys) and len(found) < limit and self._sorted_keys[i].startswith(key):
+            number = self._sorted_titles[i]
+            if self._live[number] > 0:
+                found.append((self._sorted_keys[i], self.titles[number]))
+            i += 1
+        found.extend((normalise(title), title) for title in self._new_titles() if normalise(title).startswith(key))
+        return [title for _, title in sorted(found)[:limit]]
+
+    def fuzzy(self, query: str, limit: int = 10, min_similarity: float = 0.3) -> list[str]:
+        """
+        Return up to limit titles whose trigrams are most similar to those of query, most similar first, leaving
+        out titles with a similarity (shared trigrams over all trigrams of the two) below min_similarity. Queries
+        shorter than three characters match nothing, as almost every title shares a trigram with them.
+        """
+        key = normalise(query)
+        if len(key) < 3:
+            return []
+        query_grams = _trigrams(key)
+        candidates = self._fuzzy_candidates(np.unique(_hash_trigrams(_codes([key]))))
+        scored = []
+        for title in [self.titles[number] for number in candidates.tolist()] + self._new_titles():
+            grams = _trigrams(normalise(title))
+            shared = len(query_grams & grams)
+            similarity = shared / (len(query_grams) + len(grams) - shared)
+            if similarity >= min_similarity:
+                scored.append((-similarity, title))
+        return [title for _, title in sorted(scored)[:limit]]
+
+    def search(self, query: str, limit: int = 10) -> list[str]:
+        """
+        Return up to limit titles matching query for autocompletion: the titles starting with it, then the most
+        similar other titles.
+        """
+        found = self.prefix(query, limit)
+        if len(found) < limit:
+            found.extend(title for title in self.fuzzy(query, limit) if title not in found)
+        return found[:limit]
+
+    def _new_titles(self) -> list[str]:
+        """
+        Return the titles of the songs added since this index was built that it didn't have.
+        """
+        return [title for title in self._extra if title not in self._title_numbers]
+
+    def _base_ids(self, number: int) -> list[str]:
+        """
+        Return the ids of the songs this index was built with that have the title with the given number.
+        """
+        rows = self._song_order[self._song_starts[number]:self._song_starts[number + 1]]
+        return [self._song_ids[row] for row in rows.tolist()]
+
+    def _fuzzy_candidates(self, grams: np.ndarray) -> np.ndarray:
+        """
+        Return the numbers of the titles (with songs left) sharing the most of the given hashed trigrams, at most
+        FUZZY_CANDIDATES of them. Only the rarest trigrams are counted, as described at FUZZY_POSTINGS.
+        """
+        positions = np.searchsorted(self._gram_keys, grams)
+        found = positions < len(self._gram_keys)
+        found[found] = self._gram_keys[positions[found]] == grams[found]
+        positions = positions[found]
+        if len(positions) == 0:
+            return np.zeros(0, dtype=np.int64)
+        sizes = self._gram_starts[positions + 1] - self._gram_starts[positions]
+        order = np.argsort(sizes, kind='stable')
+        count = int(np.searchsorted(np.cumsum(sizes[order]), FUZZY_POSTINGS)) + 1
+        postings = np.concatenate([self._gram_titles[self._gram_starts[p]:self._gram_starts[p + 1]]
+                                   for p in positions[order[:count]].tolist()])
+        candidates, shared = np.unique(postings, return_counts=True)
+        live = self._live[candidates] > 0
+        candidates, shared = candidates[live], shared[live]
+        if len(candidates) > FUZZY_CANDIDATES:
+            candidates = candidates[np.argpartition(-shared, FUZZY_CANDIDATES)[:FUZZY_CANDIDATES]]
+        return candidates
+
+
+def normalise(title: str) -> str:
+    """
+    Return title as the index compares it: case-folded, with each run of whitespace read as one space.
+
+    >>> normalise('  Call  me\\tMAYBE ')
+    'call me maybe'
+    """
+    return ' '.join(title.casefold().split())
+
+
+def _trigrams(key: str) -> set[str]:
+    """
+    Return the trigrams of the normalised title key: the three letter pieces of it padded with two spaces in
+    front and one behind.
+
+    >>> sorted(_trigrams('abc'))
+    ['  a', ' ab', 'abc', 'bc ']
+    """
+    padded = '  ' + key + ' '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _codes(keys: list[str]) -> np.ndarray:
+    """
+    Return the code points of the normalised title keys, each padded as for _trigrams and followed by a 0.
+    """
+    padded = ''.join(f'  {key} \0' for key in keys)
+    return np.frombuffer(padded.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+
+
+def _in_title(codes: np.ndarray) -> np.ndarray:
+    """
+    Return whether each trigram of the padded code points codes (as returned by _codes) lies within one title,
+    that is, includes no 0.
+    """
+    return (codes[:-2] != 0) & (codes[1:-1] != 0) & (codes[2:] != 0)
+
+
+def _hash_trigrams(codes: np.ndarray) -> np.ndarray:
+    """
+    Return a 32-bit hash of each trigram of the padded code points codes (as returned by _codes) that lies within
+    one title. Different trigrams rarely share a hash; when they do, fuzzy just scores a few more candidates.
+    """
+    mixed = (codes[:-2] * np.uint64(0x9E3779B1) + codes[1:-1]) * np.uint64(0x85EBCA77) + codes[2:]
+    return ((mixed ^ (mixed >> np.uint64(32))) & np.uint64(0xFFFFFFFF))[_in_title(codes)]
+
+
+def _build_trigram_index(keys: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Return the inverted trigram index of the normalised titles keys: the sorted distinct trigram hashes, and
+    arrays starts and titles such that the numbers of the titles containing the i-th trigram are
+    titles[starts[i]:starts[i + 1]], in increasing order.
+    """
+    if not keys:
+        return np.zeros(0, dtype=np.uint64), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32)
+    codes = _codes(keys)
+    lengths = np.fromiter(map(len, keys), dtype=np.int64, count=len(keys)) + 4
+    owners = np.repeat(np.arange(len(keys), dtype=np.uint64), lengths)[:-2][_in_title(codes)]
+
+    # Sort each (trigram, title) pair as one integer, so pairs are grouped by trigram and duplicates are adjacent.
+    pairs = np.sort((_hash_trigrams(codes) << np.uint64(32)) | owners)
+    pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))]
+    grams = pairs >> np.uint64(32)
+    gram_keys, starts = np.unique(grams, return_index=True)
+    return gram_keys, np.append(starts, len(grams)), (pairs & np.uint64(0xFFFFFFFF)).astype(np.int32)
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'bisect', 'numpy'],  # the names (strs) of imported modules
+        'allowed-io': [],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 120
+    })
@@ -0,0 +1,663 @@
+"""CSC111 Winter 2024 Project 2
+    File containing the SongStore class, a columnar store for song ids, names and feature values.
+"""
+from __future__ import annotations
+from typing import Any, Iterator, Mapping, Optional, Sequence
+import doctest
+import numpy as np
+import python_ta
+from string_table import StringColumn, StringTable
+
+FEATURE_TYPES = ('danceability', 'energy', 'valence')
+
+
+def bin_dtype(resolution: int) -> type:
+    """
+    Return the smallest unsigned integer type that holds the bins of the given resolution and a missing bin.
+
+    >>> bin_dtype(100), bin_dtype(1000)
+    (<class 'numpy.uint8'>, <class 'numpy.uint16'>)
+    """
+    return np.uint8 if resolution < np.iinfo(np.uint8).max else np.uint16
+
+
+def missing_bin(bins: np.ndarray) -> int:
+    """
+    Return the bin index that marks a missing value in an array of bins: the largest value of its dtype.
+
+    >>> missing_bin(np.zeros(1, dtype=np.uint8))
+    255
+    """
+    return int(np.iinfo(bins.dtype).max)
+
+
+class SongStore:
+    """
+    Columnar storage for the songs of a graph. Instead of one SongVertex per song, row i of the store holds
+    the song id ids[i], its name names[i], and its feature values as bin indices in bins[i]. A bin index is
+    the feature value times resolution, so the value 0.68 is stored as the uint8 68. Resolutions of 255 and
+    up use uint16 bins.
+
+    The values themselves, unrounded, are kept in values[i] as float32s (NaN if missing), for ranking songs by
+    exact distances (see song_scoring.recommend_rows_ordered).
+
+    Instance Attributes:
+        - feature_types:
+            The names of the stored features, in column order.
+        - resolution:
+            The number of bins per unit of feature value (100 means values are rounded to 0.01).
+        - weights:
+            How much each feature counts in weighted similarity (see song_scoring.recommend_rows_weighted).
+        - missing:
+            The bin index marking a missing value.
+        - ids:
+            The song ids, in the order they were added, including removed songs.
+        - names:
+            The song names, row aligned with ids. None if a song has no name yet or was removed.
+        - id_rows:
+            A read-only mapping of the ids of the songs in this store to their row.
+        - name_rows:
+            A read-only mapping of song names to the row of the first song added with that name.
+
+    Removed songs keep their row, with every value missing, so the rows of the other songs don't change.
+
+    The ids and names are kept in a StringTable and a StringColumn (see string_table), so each distinct string is
+    stored once, utf-8 encoded in one buffer, and id_rows and name_rows are views over them rather than
+    dictionaries: a song takes about 40 bytes plus the length of its id and name, instead of about 270.
+
+    Representation Invariants:
+        - len(self.ids) == len(self.names) == len(self)
+        - len(self.id_rows) <= len(self)
+        - len(self.weights) == len(self.feature_types)
+        - all(0 <= b <= self.resolution or b == self.missing for b in self.bins.flat)
+    """
+    feature_types: tuple[str, ...]
+    resolution: int
+    weights: tuple[float, ...]
+    missing: int
+    ids: StringTable
+    names: StringColumn
+    id_rows: SongRowView
+    name_rows: NameRowView
+    _columns: dict[str, int]
+    _bins: np.ndarray
+    _values: np.ndarray
+    _size: int
+    _first_rows: np.ndarray
+    _removed: set[int]
+
+    def __init__(self, feature_types: Sequence[str] = FEATURE_TYPES, resolution: int = 100,
+                 capacity: int = 1024, weights: Optional[Sequence[float]] = None) -> None:
+        """
+        Initialize an empty store for songs with the given features, all weighted 1 unless weights are given.
+
+        Preconditions:
+            - 0 < resolution < 65535
+            - capacity > 0
+            - weights is None or len(weights) == len(feature_types)
+        """
+        self.feature_types = tuple(feature_types)
+        self.resolution = resolution
+        self.weights = tuple(weights) if weights is not None else (1.0,) * len(self.feature_types)
+        self.ids = StringTable()
+        self.names = StringColumn()
+        self.id_rows = SongRowView(self)
+        self.name_rows = NameRowView(self)
+        self._columns = {vtype: i for i, vtype in enumerate(self.feature_types)}
+        self._bins = np.full((capacity, len(self.feature_types)), np.iinfo(bin_dtype(resolution)).max,
+                             dtype=bin_dtype(resolution))
+        self.missing = missing_bin(self._bins)
+        self._values = np.full((capacity, len(self.feature_types)), np.nan, dtype=np.float32)
+        self._size = 0
+        self._first_rows = np.zeros(0, dtype=np.int32)
+        self._removed = set()
+
+    @classmethod
+    def from_arrays(cls, feature_types: Sequence[str], resolution: int, ids: StringTable, names: StringColumn,
+                    bins: np.ndarray, first_rows: Optional[np.ndarray] = None,
+                    weights: Optional[Sequence[float]] = None, removed: Sequence[int] = (),
+                    values: Optional[np.ndarray] = None) -> SongStore:
+        """
+        Return a store holding the given songs, where first_rows holds the row of the first song with each name of
+        names.table, or -1 (see first_rows; by default, the first row holding each name), and removed lists the
+        rows of removed songs (see removed_rows). The arrays are used as is, so they may be memory-mapped.
+
+        >>> store = SongStore.from_arrays(FEATURE_TYPES, 100, StringTable(['a', 'b']), StringColumn(['A', 'A']),
+        ...                               np.array([[1, 2, 3], [4, 5, 6]], dtype=np.uint8))
+        >>> store.name_to_id()['A'], store.get_value('b', 'energy')
+        ('a', 0.05)
+        """
+        store = cls(feature_types, resolution, capacity=1, weights=weights)
+        store.ids = ids
+        store.names = names
+        if first_rows is None:
+            named = np.flatnonzero(names.codes >= 0)
+            codes, firsts = np.unique(names.codes[named], return_index=True)
+            first_rows = np.full(len(names.table), -1, dtype=np.int32)
+            first_rows[codes] = named[firsts]
+        store._first_rows = np.asarray(first_rows)
+        store._removed = set(removed)
+        store._bins = bins
+        store._values = values if values is not None else store.bins_to_values(bins)
+        store._size = len(ids)
+        return store
+
+    def __len__(self) -> int:
+        """
+        Return the number of songs in this store.
+        """
+        return self._size
+
+    def __contains__(self, song_id: Any) -> bool:
+        """
+        Return whether a song with the given id is in this store.
+        """
+        return isinstance(song_id, str) and self.row_of(song_id) >= 0
+
+    def row_of(self, song_id: str) -> int:
+        """
+        Return the row of the song with the given id, or -1 if it isn't in this store.
+        """
+        row = self.ids.find(song_id)
+        return -1 if row < 0 or row in self._removed else row
+
+    @property
+    def bins(self) -> np.ndarray:
+        """
+        Return the (len(self), len(self.feature_types)) array of feature bins. This is a view, not a copy.
+        """
+        return self._bins[:self._size]
+
+    @property
+    def values(self) -> np.ndarray:
+        """
+        Return the (len(self), len(self.feature_types)) float32 array of unrounded feature values, with NaN for
+        missing values. This is a view, not a copy.
+        """
+        return self._values[:self._size]
+
+    @property
+    def first_rows(self) -> np.ndarray:
+        """
+        Return the int32 array of the row of the first song added with each name of names.table (the rows of
+        name_rows), or -1 for names no song has any more. This is a view, not a copy.
+        """
+        num_names = len(self.names.table)
+        if num_names > len(self._first_rows):
+            grown = np.full(max(num_names, 2 * len(self._first_rows)), -1, dtype=np.int32)
+            grown[:len(self._first_rows)] = self._first_rows
+            self._first_rows = grown
+        return self._first_rows[:num_names]
+
+    def first_row_named(self, song_name: str) -> int:
+        """
+        Return name_rows[song_name], or -1 if no song has song_name.
+        """
+        code = self.names.code(song_name)
+        return int(self._first_rows[code]) if 0 <= code < len(self._first_rows) else -1
+
+    def add_song(self, song_id: str, song_name: Optional[str] = None) -> int:
+        """
+        Add a song with no feature values to this store if it isn't already in it, and return its row.
+
+        As with Graph.add_song, the first name given for an id and the first id given for a name are kept.
+
+        >>> store = SongStore()
+        >>> store.add_song('1010001', 'Call Me Maybe')
+        0
+        >>> store.add_song('1010001', 'Other Name')
+        0
+        >>> store.names[0]
+        'Call Me Maybe'
+        """
+        row = self.row_of(song_id)
+        if row < 0:
+            row = self._size
+            if row == len(self._bins):
+                self._grow()
+            self.ids.append(song_id)
+            self.names.append(None)
+            self._size += 1
+        if song_name is not None:
+            if self.names[row] is None:
+                self.names[row] = song_name
+                self._add_name(song_name, row)
+            elif song_name not in self.name_rows:
+                code = self.names.code(song_name, add=True)
+                self.first_rows[code] = row
+        return row
+
+    def add_row(self, song_id: str, song_name: str, values: Sequence[float]) -> int:
+        """
+        Add a song with its feature values (one per feature type, in column order) and return its row.
+
+        If the song is already in the store, its existing values are kept.
+
+        >>> store = SongStore()
+        >>> store.add_row('1010001', 'Call Me Maybe', [0.78, 0.58, 0.66])
+        0
+        >>> store.get_value('1010001', 'energy')
+        0.58
+        """
+        is_new = song_id not in self.id_rows
+        row = self.add_song(song_id, song_name)
+        if is_new:
+            self._bins[row] = [self.value_to_bin(value) for value in values]
+            self._values[row] = values
+        return row
+
+    def add_rows(self, ids: Sequence[str], names: Sequence[str], bins: np.ndarray,
+                 values: Optional[np.ndarray] = None) -> int:
+        """
+        Add many songs at once, where bins holds the bin indices of each song (see values_to_bins) and values
+        (if given, or else the values of the bins) their unrounded values, and return the number of new songs.
+        Songs already in the store, or earlier in ids, keep their first values, exactly as if add_row was called
+        for each song in turn.
+
+        >>> store = SongStore()
+        >>> store.add_rows(['a', 'b', 'a'], ['A', 'B', 'C'], np.array([[1, 2, 3], [4, 5, 6], [7, 8, 9]]))
+        2
+        >>> store.bins.tolist(), store.name_to_id()['C']
+        ([[1, 2, 3], [4, 5, 6]], 'a')
+        """
+        while len(self._bins) < self._size + len(ids):
+            self._grow()
+        first_row = self._size
+        codes = self.names.encode(names)
+        rows = self.ids.find_all(ids)
+        if self._removed:
+            rows[np.isin(rows, list(self._removed))] = -1
+        new, added = [], {}
+        for i in np.flatnonzero(rows < 0).tolist():
+            row = added.get(ids[i])
+            if row is None:
+                row = added[ids[i]] = first_row + len(new)
+                new.append(i)
+            rows[i] = row
+        self.ids.extend([ids[i] for i in new])
+        self.names.append_codes(codes[new])
+        self._size = len(self.ids)
+
+        # Songs already in the store, or repeated in ids, keep the first name given to them.
+        for i in np.flatnonzero((codes >= 0) & (self.names.codes[rows] < 0)).tolist():
+            if self.names.codes[rows[i]] < 0:
+                self.names[rows[i]] = names[i]
+        named = np.flatnonzero(codes >= 0)
+        name_codes, firsts = np.unique(codes[named], return_index=True)
+        first_rows = self.first_rows
+        unset = first_rows[name_codes] < 0
+        first_rows[name_codes[unset]] = rows[named[firsts[unset]]]
+        self._bins[first_row:self._size] = bins[new]
+        self._values[first_row:self._size] = values[new] if values is not None else self.bins_to_values(bins[new])
+        return len(new)
+
+    def set_row(self, song_id: str, song_name: str, bins: Sequence[int],
+                values: Optional[Sequence[float]] = None) -> int:
+        """
+        Add a song with the given bin indices and unrounded values (the values of the bins, if not given), or
+        replace the name, bins and values of the song with that id, and return its row. A renamed song only
+        becomes the song of its new name if no earlier song has it.
+
+        >>> store = SongStore()
+        >>> store.add_row('a', 'A', [0.1, 0.2, 0.3])
+        0
+        >>> store.set_row('a', 'B', [40, 50, 60])
+        0
+        >>> store.get_values('a'), 'A' in store.name_rows, store.name_rows['B']
+        ({'danceability': 0.4, 'energy': 0.5, 'valence': 0.6}, False, 0)
+        """
+        row = self.id_rows.get(song_id)
+        if row is None:
+            row = self.add_song(song_id, song_name)
+        elif self.names[row] != song_name:
+            self._forget_name(self.names[row], row)
+            self.names[row] = song_name
+            self._add_name(song_name, row)
+        self._bins[row] = bins
+        self._values[row] = values if values is not None else self.bins_to_values(np.asarray(bins, self._bins.dtype))
+        return row
+
+    def remove_song(self, song_id: str) -> int:
+        """
+        Remove the song with the given id from this store and return the row it had. Its row is kept, with
+        every value missing.
+
+        Raise KeyError if the song is not in this store.
+
+        >>> store = SongStore()
+        >>> store.add_rows(['a', 'b'], ['A', 'A'], np.array([[1, 2, 3], [4, 5, 6]]))
+        2
+        >>> store.remove_song('a')
+        0
+        >>> 'a' in store, store.name_to_id()['A'], store.removed_rows()
+        (False, 'b', [0])
+        """
+        row = self.id_rows[song_id]
+        self._removed.add(row)
+        self._forget_name(self.names[row], row)
+        self.names[row] = None
+        self._bins[row] = self.missing
+        self._values[row] = np.nan
+        return row
+
+    def removed_rows(self) -> list[int]:
+        """
+        Return the rows of the songs removed from this store, in increasing order.
+        """
+        return sorted(self._removed)
+
+    def set_value(self, song_id: str, vtype: str, value: float) -> None:
+        """
+        Set the value of the given type for a song, unless it already has one.
+
+        Raise ValueError if the song or the type are not in this store.
+        """
+        if song_id not in self or vtype not in self._columns:
+            raise ValueError
+        row, column = self.id_rows[song_id], self._columns[vtype]
+        if self._bins[row, column] == self.missing:
+            self._bins[row, column] = self.value_to_bin(value)
+            self._values[row, column] = value
+
+    def column(self, vtype: str) -> int:
+        """
+        Return the column holding values of the given type.
+
+        Raise IndexError if this store doesn't hold values of that type.
+        """
+        if vtype not in self._columns:
+            raise IndexError
+        return self._columns[vtype]
+
+    def get_value(self, song_id: str, vtype: str) -> float:
+        """
+        Return the value of the given type for a song.
+
+        Raise IndexError if the song has no value of that type, like SongVertex.get_value_of_type.
+
+        >>> store = SongStore()
+        >>> store.add_row('1010001', 'Call Me Maybe', [0.78, 0.58, 0.66])
+        0
+        >>> store.get_value('1010001', 'valence')
+        0.66
+        """
+        b = int(self._bins[self.id_rows[song_id], self.column(vtype)])
+        if b == self.missing:
+            raise IndexError
+        return self.bin_to_value(b)
+
+    def get_values(self, song_id: str) -> dict[str, float]:
+        """
+        Return a dictionary mapping each type to the song's value of that type, skipping missing values.
+        """
+        row = self._bins[self.id_rows[song_id]]
+        return {vtype: self.bin_to_value(int(row[i]))
+                for i, vtype in enumerate(self.feature_types) if row[i] != self.missing}
+
+    def value_to_bin(self, value: float) -> int:
+        """
+        Return the bin index of the given value.
+
+        >>> SongStore().value_to_bin(0.29)
+        29
+        """
+        return round(value * self.resolution)
+
+    def values_to_bins(self, values: np.ndarray) -> np.ndarray:
+        """
+        Return the bin indices of an array of feature values in [0, 1], as an array of the same shape.
+
+        Each value is binned exactly like value_to_bin(round(value, 2)) for the default resolution of 100 (the
+        way load_graph rounds values), but values that aren't within a hair of halfway between two bins are
+        binned in bulk. Raise ValueError if a value is outside [0, 1].
+
+        >>> SongStore().values_to_bins(np.array([0.285, 0.125, 0.5, 1.0])).tolist()
+        [28, 12, 50, 100]
+        """
+        if values.size and not (0.0 <= values.min() and values.max() <= 1.0):
+            raise ValueError
+        scaled = values * self.resolution
+        bins = np.rint(scaled)
+        digits = len(str(self.resolution)) - 1
+        for i in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6):
+            bins.flat[i] = self.value_to_bin(round(float(values.flat[i]), digits))
+        return bins.astype(self._bins.dtype)
+
+    def bins_to_values(self, bins: np.ndarray) -> np.ndarray:
+        """
+        Return the float32 values of an array of bin indices, with NaN for missing bins.
+
+        >>> SongStore().bins_to_values(np.array([29, 255], dtype=np.uint8)).tolist()[1]
+        nan
+        """
+        values = (bins / self.resolution).astype(np.float32)
+        values[bins == self.missing] = np.nan
+        return values
+
+    def bin_to_value(self, b: int) -> float:
+        """
+        Return the value of the given bin index. This is the same float as the value of the matching ValueVertex.
+
+        >>> SongStore().bin_to_value(29)
+        0.29
+        """
+        return b / self.resolution
+
+    def name_to_id(self) -> SongNameView:
+        """
+        Return a read-only dictionary-like view mapping song names to song ids, like Graph.song_names.
+        """
+        return SongNameView(self)
+
+    def id_to_name(self) -> SongIdView:
+        """
+        Return a read-only dictionary-like view mapping song ids to song names, like Graph.song_ids.
+        """
+        return SongIdView(self)
+
+    def rows_named(self, song_name: str) -> list[int]:
+        """
+        Return the rows of every song named song_name, in increasing order.
+
+        >>> store = SongStore()
+        >>> for song_id, song_name in [('a', 'A'), ('b', 'B'), ('c', 'A')]:
+        ...     _ = store.add_row(song_id, song_name, [0.1, 0.2, 0.3])
+        >>> store.rows_named('A'), store.rows_named('C')
+        ([0, 2], [])
+        """
+        return self.names.rows_with(song_name)
+
+    def nbytes(self) -> int:
+        """
+        Return the number of bytes used by the feature arrays (bins and values) of this store.
+        """
+        return self._bins.nbytes + self._values.nbytes
+
+    def string_nbytes(self) -> int:
+        """
+        Return the number of bytes used by the arrays of the ids and names of this store and their lookups.
+
+        >>> store = SongStore()
+        >>> store.add_rows([f'{i:022}' for i in range(1000)], ['Same Name'] * 1000, np.zeros((1000, 3)))
+        1000
+        >>> store.string_nbytes() < 60 * 1000
+        True
+        """
+        return self.ids.nbytes() + self.names.nbytes() + self._first_rows.nbytes
+
+    def _add_name(self, song_name: str, row: int) -> None:
+        """
+        Update name_rows after the song in the given row got song_name: it becomes the song of that name if no
+        earlier song has it.
+        """
+        first = self.name_rows.get(song_name)
+        if first is None or row < first:
+            code = self.names.code(song_name, add=True)
+            self.first_rows[code] = row
+
+    def _forget_name(self, song_name: Optional[str], row: int) -> None:
+        """
+        Update name_rows as the song in the given row is about to stop having song_name: the name moves to the
+        first other song that has it, or is dropped.
+        """
+        if song_name is None or self.name_rows.get(song_name) != row:
+            return
+        others = [other for other in self.names.rows_with(song_name) if other != row]
+        self.first_rows[self.names.code(song_name)] = others[0] if others else -1
+
+    def _grow(self) -> None:
+        """
+        Double the capacity of the feature arrays.
+        """
+        extra = np.full((max(len(self._bins), 1), self._bins.shape[1]), self.missing, dtype=self._bins.dtype)
+        self._bins = np.concatenate((self._bins, extra))
+        self._values = np.concatenate((self._values, np.full(extra.shape, np.nan, dtype=np.float32)))
+
+
+class SongRowView(Mapping):
+    """
+    A read-only view of a SongStore mapping the ids of its songs to their rows (SongStore.id_rows).
+
+    >>> store = SongStore()
+    >>> store.add_rows(['a', 'b'], ['A', 'B'], np.zeros((2, 3)))
+    2
+    >>> store.id_rows['b'], store.id_rows.get('c'), list(store.id_rows)
+    (1, None, ['a', 'b'])
+    """
+    _store: SongStore
+
+    def __init__(self, store: SongStore) -> None:
+        """
+        Initialize a view of the given store.
+        """
+        self._store = store
+
+    def __getitem__(self, song_id: str) -> int:
+        row = self._store.row_of(song_id) if isinstance(song_id, str) else -1
+        if row < 0:
+            raise KeyError(song_id)
+        return row
+
+    def __contains__(self, song_id: Any) -> bool:
+        return song_id in self._store
+
+    def __iter__(self) -> Iterator[str]:
+        removed = set(self._store.removed_rows())
+        return (song_id for row, song_id in enumerate(self._store.ids) if row not in removed)
+
+    def __len__(self) -> int:
+        return len(self._store) - len(self._store.removed_rows())
+
+
+class NameRowView(Mapping):
+    """
+    A read-only view of a SongStore mapping song names to the row of the first song added with that name
+    (SongStore.name_rows), in the order the names were added.
+
+    >>> store = SongStore()
+    >>> store.add_rows(['a', 'b', 'c'], ['A', 'B', 'A'], np.zeros((3, 3)))
+    3
+    >>> store.name_rows['A'], 'C' in store.name_rows, list(store.name_rows)
+    (0, False, ['A', 'B'])
+    """
+    _store: SongStore
+
+    def __init__(self, store: SongStore) -> None:
+        """
+        Initialize a view of the given store.
+        """
+        self._store = store
+
+    def __getitem__(self, song_name: str) -> int:
+        row = self._store.first_row_named(song_name) if isinstance(song_name, str) else -1
+        if row < 0:
+            raise KeyError(song_name)
+        return row
+
+    def __contains__(self, song_name: Any) -> bool:
+        return self.get(song_name) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        first_rows = self._store.first_rows.tolist()
+        return (song_name for song_name, row in zip(self._store.names.table, first_rows) if row >= 0)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._store.first_rows >= 0))
+
+
+class SongNameView(Mapping):
+    """
+    A read-only view of a SongStore mapping song names to song ids.
+
+    >>> store = SongStore()
+    >>> store.add_row('1010001', 'Call Me Maybe', [0.78, 0.58, 0.66])
+    0
+    >>> store.name_to_id()['Call Me Maybe']
+    '1010001'
+    """
+    _store: SongStore
+
+    def __init__(self, store: SongStore) -> None:
+        """
+        Initialize a view of the given store.
+        """
+        self._store = store
+
+    def __getitem__(self, song_name: str) -> str:
+        return self._store.ids[self._store.name_rows[song_name]]
+
+    def __contains__(self, song_name: Any) -> bool:
+        return song_name in self._store.name_rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._store.name_rows)
+
+    def __len__(self) -> int:
+        return len(self._store.name_rows)
+
+
+class SongIdView(Mapping):
+    """
+    A read-only view of a SongStore mapping song ids to song names. Songs without a name are left out.
+
+    >>> store = SongStore()
+    >>> store.add_row('1010001', 'Call Me Maybe', [0.78, 0.58, 0.66])
+    0
+    >>> store.id_to_name()['1010001']
+    'Call Me Maybe'
+    """
+    _store: SongStore
+
+    def __init__(self, store: SongStore) -> None:
+        """
+        Initialize a view of the given store.
+        """
+        self._store = store
+
+    def __getitem__(self, song_id: str) -> str:
+        name = self._store.names[self._store.id_rows[song_id]]
+        if name is None:
+            raise KeyError(song_id)
+        return name
+
+    def __contains__(self, song_id: Any) -> bool:
+        row = self._store.id_rows.get(song_id)
+        return row is not None and self._store.names[row] is not None
+
+    def __iter__(self) -> Iterator[str]:
+        # Removed songs have no name, so they are left out too.
+        codes = self._store.names.codes.tolist()
+        return (song_id for song_id, code in zip(self._store.ids, codes) if code >= 0)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._store.names.codes >= 0))
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'Any', 'numpy', 'string_table'],  # the names (strs) of imported modules
+        'allowed-io': [],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 120
+    })
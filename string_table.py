@@ -0,0 +1,508 @@
+"""CSC111 Winter 2024 Project 2
+    File containing the StringTable and StringColumn classes, compact storage for the song ids and names of a
+    SongStore: the strings are kept utf-8 encoded in one contiguous buffer instead of as one str object each, and
+    are looked up through sorted arrays of their hashes instead of dictionaries.
+"""
+from __future__ import annotations
+from typing import Iterable, Iterator, Optional, Sequence
+import bisect
+import doctest
+import numpy as np
+import python_ta
+
+# The number of strings appended one at a time that a table keeps in a dictionary before adding them to its
+# sorted hash index, and the number of rows changed after a StringColumn's row index was built before it is
+# rebuilt (or an eighth of the rows, if more).
+MAX_UNINDEXED = 4096
+
+# The number of strings decoded at a time when iterating over a table.
+_DECODE_CHUNK = 65536
+
+
+class StringTable(Sequence):
+    """
+    An append-only sequence of strings, stored utf-8 encoded one after the other in a single byte buffer: string i
+    is buffer[offsets[i]:offsets[i + 1]].
+
+    Strings are found by a sorted array of their hashes (hash(s), so the index is rebuilt in each process) with
+    the index of each, plus a dictionary of the few strings appended since they were last merged into the array.
+    A table of n strings takes about 20 * n bytes plus their encoded length, instead of a str object and a
+    dictionary entry each.
+
+    The same string may be appended more than once; find returns its last index.
+
+    >>> table = StringTable(['Yellow', 'Yesterday'])
+    >>> table.append('Yellow')
+    2
+    >>> table[1], len(table), table.find('Yellow'), table.find('Help!')
+    ('Yesterday', 3, 2, -1)
+    >>> table.find_all(['Yesterday', 'Help!']).tolist()
+    [1, -1]
+    """
+    _buffer: np.ndarray
+    _offsets: np.ndarray
+    _size: int
+    _hashes: np.ndarray
+    _order: np.ndarray
+    _recent: dict[str, int]
+    _indexed: bool
+    _views: tuple[memoryview, memoryview, memoryview, memoryview]
+
+    def __init__(self, strings: Iterable[str] = ()) -> None:
+        """
+        Initialize a new table of the given strings, in order.
+        """
+        self._buffer = np.zeros(0, dtype=np.uint8)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._size = 0
+        self._hashes = np.zeros(0, dtype=np.int64)
+        self._order = np.zeros(0, dtype=np.int64)
+        self._recent = {}
+        self._indexed = True
+        self._update_views()
+        self.extend(strings)
+
+    @classmethod
+    def from_arrays(cls, buffer: np.ndarray, offsets: np.ndarray, index: bool = True) -> StringTable:
+        """
+        Return the table of the strings encoded in buffer at the given offsets (see buffer and offsets). The arrays
+        are used as is, so they may be memory-mapped, until a string is appended.
+
+        If index is False, the hash index is only built when a string is first looked up, so a table that is only
+        read in order (or by index) never hashes its strings.
+        """
+        table = cls()
+        # Plain arrays over memory-mapped ones index faster, and still share their pages.
+        table._buffer = np.asarray(buffer)
+        table._offsets = np.asarray(offsets)
+        table._size = len(offsets) - 1
+        table._indexed = False
+        table._update_views()
+        if index:
+            table._build_index()
+        return table
+
+    @property
+    def buffer(self) -> np.ndarray:
+        """
+        Return the uint8 array of the encoded strings, one after the other. This is a view, not a copy.
+        """
+        return self._buffer[:self._offsets[self._size]]
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """
+        Return the len(self) + 1 int64 offsets of the strings in buffer. This is a view, not a copy.
+        """
+        return self._offsets[:self._size + 1]
+
+    def __len__(self) -> int:
+        """
+        Return the number of strings in this table.
+        """
+        return self._size
+
+    def __getitem__(self, index: int) -> str:
+        """
+        Return the string at the given index.
+
+        Raise IndexError if there is no string at that index.
+        """
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        buffer, offsets = self._views[0], self._views[1]
+        return str(buffer[offsets[index]:offsets[index + 1]], 'utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Return an iterator over the strings of this table, in order.
+        """
+        for start in range(0, self._size, _DECODE_CHUNK):
+            yield from self.strings(start, min(start + _DECODE_CHUNK, self._size))
+
+    def __contains__(self, string: object) -> bool:
+        """
+        Return whether string is in this table.
+        """
+        return isinstance(string, str) and self.find(string) >= 0
+
+    def strings(self, start: int, stop: int) -> list[str]:
+        """
+        Return the strings from index start up to (not including) stop, decoded together.
+
+        >>> StringTable(['a', 'ñ', 'b']).strings(1, 3)
+        ['ñ', 'b']
+        """
+        bounds = self._offsets[start:stop + 1]
+        data = self._buffer[bounds[0]:bounds[-1]].tobytes()
+        bounds = (bounds - bounds[0]).tolist()
+        if data.isascii():
+            # Byte and character offsets agree, and slicing one decoded string is much faster than decoding each.
+            text = data.decode('ascii')
+            return [text[begin:end] for begin, end in zip(bounds, bounds[1:])]
+        return [data[begin:end].decode('utf-8') for begin, end in zip(bounds, bounds[1:])]
+
+    def take(self, indices: np.ndarray) -> StringTable:
+        """
+        Return a new table of the strings at the given indices, in that order, copied in bulk. Its hash index is
+        built when a string is first looked up (see from_arrays).
+
+        >>> list(StringTable(['a', 'bc', 'd']).take(np.array([2, 1])))
+        ['d', 'bc']
+        """
+        starts, lengths = self._offsets[indices], self._offsets[indices + 1] - self._offsets[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # Byte k of the new buffer is byte k - offsets[i] + starts[i] of this one, where string i holds byte k.
+        shifts = np.repeat(starts - offsets[:-1], lengths)
+        return StringTable.from_arrays(self._buffer[np.arange(offsets[-1]) + shifts], offsets, index=False)
+
+    def append(self, string: str) -> int:
+        """
+        Add string to the end of this table and return its index.
+        """
+        index = self._size
+        self._add_encoded([string.encode('utf-8')])
+        if not self._indexed:
+            return index
+        self._recent[string] = index
+        if len(self._recent) > MAX_UNINDEXED:
+            self._merge_recent()
+        return index
+
+    def extend(self, strings: Iterable[str]) -> None:
+        """
+        Add strings to the end of this table, in order.
+        """
+        strings = list(strings)
+        if not strings:
+            return
+        first = self._size
+        self._add_encoded([string.encode('utf-8') for string in strings])
+        if not self._indexed:
+            return
+        if len(strings) + len(self._recent) <= MAX_UNINDEXED:
+            self._recent.update(zip(strings, range(first, self._size)))
+            return
+        self._merge_recent()
+        self._merge(np.fromiter(map(hash, strings), dtype=np.int64, count=len(strings)),
+                    np.arange(first, self._size))
+
+    def find(self, string: str) -> int:
+        """
+        Return the last index of string in this table, or -1 if it isn't in it.
+        """
+        if not self._indexed:
+            self._build_index()
+        index = self._recent.get(string)
+        if index is not None:
+            return index
+        # Single items are read through memoryviews, which (unlike numpy arrays) return them as Python ints.
+        buffer, offsets, hashes, order = self._views
+        key = hash(string)
+        encoded = string.encode('utf-8')
+        position = bisect.bisect_right(hashes, key) - 1
+        # Strings with the same hash are in increasing order of index, so the last one found is the last index.
+        while position >= 0 and hashes[position] == key:
+            index = order[position]
+            if buffer[offsets[index]:offsets[index + 1]] == encoded:
+                return index
+            position -= 1
+        return -1
+
+    def find_all(self, strings: Sequence[str]) -> np.ndarray:
+        """
+        Return an int64 array of [self.find(string) for string in strings], searching the hash index for every
+        string at once.
+        """
+        if not self._indexed:
+            self._build_index()
+        found = np.full(len(strings), -1, dtype=np.int64)
+        keys = np.fromiter(map(hash, strings), dtype=np.int64, count=len(strings))
+        positions = np.searchsorted(self._hashes, keys, side='right') - 1
+        candidates = np.flatnonzero(positions >= 0)
+        candidates = candidates[self._hashes[positions[candidates]] == keys[candidates]]
+        for i in candidates.tolist():
+            found[i] = self.find(strings[i])
+        if self._recent:
+            recent = self._recent
+            for i, string in enumerate(strings):
+                index = recent.get(string)
+                if index is not None:
+                    found[i] = index
+        return found
+
+    def nbytes(self) -> int:
+        """
+        Return the number of bytes used by the arrays of this table (not counting strings not yet merged into its
+        hash index).
+        """
+        return self._buffer.nbytes + self._offsets.nbytes + self._hashes.nbytes + self._order.nbytes
+
+    def _add_encoded(self, encoded: list[bytes]) -> None:
+        """
+        Append the given utf-8 encoded strings to the buffer and offsets, growing them if needed.
+        """
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        start = int(self._offsets[self._size])
+        end = start + int(lengths.sum())
+        if end > len(self._buffer):
+            self._buffer = _grown(self._buffer, end)
+        if self._size + len(encoded) + 1 > len(self._offsets):
+            self._offsets = _grown(self._offsets, self._size + len(encoded) + 1)
+        self._buffer[start:end] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        self._offsets[self._size + 1:self._size + len(encoded) + 1] = start + np.cumsum(lengths)
+        self._size += len(encoded)
+        self._update_views()
+
+    def _build_index(self) -> None:
+        """
+        Build the sorted hash index of every string in this table.
+        """
+        hashes = np.fromiter(map(hash, self), dtype=np.int64, count=self._size)
+        self._order = np.argsort(hashes, kind='stable')
+        self._hashes = hashes[self._order]
+        self._recent = {}
+        self._indexed = True
+        self._update_views()
+
+    def _merge_recent(self) -> None:
+        """
+        Move the strings of the recent dictionary into the sorted hash index.
+        """
+        if self._recent:
+            indices = np.fromiter(self._recent.values(), dtype=np.int64, count=len(self._recent))
+            keys = np.fromiter(map(hash, self._recent), dtype=np.int64, count=len(self._recent))
+            self._recent = {}
+            order = np.argsort(indices)
+            self._merge(keys[order], indices[order])
+
+    def _merge(self, keys: np.ndarray, indices: np.ndarray) -> None:
+        """
+        Add the strings with the given hashes and (increasing) indices, all larger than any index already in the
+        hash index, to the hash index.
+        """
+        order = np.argsort(keys, kind='stable')
+        keys, indices = keys[order], indices[order]
+        # Inserting after existing equal hashes keeps strings with the same hash in increasing order of index.
+        positions = np.searchsorted(self._hashes, keys, side='right')
+        self._hashes = np.insert(self._hashes, positions, keys)
+        self._order = np.insert(self._order, positions, indices)
+        self._update_views()
+
+    def _update_views(self) -> None:
+        """
+        Point the memoryviews find reads through at the current arrays.
+        """
+        self._views = (memoryview(self._buffer), memoryview(self._offsets), memoryview(self._hashes),
+                       memoryview(self._order))
+
+
+class StringColumn(Sequence):
+    """
+    A column of optional strings with many repeats, such as song names: each distinct string is stored once, in a
+    StringTable, and each row holds the index (the code) of its string there, or -1 for None.
+
+    The rows holding each string are found by an index of the rows sorted by code, built on first use. Rows
+    changed after that are kept in a dictionary by code until there are too many of them, and the index is built
+    again.
+
+    Instance Attributes:
+        - table:
+            The distinct strings of the column, in the order they first appeared. A string stays in the table even
+            if no row holds it any more.
+
+    >>> column = StringColumn(['Yellow', None, 'Yellow'])
+    >>> column[1] = 'Help!'
+    >>> list(column), len(column.table), column.rows_with('Yellow')
+    (['Yellow', 'Help!', 'Yellow'], 2, [0, 2])
+    """
+    table: StringTable
+    _codes: np.ndarray
+    _size: int
+    _row_order: Optional[np.ndarray]
+    _code_starts: Optional[np.ndarray]
+    _changed: dict[int, list[int]]
+    _num_changed: int
+
+    def __init__(self, strings: Iterable[Optional[str]] = ()) -> None:
+        """
+        Initialize a new column with the given strings, in order.
+        """
+        self.table = StringTable()
+        self._codes = np.zeros(0, dtype=np.int32)
+        self._size = 0
+        self._row_order = None
+        self._code_starts = None
+        self._changed = {}
+        self._num_changed = 0
+        self.extend(strings)
+
+    @classmethod
+    def from_arrays(cls, table: StringTable, codes: np.ndarray) -> StringColumn:
+        """
+        Return the column whose rows hold the strings of table with the given codes. codes is used as is, so it
+        may be memory-mapped.
+        """
+        column = cls()
+        column.table = table
+        column._codes = np.asarray(codes)
+        column._size = len(codes)
+        return column
+
+    @property
+    def codes(self) -> np.ndarray:
+        """
+        Return the int32 array of the code of each row. This is a view, not a copy.
+        """
+        return self._codes[:self._size]
+
+    def __len__(self) -> int:
+        """
+        Return the number of rows in this column.
+        """
+        return self._size
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        """
+        Return the string of the given row, or None if it has none.
+        """
+        if not 0 <= row < self._size:
+            raise IndexError(row)
+        code = int(self._codes[row])
+        return self.table[code] if code >= 0 else None
+
+    def __setitem__(self, row: int, string: Optional[str]) -> None:
+        """
+        Set the string of the given row.
+        """
+        if not 0 <= row < self._size:
+            raise IndexError(row)
+        code = self.code(string, add=True)
+        self._codes[row] = code
+        self._note_change(row, code)
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        """
+        Return an iterator over the strings of the rows of this column, in order.
+        """
+        strings = list(self.table) + [None]
+        return iter([strings[code] for code in self.codes.tolist()])
+
+    def code(self, string: Optional[str], add: bool = False) -> int:
+        """
+        Return the code of string (-1 for None), adding it to the table if add is True, or else returning -1 if
+        it isn't in the table.
+        """
+        if string is None:
+            return -1
+        code = self.table.find(string)
+        if code < 0 and add:
+            code = self.table.append(string)
+        return code
+
+    def encode(self, strings: Sequence[Optional[str]]) -> np.ndarray:
+        """
+        Return the int32 array of the codes of strings (-1 for None), adding the strings not yet in the table.
+        """
+        codes = self.table.find_all(['' if item is None else item for item in strings])
+        missing = {}
+        for i in np.flatnonzero(codes < 0).tolist():
+            string = strings[i]
+            if string is not None:
+                codes[i] = missing.setdefault(string, len(self.table) + len(missing))
+        self.table.extend(missing)
+        for i, string in enumerate(strings):
+            if string is None:
+                codes[i] = -1
+        return codes.astype(np.int32)
+
+    def append(self, string: Optional[str]) -> None:
+        """
+        Add a row holding string to the end of this column.
+        """
+        self.append_codes(np.array([self.code(string, add=True)], dtype=np.int32))
+
+    def extend(self, strings: Iterable[Optional[str]]) -> None:
+        """
+        Add rows holding strings to the end of this column, in order.
+        """
+        self.append_codes(self.encode(list(strings)))
+
+    def append_codes(self, codes: np.ndarray) -> None:
+        """
+        Add rows holding the strings with the given codes to the end of this column, in order.
+        """
+        if self._size + len(codes) > len(self._codes):
+            self._codes = _grown(self._codes, self._size + len(codes))
+        self._codes[self._size:self._size + len(codes)] = codes
+        for row, code in enumerate(codes.tolist(), self._size):
+            self._note_change(row, code)
+        self._size += len(codes)
+
+    def rows_with(self, string: str) -> list[int]:
+        """
+        Return the rows holding string, in increasing order.
+        """
+        code = self.code(string)
+        if code < 0:
+            return []
+        row_order, code_starts = self._row_index()
+        indexed = []
+        if code + 1 < len(code_starts):
+            indexed = row_order[code_starts[code]:code_starts[code + 1]].tolist()
+        candidates = set(indexed + self._changed.get(code, []))
+        return sorted(row for row in candidates if self._codes[row] == code)
+
+    def nbytes(self) -> int:
+        """
+        Return the number of bytes used by the arrays of this column and its table.
+        """
+        index_bytes = 0
+        if self._row_order is not None and self._code_starts is not None:
+            index_bytes = self._row_order.nbytes + self._code_starts.nbytes
+        return self._codes.nbytes + index_bytes + self.table.nbytes()
+
+    def _note_change(self, row: int, code: int) -> None:
+        """
+        Record that the given row now holds the string with the given code, if the row index was built.
+        """
+        if self._row_order is not None and code >= 0:
+            self._changed.setdefault(code, []).append(row)
+            self._num_changed += 1
+
+    def _row_index(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the index of the rows sorted by code, and the position in it of the first row with each code. The
+        index is built again if it wasn't built yet or too many rows changed since.
+        """
+        row_order, code_starts = self._row_order, self._code_starts
+        if row_order is None or code_starts is None or self._num_changed > max(MAX_UNINDEXED, self._size // 8):
+            codes = self.codes
+            row_order = np.argsort(codes, kind='stable').astype(np.int32)
+            code_starts = np.asarray(np.searchsorted(codes[row_order], np.arange(len(self.table) + 1)))
+            self._row_order, self._code_starts = row_order, code_starts
+            self._changed = {}
+            self._num_changed = 0
+        return row_order, code_starts
+
+
+def _grown(array: np.ndarray, size: int) -> np.ndarray:
+    """
+    Return a copy of the one-dimensional array, with room for at least size items: at least twice as many as it has.
+    """
+    grown = np.zeros(max(size, 2 * len(array), 16), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'bisect', 'numpy'],  # the names (strs) of imported modules
+        'allowed-io': [],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 120
+    })
@@ -0,0 +1,164 @@
+"""CSC111 Winter 2024 Project 2
+    File containing the ValueBinTable class, an array-backed lookup of the value vertices of a graph by bin.
+"""
+from __future__ import annotations
+from typing import Any, Optional
+import doctest
+import numpy as np
+import python_ta
+
+
+class ValueBinTable:
+    """
+    The value vertices of a graph, by type and bin, and which consecutive bins of each type are joined by an
+    edge. A bin is a value times resolution, so with the default resolution of 100 the value 0.63 is bin 63.
+
+    With this table, the value vertices exactly d bins away from a vertex along its chain of value edges, and
+    whether two bins of a type are joined by a chain, are found in constant time instead of by walking the
+    chain.
+
+    A graph whose value edges don't all join consecutive bins of one type, or whose values are not all on a
+    bin, is irregular: the table can't describe its chains, and Graph falls back to walking them (see
+    walk_value_chain).
+
+    Instance Attributes:
+        - resolution:
+            The number of bins per unit of value.
+        - irregular:
+            Whether a value vertex or value edge was added that this table can't describe.
+    """
+    resolution: int
+    irregular: bool
+    _vertices: dict[str, list[Optional[Any]]]
+    _linked: dict[str, np.ndarray]
+    _gaps: dict[str, np.ndarray]
+
+    def __init__(self, resolution: int = 100) -> None:
+        """
+        Initialize an empty table for values with the given resolution.
+        """
+        self.resolution = resolution
+        self.irregular = False
+        self._vertices = {}
+        self._linked = {}
+        self._gaps = {}
+
+    def value_to_bin(self, value: float) -> Optional[int]:
+        """
+        Return the bin of value, or None if value is not on a bin.
+
+        >>> table = ValueBinTable()
+        >>> table.value_to_bin(0.63), table.value_to_bin(0.635)
+        (63, None)
+        """
+        b = round(value * self.resolution)
+        return b if 0 <= b <= self.resolution and self.bin_to_value(b) == value else None
+
+    def bin_to_value(self, b: int) -> float:
+        """
+        Return the value of bin b. This is the same float as the value of the matching ValueVertex.
+
+        >>> ValueBinTable().bin_to_value(63)
+        0.63
+        """
+        return b / self.resolution
+
+    def add_vertex(self, vertex: Any) -> None:
+        """
+        Record the given new value vertex of the graph.
+        """
+        b = self.value_to_bin(vertex.value)
+        if b is None:
+            self.irregular = True
+            return
+        if vertex.item not in self._vertices:
+            self._vertices[vertex.item] = [None] * (self.resolution + 1)
+            self._linked[vertex.item] = np.zeros(self.resolution, dtype=bool)
+        self._vertices[vertex.item][b] = vertex
+
+    def add_edge(self, vertex1: Any, vertex2: Any) -> None:
+        """
+        Record an edge of the graph between the given value vertices.
+        """
+        b1, b2 = self.value_to_bin(vertex1.value), self.value_to_bin(vertex2.value)
+        if vertex1.item != vertex2.item or b1 is None or b2 is None or abs(b1 - b2) != 1:
+            self.irregular = True
+            return
+        self._linked[vertex1.item][min(b1, b2)] = True
+        self._gaps.pop(vertex1.item, None)
+
+    def vertex(self, vtype: str, b: int) -> Optional[Any]:
+        """
+        Return the value vertex of the given type in bin b, or None if there is none.
+        """
+        if vtype not in self._vertices or not 0 <= b <= self.resolution:
+            return None
+        return self._vertices[vtype][b]
+
+    def bins_at_distance(self, b: int, distance: int) -> list[int]:
+        """
+        Return the bins exactly distance away from bin b.
+
+        >>> ValueBinTable().bins_at_distance(95, 10)
+        [85]
+        """
+        return [c for c in {b - distance, b + distance} if 0 <= c <= self.resolution]
+
+    def connected(self, vtype: str, b1: int, b2: int) -> bool:
+        """
+        Return whether every pair of consecutive bins from b1 to b2 of the given type is joined by an edge.
+
+        >>> table = ValueBinTable()
+        >>> table.connected('energy', 3, 3), table.connected('energy', 3, 4)
+        (True, False)
+        """
+        low, high = min(b1, b2), max(b1, b2)
+        if low == high:
+            return True
+        if vtype not in self._linked:
+            return False
+        if vtype not in self._gaps:
+            # gaps[i] is the number of missing edges between bins below i.
+            self._gaps[vtype] = np.concatenate(([0], np.cumsum(~self._linked[vtype])))
+        gaps = self._gaps[vtype]
+        return bool(gaps[high] == gaps[low])
+
+    def missing_links(self, vtype: str, b1: int, b2: int) -> list[int]:
+        """
+        Return every bin b from min(b1, b2) up to (not including) max(b1, b2) that isn't joined by an edge to
+        bin b + 1 of the given type.
+
+        >>> table = ValueBinTable()
+        >>> table.missing_links('energy', 5, 2)
+        [2, 3, 4]
+        """
+        low, high = min(b1, b2), max(b1, b2)
+        if vtype not in self._linked:
+            return list(range(low, high))
+        return (np.flatnonzero(~self._linked[vtype][low:high]) + low).tolist()
+
+
+def walk_value_chain(vertex: Any, distance: int) -> Any:
+    """
+    Return the value vertices exactly distance away from vertex along its chain of value edges, found by walking
+    the chain, for graphs a ValueBinTable can't describe. This takes time exponential in distance.
+    """
+    if distance == 0:
+        return [vertex]
+    else:
+        # It's a list for the sake of list.extend, better for this than set.union
+        vertices = []
+        for neighbour in vertex.get_value_neighbours():
+            vertices.extend(walk_value_chain(neighbour, distance - 1))
+
+        return {v for v in vertices if round(abs(v.value - vertex.value), 2) == distance / 100}
+
+
+if __name__ == '__main__':
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'extra-imports': ['annotations', 'Any', 'numpy'],  # the names (strs) of imported modules
+        'allowed-io': [],  # the names (strs) of functions that call print/open/input
+        'max-line-length': 120
+    })